@@ -0,0 +1,290 @@
+"""
+Запись истории активности
+record_activity() ставит событие в очередь процесса и сразу возвращает управление. Фоновый
+поток записывает очередь одним bulk_create, когда в ней MAX_BATCH событий или прошло
+FLUSH_INTERVAL секунд с первого незаписанного; при остановке процесса очередь дописывается
+(atexit). created_at выставляется при записи, то есть может отставать на FLUSH_INTERVAL.
+Если БД временно недоступна (OperationalError, например "database is locked"), пачка
+возвращается в очередь и запись повторяется с растущей паузой (до MAX_RETRY_DELAY секунд).
+bulk_create не вызывает сигналы, поэтому после записи рекомендации пользователей
+сбрасываются явно (invalidate_recommendations).
+События учитываются в сводке ActivitySummary (rollup_activity) в той же транзакции - ее читают
+рекомендации, поэтому сырую историю можно переносить в архив (команда archive_activity).
+Настройки - ACTIVITY_WRITER; ASYNC = False - синхронная запись в запросе (тесты).
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, transaction
+from django.db.models import Case, Count, DateTimeField, F, IntegerField, Max, Value, When
+
+from .models import ActivityHistory, ActivityHistoryArchive, ActivitySummary
+
+logger = logging.getLogger(__name__)
+
+# Тип события -> счетчик сводки (регистрации на события в сводку по НКО не входят)
+SUMMARY_FIELDS = {
+    'view': 'views_count',
+    'favorite': 'favorites_count',
+    'review': 'reviews_count',
+}
+
+# Ограничение числа id в одном UPDATE (лимит параметров SQLite)
+UPDATE_BATCH_SIZE = 500
+
+
+def _settings():
+    return getattr(settings, 'ACTIVITY_WRITER', {})
+
+
+class ActivityWriter:
+    """Очередь несохраненных ActivityHistory и поток, записывающий ее пачками"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = []
+        self.first_queued_at = None
+        self.thread = None
+        self.stopping = False
+        self.retries = 0
+        self.retry_at = None
+        self.written = 0
+        self.failed = 0
+        self._atexit_registered = False
+
+    def record(self, entry):
+        options = _settings()
+        if not options.get('ASYNC', True):
+            self._write([entry])
+            return
+        with self.condition:
+            if not self.queue:
+                self.first_queued_at = time.monotonic()
+            self.queue.append(entry)
+            if self.thread is None or not self.thread.is_alive():
+                self._start()
+            if len(self.queue) >= options.get('MAX_BATCH', 500):
+                self.condition.notify()
+
+    def flush(self):
+        """Синхронная запись очереди в текущем потоке; возвращает число записанных событий"""
+        with self.condition:
+            batch, self.queue = self.queue, []
+        return self._write(batch)
+
+    def shutdown(self, timeout=10):
+        """Остановка потока с записью оставшейся очереди"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
+
+    def _start(self):
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+        self.thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def _due(self):
+        options = _settings()
+        if self.stopping:
+            return True
+        if self.retry_at is not None and time.monotonic() < self.retry_at:
+            return False
+        return len(self.queue) >= options.get('MAX_BATCH', 500) or (
+            self.queue and time.monotonic() - self.first_queued_at >= options.get('FLUSH_INTERVAL', 2)
+        )
+
+    def _wait_timeout(self):
+        if self.retry_at is not None:
+            return max(self.retry_at - time.monotonic(), 0.01)
+        if self.queue:
+            return max(_settings().get('FLUSH_INTERVAL', 2) - (time.monotonic() - self.first_queued_at), 0.01)
+        return None
+
+    def _requeue(self, batch):
+        """Возврат пачки в начало очереди; следующая попытка - через удваивающуюся паузу"""
+        options = _settings()
+        for entry in batch:
+            # bulk_create мог выставить id до отката транзакции
+            entry.pk = None
+            entry._state.adding = True
+        with self.condition:
+            self.queue = batch + self.queue
+            self.first_queued_at = time.monotonic()
+            delay = min(
+                options.get('FLUSH_INTERVAL', 2) * 2 ** self.retries,
+                options.get('MAX_RETRY_DELAY', 60)
+            )
+            self.retries += 1
+            self.retry_at = time.monotonic() + delay
+        return delay
+
+    def _run(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self._due():
+                        self.condition.wait(self._wait_timeout())
+                    batch, self.queue = self.queue, []
+                    stopping = self.stopping
+                # При остановке повторов нет: очередь дописывается один раз (см. shutdown)
+                self._write(batch, requeue=not stopping)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _write(self, batch, requeue=False):
+        if not batch:
+            return 0
+        close_old_connections()
+        try:
+            # События и их учет в сводке - одна транзакция: сводка не расходится с историей
+            with transaction.atomic():
+                ActivityHistory.objects.bulk_create(batch, batch_size=500)
+                rollup_activity(batch)
+            written = batch
+        except IntegrityError:
+            # Например, НКО удалена до записи: пишем по одному, пропуская ошибочные
+            written = []
+            for entry in batch:
+                try:
+                    with transaction.atomic():
+                        ActivityHistory.objects.bulk_create([entry])
+                        rollup_activity([entry])
+                    written.append(entry)
+                except IntegrityError:
+                    logger.exception('Не удалось записать событие истории активности')
+        except OperationalError:
+            # БД временно недоступна (блокировка, разрыв соединения): пачка целиком пишется позже
+            if requeue:
+                delay = self._requeue(batch)
+                logger.warning(
+                    'Не удалось записать историю активности (%d событий), повтор через %.1f с',
+                    len(batch), delay, exc_info=True
+                )
+                return 0
+            logger.exception('Не удалось записать историю активности, потеряно событий: %d', len(batch))
+            self.failed += len(batch)
+            return 0
+        with self.condition:
+            self.retries = 0
+            self.retry_at = None
+        self.written += len(written)
+        self.failed += len(batch) - len(written)
+
+        from .signals import invalidate_recommendations
+        for user_id in {entry.user_id for entry in written}:
+            invalidate_recommendations(user_id)
+        return len(written)
+
+
+activity_writer = ActivityWriter()
+
+
+def record_activity(user, activity_type, ngo=None, event=None, metadata=None):
+    """Запись события в историю активности (асинхронно, см. ActivityWriter)"""
+    activity_writer.record(ActivityHistory(
+        user=user,
+        activity_type=activity_type,
+        ngo=ngo,
+        event=event,
+        metadata=metadata or {},
+    ))
+
+
+def rollup_activity(entries):
+    """
+    Учет записанных событий в сводке ActivitySummary
+
+    Недостающие строки (пользователь, НКО) создаются, счетчики увеличиваются запросами
+    UPDATE ... SET views_count = views_count + n, сгруппированными по приращениям;
+    last_activity_at - время последнего события каждой пары (CASE по id строк).
+    """
+    deltas = defaultdict(Counter)
+    latest = {}
+    for entry in entries:
+        field = SUMMARY_FIELDS.get(entry.activity_type)
+        if field is None or entry.ngo_id is None:
+            continue
+        key = (entry.user_id, entry.ngo_id)
+        deltas[key][field] += 1
+        latest[key] = max(latest[key], entry.created_at) if key in latest else entry.created_at
+    if not deltas:
+        return 0
+
+    with transaction.atomic():
+        ActivitySummary.objects.bulk_create(
+            [
+                ActivitySummary(user_id=user_id, ngo_id=ngo_id, last_activity_at=latest[(user_id, ngo_id)])
+                for user_id, ngo_id in deltas
+            ],
+            ignore_conflicts=True
+        )
+        ids = {
+            (user_id, ngo_id): pk
+            for pk, user_id, ngo_id in ActivitySummary.objects.filter(
+                user_id__in={user_id for user_id, _ in deltas},
+                ngo_id__in={ngo_id for _, ngo_id in deltas},
+            ).values_list('id', 'user_id', 'ngo_id')
+        }
+        groups = defaultdict(list)
+        for key, counts in deltas.items():
+            groups[tuple(sorted(counts.items()))].append(key)
+        # В CASE по два параметра на строку, поэтому пачки вдвое меньше
+        chunk_size = UPDATE_BATCH_SIZE // 2
+        for counts, keys in groups.items():
+            changes = {field: F(field) + amount for field, amount in counts}
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                ActivitySummary.objects.filter(pk__in=[ids[key] for key in chunk]).update(
+                    last_activity_at=Case(
+                        *[When(pk=ids[key], then=Value(latest[key])) for key in chunk],
+                        output_field=DateTimeField(),
+                    ),
+                    **changes
+                )
+    return len(deltas)
+
+
+def summary_rows(model):
+    """Агрегаты (пользователь, НКО) по таблице событий model: ActivityHistory или архива"""
+    counters = {
+        field: Count(Case(When(activity_type=activity_type, then=1), output_field=IntegerField()))
+        for activity_type, field in SUMMARY_FIELDS.items()
+    }
+    return (
+        model.objects.filter(ngo__isnull=False, activity_type__in=SUMMARY_FIELDS)
+        .values('user_id', 'ngo_id')
+        .annotate(last_activity_at=Max('created_at'), **counters)
+        .order_by()
+    )
+
+
+def rebuild_activity_summary():
+    """Пересчет сводки по истории и архиву; возвращает число строк сводки"""
+    summary = {}
+    for model in (ActivityHistoryArchive, ActivityHistory):
+        for row in summary_rows(model):
+            key = (row['user_id'], row['ngo_id'])
+            current = summary.get(key)
+            if current is None:
+                summary[key] = row
+                continue
+            for field in SUMMARY_FIELDS.values():
+                current[field] += row[field]
+            current['last_activity_at'] = max(current['last_activity_at'], row['last_activity_at'])
+
+    with transaction.atomic():
+        ActivitySummary.objects.all().delete()
+        ActivitySummary.objects.bulk_create([ActivitySummary(**row) for row in summary.values()], batch_size=500)
+    return len(summary)
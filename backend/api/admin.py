@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
-    User, Category, NGO, Favorite, Event, EventRegistration,
-    Review, ActivityHistory, ModerationRequest, ContactMessage,
-    Tag, Material, UserLibrary, News
+    User, Category, City, CityAlias, NGO, Favorite, Event, EventRegistration,
+    Review, ActivityHistory, ActivityHistoryArchive, ActivitySummary, ModerationRequest, ContactMessage,
+    Tag, Material, UserLibrary, News, PrecomputedRecommendation, PlatformStatistics,
+    CategoryStatistics,
 )
 
 
@@ -22,13 +23,27 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+class CityAliasInline(admin.TabularInline):
+    model = CityAlias
+    extra = 1
+    fields = ['name', 'key']
+    readonly_fields = ['key']
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name', 'aliases__name']
+    inlines = [CityAliasInline]
+
+
 @admin.register(NGO)
 class NGOAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'city', 'status', 'rating', 'created_at']
     list_filter = ['status', 'category', 'city', 'created_at']
     search_fields = ['name', 'description', 'city']
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['rating_sum', 'rating_count', 'created_at', 'updated_at']
 
 
 @admin.register(Favorite)
@@ -62,6 +77,18 @@ class ActivityHistoryAdmin(admin.ModelAdmin):
     list_filter = ['activity_type', 'created_at']
 
 
+@admin.register(ActivityHistoryArchive)
+class ActivityHistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ['user', 'activity_type', 'ngo', 'created_at']
+    list_filter = ['activity_type', 'month']
+
+
+@admin.register(ActivitySummary)
+class ActivitySummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'ngo', 'views_count', 'favorites_count', 'reviews_count', 'last_activity_at']
+    readonly_fields = ['views_count', 'favorites_count', 'reviews_count', 'last_activity_at']
+
+
 @admin.register(ModerationRequest)
 class ModerationRequestAdmin(admin.ModelAdmin):
     list_display = ['ngo', 'status', 'moderator', 'created_at']
@@ -105,3 +132,22 @@ class NewsAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at', 'published_at', 'views_count']
     prepopulated_fields = {}
 
+
+@admin.register(PrecomputedRecommendation)
+class PrecomputedRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'rec_type', 'computed_at']
+    list_filter = ['rec_type', 'computed_at']
+    search_fields = ['user__username']
+    readonly_fields = ['computed_at']
+
+
+@admin.register(PlatformStatistics)
+class PlatformStatisticsAdmin(admin.ModelAdmin):
+    list_display = ['total_ngos', 'total_events', 'total_users', 'total_registrations', 'reconciled_at']
+    readonly_fields = ['reconciled_at']
+
+
+@admin.register(CategoryStatistics)
+class CategoryStatisticsAdmin(admin.ModelAdmin):
+    list_display = ['category', 'approved_ngos']
+    readonly_fields = ['category', 'approved_ngos']
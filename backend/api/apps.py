@@ -6,3 +6,14 @@ class ApiConfig(AppConfig):
     name = 'api'
     verbose_name = 'API'
 
+    def ready(self):
+        from django.conf import settings
+        from django.core import checks
+        from . import signals  # noqa: F401
+        from .metrics import instrument_serializers
+        from .response_cache import check_response_cache
+
+        checks.register(check_response_cache)
+
+        if getattr(settings, 'METRICS', {}).get('ENABLED', True):
+            instrument_serializers()
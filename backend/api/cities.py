@@ -0,0 +1,103 @@
+"""
+Справочник городов
+Поле city у НКО, новостей и пользователей хранит каноническое название (City.name), поэтому
+фильтры по городу - точное равенство по индексу. Варианты написания ("Глазов, УР", "г. Глазов",
+"глазов") сопоставляются с городом через CityAlias по ключу city_key: сначала полное написание,
+затем без региона и префикса (clean_city).
+"""
+from .models import City, CityAlias
+from .text import city_key, clean_city
+
+# Значение city у НКО без города (load_csv_data), в справочник не попадает
+NO_CITY = 'Не указан'
+
+
+def lookup_keys(value):
+    """Ключи для поиска: полное написание и написание без региона"""
+    keys = []
+    for key in (city_key(value), city_key(clean_city(value))):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def resolve(value):
+    """Каноническое название города или None, если вариант написания неизвестен"""
+    keys = lookup_keys(value)
+    if not keys:
+        return None
+    names = dict(CityAlias.objects.filter(key__in=keys).values_list('key', 'city__name'))
+    return next((names[key] for key in keys if key in names), None)
+
+
+def canonical_city(value, create=False):
+    """
+    Каноническое название города
+
+    Неизвестный город возвращается без региона и префикса; с create=True он добавляется
+    в справочник вместе с исходным написанием.
+    """
+    value = (value or '').strip()
+    if not value or value == NO_CITY:
+        return value
+    name = resolve(value)
+    if name is None:
+        name = clean_city(value)
+        if create and name:
+            add_city(name, [value])
+    return name
+
+
+def add_city(name, variants=()):
+    """Город и варианты его написания (существующие ключи не меняются)"""
+    city, _ = City.objects.get_or_create(name=name)
+    aliases = {}
+    for variant in [name, *variants]:
+        aliases.setdefault(city_key(variant), variant)
+    CityAlias.objects.bulk_create(
+        [CityAlias(city=city, name=variant, key=key) for key, variant in aliases.items() if key],
+        ignore_conflicts=True
+    )
+    return city
+
+
+class CityRegistry:
+    """
+    Справочник в памяти для массовой загрузки
+
+    canonical() не обращается к БД, новые города копятся и записываются flush() пачкой.
+    """
+
+    def __init__(self):
+        self.names = dict(CityAlias.objects.values_list('key', 'city__name'))
+        self.pending = {}
+
+    def canonical(self, value):
+        value = (value or '').strip()
+        if not value or value == NO_CITY:
+            return value
+        keys = lookup_keys(value)
+        name = next((self.names[key] for key in keys if key in self.names), None)
+        if name is None:
+            name = clean_city(value)
+            for key in keys:
+                self.names[key] = name
+                # Ключ полного написания - исходное значение, ключ без региона - само название
+                self.pending[key] = (name, value if key == city_key(value) else name)
+        return name
+
+    def flush(self):
+        """Запись новых городов и вариантов написания"""
+        if not self.pending:
+            return
+        names = {name for name, _ in self.pending.values()}
+        City.objects.bulk_create([City(name=name) for name in names], ignore_conflicts=True)
+        ids = dict(City.objects.filter(name__in=names).values_list('name', 'id'))
+        CityAlias.objects.bulk_create(
+            [
+                CityAlias(city_id=ids[name], name=variant, key=key)
+                for key, (name, variant) in self.pending.items()
+            ],
+            ignore_conflicts=True
+        )
+        self.pending = {}
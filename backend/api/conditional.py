@@ -0,0 +1,109 @@
+"""
+Условные GET-запросы (ETag / Last-Modified)
+Валидаторы считаются одним агрегатным запросом по отфильтрованному queryset
+(MAX(updated_at), COUNT и дополнительные агрегаты view) до сериализации, поэтому
+ответ 304 на If-None-Match не загружает объекты и не запускает сериализатор.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .response_cache import get_versions
+
+
+class ConditionalGetMixin:
+    """
+    Слабый ETag для list() и retrieve(), Last-Modified - для retrieve()
+
+    etag_aggregates - агрегаты по связанным данным, которые входят в ответ, но не меняют
+    updated_at объекта (счетчики просмотров, отзывы, регистрации).
+    get_user_etag_querysets() - данные текущего пользователя, от которых зависит ответ
+    (избранное, регистрации); для каждого учитываются количество и максимальный id.
+    modified_fields - поля даты изменения объекта и вложенных в ответ связанных объектов;
+    Last-Modified - наибольшая из них.
+    etag_models - вложенные в ответ модели без поля даты изменения (категории, теги): в ETag
+    входят их версии из кеша ответов (response_cache), которые сигналы меняют при сохранении.
+    Last-Modified для списков не отправляется: удаление объекта не увеличивает MAX(updated_at).
+    """
+    etag_aggregates = {}
+    modified_fields = ['updated_at']
+    etag_models = ()
+
+    def get_user_etag_querysets(self):
+        return []
+
+    def get_validators(self, queryset):
+        """(ETag, время последнего изменения); для пустого queryset время - None"""
+        modified = {f'etag_modified_{field}': Max(field) for field in self.modified_fields}
+        state = queryset.order_by().aggregate(
+            etag_count=Count('pk', distinct=True),
+            **modified,
+            **self.etag_aggregates
+        )
+        last_modified = max((state[key] for key in modified if state[key] is not None), default=None)
+        user = self.request.user
+        parts = [
+            self.request.path,
+            sorted(self.request.query_params.lists()),
+            user.pk if user.is_authenticated else None,
+            sorted(state.items()),
+            get_versions(self.etag_models) if self.etag_models else None,
+        ]
+        if user.is_authenticated:
+            for user_queryset in self.get_user_etag_querysets():
+                parts.append(user_queryset.order_by().aggregate(count=Count('pk'), last=Max('pk')))
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return f'W/"{digest}"', last_modified
+
+    def conditional_response(self, etag, last_modified, view):
+        """304 без вызова view, если клиентская копия актуальна, иначе ответ view с валидаторами"""
+        # Last-Modified передается с точностью до секунды: сравнение с If-Modified-Since - по целым секундам
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        not_modified = get_conditional_response(self.request._request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            if last_modified:
+                not_modified['Last-Modified'] = http_date(timestamp)
+            return not_modified
+
+        response = view()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def filter_queryset(self, queryset):
+        # В list() отфильтрованный queryset уже посчитан для валидаторов, второй раз поиск не нужен
+        filtered = getattr(self, '_conditional_queryset', None)
+        if filtered is not None:
+            return filtered
+        return super().filter_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, _ = self.get_validators(queryset)
+        self._conditional_queryset = queryset
+        try:
+            return self.conditional_response(etag, None, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+        finally:
+            self._conditional_queryset = None
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+            etag, last_modified = self.get_validators(queryset)
+        except (TypeError, ValueError, ValidationError):
+            etag, last_modified = None, None
+        if last_modified is None:
+            # Объект не найден - 404 сформирует обычный retrieve()
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            etag, last_modified, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
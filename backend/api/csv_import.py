@@ -0,0 +1,149 @@
+"""
+Разбор CSV для команды load_csv_data
+Функции без обращений к БД: чтение файлов частями, нормализация и проверка строк.
+Разбор пачек выполняется в пуле процессов (parallel_map), запись в БД - в основном процессе.
+"""
+import csv
+import glob
+import hashlib
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .text import clean_city, normalize_phrase, slugify_ru
+
+# Признаки шаблона в пути (иначе путь - файл или директория)
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+def resolve_paths(specs):
+    """Файлы CSV по списку путей: файл, директория (все *.csv) или шаблон glob; и ненайденные пути"""
+    files = []
+    missing = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            matched = sorted(glob.glob(os.path.join(spec, '*.csv')))
+        elif _GLOB_CHARS.search(spec):
+            matched = sorted(path for path in glob.glob(spec) if os.path.isfile(path))
+        else:
+            matched = [spec] if os.path.isfile(spec) else []
+        if not matched:
+            missing.append(spec)
+        files.extend(path for path in matched if path not in files)
+    return files, missing
+
+
+def read_chunks(csv_files, chunk_size):
+    """Строки CSV частями по chunk_size: (файл, [(номер строки, строка)]); пачка не пересекает файлы"""
+    if isinstance(csv_files, str):
+        csv_files = [csv_files]
+    for csv_file in csv_files:
+        with open(csv_file, 'r', encoding='utf-8') as f:
+            rows = enumerate(csv.reader(f, delimiter=';'), start=1)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                yield csv_file, chunk
+
+
+def parallel_map(func, items, workers):
+    """
+    map в пуле из workers процессов с сохранением порядка
+
+    В обработке не больше 2 * workers пачек, поэтому большие файлы не читаются в память целиком.
+    При workers <= 1 выполняется в текущем процессе.
+    """
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def ngo_key(name, city):
+    """Естественный ключ НКО: название и город без регистра, пунктуации, лишних пробелов и региона"""
+    return f"{normalize_phrase(name)}|{normalize_phrase(clean_city(city))}"
+
+
+def row_hash(row):
+    """Хеш нормализованных значений строки для обнаружения изменений"""
+    return hashlib.sha1('\x1f'.join(row).encode('utf-8')).hexdigest()
+
+
+def parse_ngo_chunk(task):
+    """
+    Разбор пачки res.csv (выполняется в процессе пула)
+
+    Возвращает (строки, предупреждения, число пропущенных). Строка - кортеж
+    (город, категория, название, описание, сайт, основа slug, хеш).
+    """
+    csv_file, chunk = task
+    name_of_file = os.path.basename(csv_file)
+    rows = []
+    warnings = []
+    for row_num, row in chunk:
+        # Пропускаем пустые строки
+        if not row or all(not cell.strip() for cell in row):
+            continue
+
+        # Минимум 3 поля: город, категория, название
+        if len(row) < 3:
+            warnings.append(f'{name_of_file}, строка {row_num}: недостаточно полей ({len(row)}), пропущена')
+            continue
+
+        city = clean_city(row[0])
+        category_name = row[1].strip()
+        name = row[2].strip()
+        description = row[3].strip() if len(row) > 3 else ''
+        website = row[4].strip() if len(row) > 4 else ''
+
+        if not name:
+            warnings.append(f'{name_of_file}, строка {row_num}: пустое название, пропущена')
+            continue
+
+        if not category_name:
+            warnings.append(f'{name_of_file}, строка {row_num}: пустая категория, пропущена')
+            continue
+
+        values = (city, category_name, name, description, website)
+        slug_base = slugify_ru(f"{name} {city}" if city else name, max_length=40)
+        rows.append(values + (slug_base, row_hash(values)))
+    return rows, warnings, len(warnings)
+
+
+def parse_material_chunk(task):
+    """
+    Разбор пачки materials.csv (выполняется в процессе пула)
+
+    Возвращает (строки, предупреждения, число пропущенных). Строка - кортеж
+    (название, курс, автор, ссылка, [теги]).
+    """
+    _, chunk = task
+    rows = []
+    skipped = 0
+    for _, row in chunk:
+        if not row:
+            continue
+        if len(row) < 5:
+            skipped += 1
+            continue
+
+        title = row[1].strip()
+        url = row[4].strip()
+        if not title or not url:
+            skipped += 1
+            continue
+
+        # Теги разделены {{
+        tags = [t.strip() for t in row[0].split('{{') if t.strip()]
+        rows.append((title, row[2].strip(), row[3].strip(), url, tags))
+    return rows, [], skipped
@@ -0,0 +1,60 @@
+"""
+Геометрия карты: тайлы Web Mercator и quadkey
+Quadkey - строка из цифр 0-3, путь к тайлу в дереве квадрантов; префикс длины z - тайл
+масштаба z, содержащий точку. У НКО хранится quadkey на уровне QUADKEY_ZOOM (индексируется),
+поэтому выборка тайла - диапазон по индексу [префикс, префикс + '4').
+"""
+import math
+
+# Уровень детализации хранимого quadkey (около 150 м по экватору)
+QUADKEY_ZOOM = 18
+
+# Тайлы карты: начиная с MAP_POINTS_ZOOM (или если в тайле не больше MAP_TILE_MAX_POINTS НКО)
+# возвращаются точки, иначе - кластеры по подтайлам на CLUSTER_DEPTH уровней глубже
+# (до 8x8 кластеров на тайл)
+MAP_POINTS_ZOOM = 14
+MAP_TILE_MAX_POINTS = 200
+CLUSTER_DEPTH = 3
+
+# Web Mercator не определена у полюсов
+MAX_LATITUDE = 85.05112878
+
+
+def tile_for(latitude, longitude, zoom):
+    """Номер тайла (x, y) масштаба zoom, содержащего точку"""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    n = 1 << zoom
+    x = int((longitude + 180.0) / 360.0 * n)
+    sin_lat = math.sin(math.radians(latitude))
+    y = int((0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_quadkey(zoom, x, y):
+    """Quadkey тайла (z, x, y)"""
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digit = 0
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        digits.append(str(digit))
+    return ''.join(digits)
+
+
+def quadkey_for(latitude, longitude, zoom=QUADKEY_ZOOM):
+    """Quadkey точки или пустая строка, если координат нет"""
+    if latitude is None or longitude is None:
+        return ''
+    return tile_quadkey(zoom, *tile_for(latitude, longitude, zoom))
+
+
+def quadkey_range(prefix):
+    """Границы [from, to) непустых quadkey с данным префиксом - для индексного диапазона"""
+    return prefix or '0', prefix + '4'
+
+
+def is_valid_tile(zoom, x, y):
+    return 0 <= zoom <= QUADKEY_ZOOM and 0 <= x < (1 << zoom) and 0 <= y < (1 << zoom)
@@ -0,0 +1,118 @@
+"""
+Команда для переноса старой истории активности в архив
+События старше срока хранения переносятся пачками из ActivityHistory в ActivityHistoryArchive
+(с отметкой месяца), архивные месяцы старше ARCHIVE_MONTHS удаляются целиком. Сводка
+ActivitySummary уже учитывает все события, поэтому рекомендации перенос не меняет.
+--rebuild-summary пересчитывает сводку по истории и архиву (после ручных правок таблиц;
+события, записанные во время пересчета, могут быть потеряны - запускать в тихое время).
+Использование:
+    python manage.py archive_activity
+    python manage.py archive_activity --days 30 --archive-months 12 --dry-run
+    python manage.py archive_activity --rebuild-summary
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.activity import rebuild_activity_summary
+from api.models import ActivityHistory, ActivityHistoryArchive
+from api.recommendation_cache import recommendation_cache
+
+
+def month_start(value):
+    """Первый день месяца даты события (по времени проекта)"""
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def months_ago(today, months):
+    """Первый день месяца, отстоящего от today на months месяцев назад"""
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = 'Переносит старую историю активности в архив и удаляет устаревшие месяцы архива'
+
+    def add_arguments(self, parser):
+        retention = getattr(settings, 'ACTIVITY_RETENTION', {})
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=retention.get('DAYS', 90),
+            help='Сколько дней события остаются в основной таблице'
+        )
+        parser.add_argument(
+            '--archive-months',
+            type=int,
+            default=retention.get('ARCHIVE_MONTHS', 24),
+            help='Сколько месяцев хранить архив (0 - без ограничения)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Размер пачки переноса'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько событий будет перенесено и удалено'
+        )
+        parser.add_argument(
+            '--rebuild-summary',
+            action='store_true',
+            help='Пересчитать сводку активности по истории и архиву'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild_summary']:
+            rows = rebuild_activity_summary()
+            recommendation_cache.clear()
+            self.stdout.write(self.style.SUCCESS(f'Сводка активности пересчитана: {rows} строк'))
+            return
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_events = ActivityHistory.objects.filter(created_at__lt=cutoff)
+        purge_before = None
+        if options['archive_months'] > 0:
+            purge_before = months_ago(timezone.localdate(), options['archive_months'])
+            expired = ActivityHistoryArchive.objects.filter(month__lt=purge_before)
+
+        if options['dry_run']:
+            self.stdout.write(f'К переносу в архив: {old_events.count()} событий старше {options["days"]} дней')
+            if purge_before:
+                self.stdout.write(f'К удалению из архива: {expired.count()} событий до {purge_before:%m.%Y}')
+            return
+
+        moved = 0
+        while True:
+            with transaction.atomic():
+                batch = list(old_events.order_by('created_at', 'id')[:options['batch_size']])
+                if not batch:
+                    break
+                ActivityHistoryArchive.objects.bulk_create([
+                    ActivityHistoryArchive(
+                        user_id=entry.user_id,
+                        activity_type=entry.activity_type,
+                        ngo_id=entry.ngo_id,
+                        event_id=entry.event_id,
+                        metadata=entry.metadata,
+                        created_at=entry.created_at,
+                        month=month_start(entry.created_at),
+                    )
+                    for entry in batch
+                ], batch_size=500)
+                ActivityHistory.objects.filter(id__in=[entry.id for entry in batch]).delete()
+            moved += len(batch)
+            self.stdout.write(f'Перенесено {moved} событий')
+
+        purged = 0
+        if purge_before:
+            purged, _ = expired.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'В архив перенесено {moved} событий, из архива удалено {purged}'
+        ))
@@ -0,0 +1,363 @@
+"""
+Команда для генерации синтетических данных (для нагрузочных замеров, см. run_benchmark)
+Создает пользователей, НКО по категориям и городам с координатами, события, регистрации,
+отзывы, избранное, историю активности, материалы с тегами и новости. При одном и том же --seed
+данные совпадают. Объем задается --scale (1 - 1000 НКО и 2000 пользователей). Запись идет
+через bulk_create, поэтому поисковый и пространственный индексы, рейтинги, статистика и сводка
+активности пересчитываются в конце. Сгенерированные объекты помечены префиксом bench
+(логины bench_*, slug bench-*), --clear удаляет их перед генерацией.
+Использование: python manage.py generate_data [--scale 5] [--seed 42] [--clear]
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.activity import rebuild_activity_summary
+from api.cities import add_city
+from api.geo import quadkey_for
+from api.models import (
+    User, Category, NGO, Event, EventRegistration, Review, Favorite, ActivityHistory,
+    Tag, Material, News,
+)
+from api import ratings
+from api.recommendation_cache import recommendation_cache
+from api.response_cache import bump_version
+from api.suggest import invalidate_suggest_index
+from api.text import slugify_ru
+
+BENCH_PREFIX = 'bench'
+BENCH_URL = 'https://example.org/bench/'
+PASSWORD = 'benchmark'
+
+# Объемы при --scale 1
+BASE_SIZES = {'users': 2000, 'ngos': 1000, 'events': 3000, 'materials': 500, 'news': 500}
+
+# Город, широта, долгота, вес (доля НКО и пользователей)
+CITIES = [
+    ('Саров', 54.9227, 43.3448, 10),
+    ('Северск', 56.6031, 84.8809, 9),
+    ('Озерск', 55.7556, 60.7028, 8),
+    ('Снежинск', 56.0850, 60.7314, 7),
+    ('Железногорск', 56.2506, 93.5322, 7),
+    ('Новоуральск', 57.2472, 60.0956, 6),
+    ('Глазов', 58.1393, 52.6580, 6),
+    ('Ангарск', 52.5448, 103.8885, 6),
+    ('Волгодонск', 47.5136, 42.1514, 5),
+    ('Обнинск', 55.0968, 36.6101, 5),
+    ('Димитровград', 54.2138, 49.6184, 4),
+    ('Сосновый Бор', 59.9000, 29.0860, 4),
+    ('Заречный', 53.1960, 45.1689, 3),
+    ('Нововоронеж', 51.3092, 39.2164, 3),
+    ('Курчатов', 51.6604, 35.6572, 3),
+    ('Десногорск', 54.1465, 33.2830, 2),
+    ('Удомля', 57.8787, 35.0155, 2),
+    ('Полярные Зори', 67.3731, 32.4978, 2),
+    ('Билибино', 68.0546, 166.4372, 1),
+    ('Певек', 69.7008, 170.3133, 1),
+]
+
+# Категория и слова, которые попадают в названия и описания ее НКО
+CATEGORIES = {
+    'Социальная защита': ['пожилые', 'инвалиды', 'семьи', 'поддержка', 'помощь', 'адаптация'],
+    'Экология': ['природа', 'отходы', 'раздельный сбор', 'лес', 'река', 'субботник'],
+    'Здоровье': ['профилактика', 'донорство', 'реабилитация', 'медицина', 'спорт'],
+    'Образование': ['дети', 'школа', 'наставничество', 'курсы', 'просвещение', 'наука'],
+    'Культура': ['музей', 'театр', 'краеведение', 'библиотека', 'фестиваль', 'история'],
+    'Спорт': ['турнир', 'секция', 'здоровый образ жизни', 'марафон', 'дети'],
+    'Защита животных': ['приют', 'кошки', 'собаки', 'стерилизация', 'передержка'],
+    'Ветераны': ['ветераны', 'память', 'патриотизм', 'поисковый отряд', 'архив'],
+    'Волонтерство': ['добровольцы', 'акция', 'помощь', 'сбор', 'команда'],
+    'Местное сообщество': ['двор', 'благоустройство', 'соседи', 'инициатива', 'территориальное'],
+}
+
+ORG_FORMS = ['АНО', 'Фонд', 'Благотворительный фонд', 'Общественная организация', 'Ассоциация', 'Центр']
+NAME_ADJECTIVES = [
+    'Добрые', 'Открытые', 'Теплые', 'Светлые', 'Зеленые', 'Надежные', 'Живые', 'Общие', 'Новые', 'Родные',
+]
+NAME_NOUNS = ['руки', 'сердца', 'люди', 'дела', 'горизонты', 'берега', 'соседи', 'двери', 'истоки', 'крылья']
+SENTENCES = [
+    'Организация работает с {word} и привлекает волонтеров из города {city}.',
+    'Проекты направлены на {word}: регулярные встречи, консультации и мастер-классы.',
+    'Мы проводим акции, посвященные теме «{word}», и ищем партнеров среди местного бизнеса.',
+    'В {city} команда объединяет специалистов и добровольцев, тема работы - {word}.',
+    'Поддержка проектов в сфере «{word}» ведется при участии госкорпорации и грантов.',
+]
+EVENT_TYPES = ['Субботник', 'Мастер-класс', 'Лекция', 'Благотворительная ярмарка', 'Турнир', 'Встреча', 'Сбор помощи']
+TAGS = [
+    'волонтерство', 'фандрайзинг', 'грантрайтинг', 'SMM', 'управление проектами', 'юридические вопросы',
+    'бухгалтерия НКО', 'работа с донорами', 'социальное предпринимательство', 'экология', 'инклюзия',
+    'медиа', 'аналитика', 'краудфандинг', 'менторство', 'отчетность', 'мероприятия', 'дизайн',
+]
+COURSES = ['Школа НКО', 'Основы фандрайзинга', 'Проектный менеджмент', 'Коммуникации НКО', '']
+NEWS_CATEGORIES = ['Общие', 'События', 'Гранты', 'Волонтерство', 'Итоги']
+REVIEW_COMMENTS = [
+    'Отличная команда, все организовано четко.',
+    'Участвовал в акции, понравилось.',
+    'Хорошая идея, но не хватает информации о мероприятиях.',
+    'Помогли нашей семье, спасибо!',
+    'Регулярно участвую, рекомендую.',
+]
+
+
+class Command(BaseCommand):
+    help = 'Генерирует воспроизводимый синтетический набор данных для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Масштаб набора (1 - 1000 НКО, 2000 пользователей, 3000 событий)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Зерно генератора случайных чисел'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее сгенерированные данные'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').exists():
+            raise CommandError('Сгенерированные данные уже есть, используйте --clear')
+
+        self.random = random.Random(options['seed'])
+        self.now = timezone.now()
+        sizes = {name: max(1, int(size * options['scale'])) for name, size in BASE_SIZES.items()}
+
+        with transaction.atomic():
+            categories = self.create_categories()
+            for name, *_ in CITIES:
+                add_city(name)
+            users = self.create_users(sizes['users'], list(categories))
+            ngos = self.create_ngos(sizes['ngos'], categories, users)
+            events = self.create_events(sizes['events'], ngos)
+            self.create_interactions(users, ngos, events)
+            self.create_materials(sizes['materials'])
+            self.create_news(sizes['news'], users)
+
+        self.stdout.write('Пересчет производных данных...')
+        ratings.reconcile()
+        rebuild_activity_summary()
+        recommendation_cache.clear()
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_spatial_index', stdout=self.stdout)
+        call_command('reconcile_statistics', stdout=self.stdout)
+        for model in (Category, NGO, Event, Tag, Material, News, Review):
+            bump_version(model)
+        invalidate_suggest_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Сгенерировано: {len(users)} пользователей, {len(ngos)} НКО, {len(events)} событий, '
+            f'{sizes["materials"]} материалов, {sizes["news"]} новостей (пароль пользователей: {PASSWORD})'
+        ))
+
+    def clear(self):
+        """Удаление сгенерированных объектов (связанные записи удаляются каскадно)"""
+        News.objects.filter(author__username__startswith=f'{BENCH_PREFIX}_').delete()
+        Material.objects.filter(url__startswith=BENCH_URL).delete()
+        NGO.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').delete()
+        User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').delete()
+        self.stdout.write('Ранее сгенерированные данные удалены')
+
+    def pick_city(self):
+        return self.random.choices(CITIES, weights=[city[3] for city in CITIES])[0]
+
+    def text(self, words, city, sentences=3):
+        return ' '.join(
+            self.random.choice(SENTENCES).format(word=self.random.choice(words), city=city)
+            for _ in range(sentences)
+        )
+
+    def past(self, days):
+        return self.now - timedelta(days=self.random.uniform(0, days))
+
+    def create_categories(self):
+        """Категория -> слова темы (существующие категории переиспользуются)"""
+        categories = {}
+        for name, words in CATEGORIES.items():
+            category, _ = Category.objects.get_or_create(
+                name=name, defaults={'slug': slugify_ru(name), 'description': ', '.join(words)}
+            )
+            categories[category] = words
+        return categories
+
+    def create_users(self, count, categories):
+        password = make_password(PASSWORD)
+        users = []
+        for number in range(count):
+            users.append(User(
+                username=f'{BENCH_PREFIX}_{number}',
+                email=f'{BENCH_PREFIX}_{number}@example.org',
+                password=password,
+                city=self.pick_city()[0],
+                interests=[category.name for category in self.random.sample(categories, self.random.randint(0, 3))],
+            ))
+        User.objects.bulk_create(users, batch_size=500)
+        self.stdout.write(f'Пользователи: {count}')
+        return list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').order_by('id'))
+
+    def create_ngos(self, count, categories, users):
+        category_list = list(categories)
+        ngos = []
+        for number in range(count):
+            category = self.random.choice(category_list)
+            city, latitude, longitude, _ = self.pick_city()
+            name = (
+                f'{self.random.choice(ORG_FORMS)} «{self.random.choice(NAME_ADJECTIVES)} '
+                f'{self.random.choice(NAME_NOUNS)}»'
+            )
+            description = self.text(categories[category], city, sentences=4)
+            latitude += self.random.gauss(0, 0.03)
+            longitude += self.random.gauss(0, 0.05)
+            ngos.append(NGO(
+                name=name,
+                slug=f'{BENCH_PREFIX}-{number}',
+                category=category,
+                short_description=description[:300],
+                description=description,
+                city=city,
+                address=f'{city}, ул. {self.random.choice(NAME_NOUNS).capitalize()}, {self.random.randint(1, 120)}',
+                email=f'ngo{number}@example.org',
+                status='approved' if self.random.random() < 0.9 else 'pending',
+                created_by=self.random.choice(users),
+                latitude=latitude,
+                longitude=longitude,
+                quadkey=quadkey_for(latitude, longitude),
+            ))
+        NGO.objects.bulk_create(ngos, batch_size=500)
+        self.stdout.write(f'НКО: {count}')
+        return list(NGO.objects.filter(slug__startswith=f'{BENCH_PREFIX}-').select_related('category').order_by('id'))
+
+    def create_events(self, count, ngos):
+        approved = [ngo for ngo in ngos if ngo.status == 'approved']
+        events = []
+        for _ in range(count):
+            ngo = self.random.choice(approved)
+            title = f'{self.random.choice(EVENT_TYPES)}: {self.random.choice(CATEGORIES[ngo.category.name])}'
+            events.append(Event(
+                ngo=ngo,
+                title=title,
+                description=self.text(CATEGORIES[ngo.category.name], ngo.city, sentences=2),
+                # Две трети событий - в будущем
+                event_date=self.now + timedelta(days=self.random.uniform(-60, 120)),
+                location=ngo.address,
+                max_participants=self.random.choice([None, 20, 50, 100]),
+            ))
+        Event.objects.bulk_create(events, batch_size=500)
+        self.stdout.write(f'События: {count}')
+        return list(
+            Event.objects.filter(ngo__slug__startswith=f'{BENCH_PREFIX}-').select_related('ngo').order_by('id')
+        )
+
+    def create_interactions(self, users, ngos, events):
+        """Избранное, отзывы, регистрации и история: чаще НКО и события города пользователя"""
+        approved = [ngo for ngo in ngos if ngo.status == 'approved']
+        ngos_by_city = {}
+        for ngo in approved:
+            ngos_by_city.setdefault(ngo.city, []).append(ngo)
+        events_by_city = {}
+        for event in events:
+            events_by_city.setdefault(event.ngo.city, []).append(event)
+
+        def pick(items_by_city, items, city, count):
+            local = items_by_city.get(city) or items
+            chosen = {}
+            for _ in range(count):
+                item = self.random.choice(local if self.random.random() < 0.7 else items)
+                chosen[item.pk] = item
+            return list(chosen.values())
+
+        favorites, reviews, registrations, activity = [], [], [], []
+        participants = {}
+        for user in users:
+            for ngo in pick(ngos_by_city, approved, user.city, self.random.randint(0, 6)):
+                favorites.append(Favorite(user=user, ngo=ngo))
+                activity.append(ActivityHistory(user=user, activity_type='favorite', ngo=ngo))
+            for ngo in pick(ngos_by_city, approved, user.city, self.random.randint(0, 3)):
+                rating = self.random.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 6, 8])[0]
+                reviews.append(Review(user=user, ngo=ngo, rating=rating, comment=self.random.choice(REVIEW_COMMENTS)))
+                activity.append(ActivityHistory(user=user, activity_type='review', ngo=ngo, metadata={'rating': rating}))
+            for event in pick(events_by_city, events, user.city, self.random.randint(0, 4)):
+                registrations.append(EventRegistration(
+                    event=event, user=user, name=user.username, email=user.email
+                ))
+                activity.append(ActivityHistory(user=user, activity_type='event_registration', event=event))
+                participants[event.ngo_id] = participants.get(event.ngo_id, 0) + 1
+            for ngo in pick(ngos_by_city, approved, user.city, self.random.randint(5, 30)):
+                activity.append(ActivityHistory(user=user, activity_type='view', ngo=ngo))
+
+        Favorite.objects.bulk_create(favorites, batch_size=500)
+        Review.objects.bulk_create(reviews, batch_size=500)
+        EventRegistration.objects.bulk_create(registrations, batch_size=500)
+        ActivityHistory.objects.bulk_create(activity, batch_size=500)
+
+        # Счетчики НКО, которые в обычной работе заполняются вручную
+        events_count = {}
+        for event in events:
+            events_count[event.ngo_id] = events_count.get(event.ngo_id, 0) + 1
+        for ngo in ngos:
+            ngo.events_count = events_count.get(ngo.pk, 0)
+            ngo.participants_count = participants.get(ngo.pk, 0)
+        NGO.objects.bulk_update(ngos, ['events_count', 'participants_count'], batch_size=500)
+        self.stdout.write(
+            f'Избранное: {len(favorites)}, отзывы: {len(reviews)}, регистрации: {len(registrations)}, '
+            f'история: {len(activity)}'
+        )
+
+    def create_materials(self, count):
+        tags = []
+        for name in TAGS:
+            tag, _ = Tag.objects.get_or_create(name=name, defaults={'slug': slugify_ru(name)})
+            tags.append(tag)
+        materials = []
+        for number in range(count):
+            topic = self.random.choice(tags).name
+            materials.append(Material(
+                title=f'{self.random.choice(["Как", "Зачем", "Где"])} НКО работать с темой «{topic}» (часть {number % 7 + 1})',
+                description=f'Материал о теме «{topic}» для сотрудников и волонтеров НКО.',
+                course=self.random.choice(COURSES),
+                author=f'Эксперт {self.random.randint(1, 40)}',
+                url=f'{BENCH_URL}material-{number}',
+                views_count=self.random.randint(0, 500),
+            ))
+        Material.objects.bulk_create(materials, batch_size=500)
+        through = Material.tags.through
+        material_ids = Material.objects.filter(url__startswith=BENCH_URL).order_by('id').values_list('id', flat=True)
+        through.objects.bulk_create([
+            through(material_id=material_id, tag_id=tag.pk)
+            for material_id in material_ids
+            for tag in self.random.sample(tags, self.random.randint(1, 4))
+        ], batch_size=500)
+        self.stdout.write(f'Материалы: {count}')
+
+    def create_news(self, count, users):
+        news = []
+        for _ in range(count):
+            city = self.pick_city()[0]
+            words = self.random.choice(list(CATEGORIES.values()))
+            published_at = self.past(365)
+            content = self.text(words, city, sentences=5)
+            news.append(News(
+                title=f'{city}: {self.random.choice(EVENT_TYPES).lower()} - {self.random.choice(words)}',
+                snippet=content[:200],
+                content=content,
+                city=city,
+                category=self.random.choice(NEWS_CATEGORIES),
+                author=self.random.choice(users),
+                status='published' if self.random.random() < 0.9 else 'pending',
+                views_count=self.random.randint(0, 1000),
+                published_at=published_at,
+            ))
+        News.objects.bulk_create(news, batch_size=500)
+        self.stdout.write(f'Новости: {count}')
@@ -1,178 +1,401 @@
 """
 Команда для загрузки данных из CSV файлов в базу данных
-Использование: python manage.py load_csv_data
+Принимает файлы, директории (все *.csv) или шаблоны glob; по умолчанию api/res.csv и
+api/materials.csv. Файлы читаются потоком по частям (--chunk-size строк), разбор, нормализация
+и проверка пачек выполняются в пуле из --workers процессов (api/csv_import.py), запись в БД
+идет в основном процессе через bulk_create. Существующие slug, категории, города, теги и
+ссылки материалов загружаются в память один раз; город НКО приводится к каноническому
+названию из справочника (api/cities.py), новые города добавляются в справочник.
+В режиме upsert НКО сопоставляются по естественному ключу (нормализованные название и город):
+неизмененные строки (совпал хеш) пропускаются, измененные поля обновляются через bulk_update,
+с --soft-delete НКО из прошлых импортов, которых нет в файлах, переводятся в статус archived.
+Использование: python manage.py load_csv_data [--ngos regions/ "data/*.csv"] [--materials materials.csv]
+    [--mode create|upsert] [--soft-delete] [--workers 4] [--chunk-size 5000]
 """
-import csv
 import os
-from django.core.management.base import BaseCommand
-from django.utils.text import slugify
+import time
+from collections import Counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from api.cities import NO_CITY, CityRegistry
+from api.csv_import import (
+    ngo_key, parallel_map, parse_material_chunk, parse_ngo_chunk, read_chunks, resolve_paths,
+)
 from api.models import Category, NGO, Tag, Material
+from api.response_cache import bump_version
+from api.similarity import ngo_index
+from api.suggest import invalidate_suggest_index
+from api.text import slugify_ru
+
+# Поля НКО, которые берутся из CSV (остальные заполняются на сайте)
+NGO_IMPORT_FIELDS = ['name', 'category_id', 'city', 'short_description', 'description', 'website']
+
+
+class SlugRegistry:
+    """Уникальные slug в памяти: занятые значения и следующий номер суффикса для каждой основы"""
+
+    def __init__(self, existing, fallback):
+        self.taken = set(existing)
+        self.next_suffix = {}
+        self.fallback = fallback
+
+    def make(self, base):
+        """Свободный slug для основы, уже полученной slugify_ru"""
+        base = base or self.fallback
+        slug = base
+        counter = self.next_suffix.get(base, 1)
+        while slug in self.taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        self.next_suffix[base] = counter
+        self.taken.add(slug)
+        return slug
+
+
+class NamedLookup:
+    """
+    id категорий/тегов по названию или slug (оба уникальны), недостающие создаются пачкой
+
+    Поиск сначала по названию: у записей, созданных до транслитерации slug, он может быть пустым.
+    """
+
+    def __init__(self, model, fallback):
+        self.model = model
+        self.fallback = fallback
+        self.by_slug = {}
+        self.by_name = {}
+        self._remember(model.objects.values_list('id', 'slug', 'name'))
+
+    def _remember(self, rows):
+        for pk, slug, name in rows:
+            self.by_slug[slug] = pk
+            self.by_name[name] = pk
+
+    def slug_for(self, name):
+        return slugify_ru(name) or self.fallback
+
+    def get(self, name):
+        pk = self.by_name.get(name)
+        return pk if pk is not None else self.by_slug.get(self.slug_for(name))
+
+    def ensure(self, names):
+        missing = {}
+        for name in names:
+            if self.get(name) is None:
+                missing.setdefault(self.slug_for(name), name)
+        if missing:
+            self.model.objects.bulk_create(
+                [self.model(slug=slug, name=name) for slug, name in missing.items()],
+                ignore_conflicts=True
+            )
+            self._remember(
+                self.model.objects.filter(Q(slug__in=missing) | Q(name__in=missing.values()))
+                .values_list('id', 'slug', 'name')
+            )
+
+
+class Progress:
+    """Число обработанных строк и скорость с начала загрузки"""
+
+    def __init__(self, stdout, label):
+        self.stdout = stdout
+        self.label = label
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, rows):
+        self.rows += rows
+        self.stdout.write(f'  {self.label}: {self.rows} строк, {self.rate():.0f} строк/с')
+
+    def rate(self):
+        return self.rows / max(time.monotonic() - self.started, 1e-6)
+
+    def summary(self):
+        return f'{self.rows} строк за {time.monotonic() - self.started:.1f} с ({self.rate():.0f} строк/с)'
 
 
 class Command(BaseCommand):
-    help = 'Загружает данные из res.csv и materials.csv в базу данных'
+    help = 'Загружает данные из CSV файлов НКО (res.csv) и материалов (materials.csv) в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ngos', nargs='+', metavar='PATH',
+            help='Файлы, директории или шаблоны glob с НКО (по умолчанию api/res.csv)'
+        )
+        parser.add_argument(
+            '--materials', nargs='+', metavar='PATH',
+            help='Файлы, директории или шаблоны glob с материалами (по умолчанию api/materials.csv)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Количество строк CSV в одной пачке')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Процессов для разбора CSV (1 - без пула, в текущем процессе)'
+        )
+        parser.add_argument(
+            '--mode', choices=['create', 'upsert'], default='create',
+            help='create - только добавление НКО, upsert - добавление и обновление по названию и городу'
+        )
+        parser.add_argument(
+            '--soft-delete', action='store_true',
+            help='В режиме upsert перевести в архив импортированные НКО, которых нет в файлах'
+        )
 
     def handle(self, *args, **options):
         # Получаем путь к директории api
-        import django
         from django.conf import settings
         api_dir = os.path.join(settings.BASE_DIR, 'api')
-        
-        # Загрузка НКО из res.csv
-        ngo_file = os.path.join(api_dir, 'res.csv')
-        if os.path.exists(ngo_file):
-            self.load_ngos(ngo_file)
-        else:
-            self.stdout.write(self.style.WARNING(f'Файл {ngo_file} не найден'))
-        
-        # Загрузка материалов из materials.csv
-        material_file = os.path.join(api_dir, 'materials.csv')
-        if os.path.exists(material_file):
-            self.load_materials(material_file)
-        else:
-            self.stdout.write(self.style.WARNING(f'Файл {material_file} не найден'))
-        
+        self.chunk_size = options['chunk_size']
+        self.workers = options['workers']
+        if options['soft_delete'] and options['mode'] != 'upsert':
+            raise CommandError('--soft-delete используется только с --mode upsert')
+
+        # Загрузка НКО
+        ngo_files = self.resolve(options['ngos'] or [os.path.join(api_dir, 'res.csv')])
+        if ngo_files:
+            if options['mode'] == 'upsert':
+                self.upsert_ngos(ngo_files, soft_delete=options['soft_delete'])
+            else:
+                self.load_ngos(ngo_files)
+
+        # Загрузка материалов (дубликаты по ссылке пропускаются в обоих режимах)
+        material_files = self.resolve(options['materials'] or [os.path.join(api_dir, 'materials.csv')])
+        if material_files:
+            self.load_materials(material_files)
+
+        self.refresh_derived_data()
         self.stdout.write(self.style.SUCCESS('Данные успешно загружены!'))
 
+    def resolve(self, specs):
+        files, missing = resolve_paths(specs)
+        for spec in missing:
+            self.stdout.write(self.style.WARNING(f'Файл {spec} не найден'))
+        return files
+
+    def refresh_derived_data(self):
+        """bulk_create/bulk_update не вызывают сигналы: индексы, статистику и версии кеша обновляем явно"""
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_spatial_index', stdout=self.stdout)
+        call_command('reconcile_statistics', stdout=self.stdout)
+        for model in (Category, NGO, Tag):
+            bump_version(model)
+        invalidate_suggest_index()
+        if ngo_index.exists():
+            self.stdout.write(self.style.WARNING(
+                'Индекс сходства НКО не обновлен, выполните python manage.py build_ngo_index'
+            ))
+
+    def parsed_chunks(self, csv_files, parse, progress):
+        """Разобранные в пуле процессов пачки (строки, число пропущенных) в порядке файлов"""
+        chunks = read_chunks(csv_files, self.chunk_size)
+        for rows, warnings, skipped in parallel_map(parse, chunks, self.workers):
+            for warning in warnings:
+                self.stdout.write(self.style.WARNING(warning))
+            yield rows, skipped
+            progress.add(len(rows) + skipped)
+
+    @staticmethod
+    def ngo_values(row, categories, cities):
+        """Значения полей NGO_IMPORT_FIELDS для разобранной строки (см. parse_ngo_chunk)"""
+        city, category_name, name, description, website = row[:5]
+        return {
+            'name': name,
+            'category_id': categories.get(category_name),
+            'city': cities.canonical(city) if city else NO_CITY,
+            'short_description': description[:300] if description else f'НКО: {name}',
+            'description': description if description else f'НКО: {name}',
+            'website': website if website and website != '-' else '',
+        }
+
     @transaction.atomic
-    def load_ngos(self, csv_file):
-        """Загрузка НКО из res.csv"""
-        self.stdout.write('Загрузка НКО...')
-        
-        if not os.path.exists(csv_file):
-            self.stdout.write(self.style.WARNING(f'Файл {csv_file} не найден'))
-            return
-        
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter=';')
-            count = 0
-            skipped = 0
-            row_num = 0
-            
-            for row in reader:
-                row_num += 1
-                
-                # Пропускаем пустые строки
-                if not row or all(not cell.strip() for cell in row):
-                    continue
-                
-                # Минимум 3 поля: город, категория, название
-                if len(row) < 3:
-                    self.stdout.write(self.style.WARNING(f'Строка {row_num}: недостаточно полей ({len(row)}), пропущена'))
-                    skipped += 1
-                    continue
-                
-                city = row[0].strip() if len(row) > 0 else ''
-                category_name = row[1].strip() if len(row) > 1 else ''
-                name = row[2].strip() if len(row) > 2 else ''
-                description = row[3].strip() if len(row) > 3 else ''
-                website = row[4].strip() if len(row) > 4 else ''
-                
-                if not name:
-                    self.stdout.write(self.style.WARNING(f'Строка {row_num}: пустое название, пропущена'))
-                    skipped += 1
-                    continue
-                
-                if not category_name:
-                    self.stdout.write(self.style.WARNING(f'Строка {row_num}: пустая категория, пропущена'))
-                    skipped += 1
-                    continue
-                
-                # Получаем или создаем категорию
-                category_slug = slugify(category_name)
-                category, _ = Category.objects.get_or_create(
-                    slug=category_slug,
-                    defaults={'name': category_name}
+    def load_ngos(self, csv_files):
+        """Загрузка НКО"""
+        self.stdout.write(f'Загрузка НКО из {len(csv_files)} файлов...')
+
+        categories = NamedLookup(Category, fallback='category')
+        cities = CityRegistry()
+        slugs = SlugRegistry(NGO.objects.values_list('slug', flat=True), fallback='ngo')
+        progress = Progress(self.stdout, 'НКО')
+        count = 0
+        skipped = 0
+
+        for rows, chunk_skipped in self.parsed_chunks(csv_files, parse_ngo_chunk, progress):
+            skipped += chunk_skipped
+
+            # Категории пачки - одним bulk_create
+            categories.ensure(row[1] for row in rows)
+
+            # Уникальный slug из name + city, коллизии разрешаются в памяти
+            ngos = [
+                NGO(
+                    slug=slugs.make(row[5]),
+                    status='approved',  # Автоматически одобряем загруженные НКО
+                    import_hash=row[6],
+                    **self.ngo_values(row, categories, cities)
                 )
-                
-                # Создаем уникальный slug из name + city для избежания дубликатов
-                if city:
-                    slug_base = f"{name} {city}"
+                for row in rows
+            ]
+            cities.flush()
+            NGO.objects.bulk_create(ngos, batch_size=1000)
+            count += len(ngos)
+
+        self.stdout.write(self.style.SUCCESS(f'Загружено {count} НКО: {progress.summary()}'))
+        if skipped > 0:
+            self.stdout.write(self.style.WARNING(f'Пропущено {skipped} строк'))
+
+    @transaction.atomic
+    def upsert_ngos(self, csv_files, soft_delete=False):
+        """Добавление новых и обновление измененных НКО"""
+        self.stdout.write(f'Обновление НКО из {len(csv_files)} файлов...')
+
+        categories = NamedLookup(Category, fallback='category')
+        cities = CityRegistry()
+        slugs = SlugRegistry(NGO.objects.values_list('slug', flat=True), fallback='ngo')
+        progress = Progress(self.stdout, 'НКО')
+        summary = Counter()
+        changed_fields = Counter()
+
+        # Естественный ключ -> (id, хеш, статус); при дублях в базе сопоставляется самая ранняя НКО
+        existing = {}
+        rows = NGO.objects.order_by('id').values_list('id', 'name', 'city', 'import_hash', 'status')
+        for pk, name, city, import_hash, status in rows.iterator(chunk_size=10000):
+            existing.setdefault(ngo_key(name, city), (pk, import_hash, status))
+        seen = set()
+
+        for rows, skipped in self.parsed_chunks(csv_files, parse_ngo_chunk, progress):
+            summary['skipped'] += skipped
+            categories.ensure(row[1] for row in rows)
+
+            new = []
+            changed = {}
+            for row in rows:
+                values = self.ngo_values(row, categories, cities)
+                key = ngo_key(values['name'], values['city'])
+                if key in seen:
+                    summary['duplicates'] += 1
+                    continue
+                seen.add(key)
+
+                digest = row[6]
+                current = existing.get(key)
+                if current is None:
+                    new.append(NGO(slug=slugs.make(row[5]), status='approved', import_hash=digest, **values))
+                elif current[1] == digest and current[2] != 'archived':
+                    summary['unchanged'] += 1
                 else:
-                    slug_base = name
-                
-                ngo_slug = slugify(slug_base)
-                
-                # Если slug уже существует, добавляем суффикс
-                original_slug = ngo_slug
-                counter = 1
-                while NGO.objects.filter(slug=ngo_slug).exists():
-                    ngo_slug = f"{original_slug}-{counter}"
-                    counter += 1
-                
-                # Создаем НКО
-                ngo, created = NGO.objects.get_or_create(
-                    slug=ngo_slug,
-                    defaults={
-                        'name': name,
-                        'category': category,
-                        'city': city if city else 'Не указан',
-                        'short_description': description[:300] if description else f'НКО: {name}',
-                        'description': description if description else f'НКО: {name}',
-                        'website': website if website and website != '-' else '',
-                        'status': 'approved',  # Автоматически одобряем загруженные НКО
-                    }
+                    changed[current[0]] = (values, digest)
+
+            cities.flush()
+            NGO.objects.bulk_create(new, batch_size=1000)
+            summary['created'] += len(new)
+            self.update_changed_ngos(changed, summary, changed_fields)
+
+        # Импортированные ранее (есть хеш) одобренные НКО, которых нет в файлах
+        missing = [
+            pk for key, (pk, import_hash, status) in existing.items()
+            if key not in seen and import_hash and status == 'approved'
+        ]
+        summary['missing'] = len(missing)
+        if soft_delete:
+            now = timezone.now()
+            for start in range(0, len(missing), 500):
+                summary['archived'] += NGO.objects.filter(pk__in=missing[start:start + 500]).update(
+                    status='archived', updated_at=now
                 )
-                
-                if created:
-                    count += 1
-                else:
-                    self.stdout.write(self.style.WARNING(f'Строка {row_num}: НКО "{name}" уже существует (slug: {ngo_slug})'))
-            
-            self.stdout.write(self.style.SUCCESS(f'Загружено {count} НКО'))
-            if skipped > 0:
-                self.stdout.write(self.style.WARNING(f'Пропущено {skipped} строк'))
 
-    @transaction.atomic
-    def load_materials(self, csv_file):
-        """Загрузка материалов из materials.csv"""
-        self.stdout.write('Загрузка материалов...')
-        
-        if not os.path.exists(csv_file):
-            self.stdout.write(self.style.WARNING(f'Файл {csv_file} не найден'))
+        # Итоги доступны вызывающему коду: call_command(command, ...) и command.summary
+        self.summary = summary
+        self.write_summary(summary, changed_fields, progress)
+
+    @staticmethod
+    def update_changed_ngos(changed, summary, changed_fields):
+        """bulk_update пачки: записываются только поля, отличающиеся хотя бы у одной НКО"""
+        if not changed:
             return
-        
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter=';')
-            count = 0
-            
-            for row in reader:
-                if len(row) < 5:
-                    continue
-                
-                tags_str = row[0].strip()
-                title = row[1].strip()
-                course = row[2].strip() if len(row) > 2 else ''
-                author = row[3].strip() if len(row) > 3 else ''
-                url = row[4].strip() if len(row) > 4 else ''
-                
-                if not title or not url:
+        now = timezone.now()
+        fields = {'import_hash'}
+        ngos = NGO.objects.in_bulk(list(changed))
+        for pk, (values, digest) in changed.items():
+            ngo = ngos[pk]
+            diff = [field for field in NGO_IMPORT_FIELDS if getattr(ngo, field) != values[field]]
+            if ngo.status == 'archived':
+                # НКО снова есть в файле - возвращаем из архива
+                ngo.status = 'approved'
+                diff.append('status')
+                summary['restored'] += 1
+            elif diff:
+                summary['updated'] += 1
+            else:
+                # Изменилось только то, что не попадает в поля (или хеша еще не было)
+                summary['unchanged'] += 1
+            for field in diff:
+                if field != 'status':
+                    setattr(ngo, field, values[field])
+                    changed_fields[field] += 1
+            if diff:
+                # bulk_update не обновляет auto_now - updated_at нужен для ETag
+                ngo.updated_at = now
+                fields.update(diff)
+                fields.add('updated_at')
+            ngo.import_hash = digest
+        NGO.objects.bulk_update(ngos.values(), sorted(fields), batch_size=500)
+
+    def write_summary(self, summary, changed_fields, progress):
+        self.stdout.write(self.style.SUCCESS(f'Итоги обновления НКО: {progress.summary()}'))
+        self.stdout.write(f"  добавлено: {summary['created']}")
+        fields = ', '.join(f'{field}: {count}' for field, count in changed_fields.most_common())
+        self.stdout.write(f"  изменено: {summary['updated']}" + (f' ({fields})' if fields else ''))
+        self.stdout.write(f"  восстановлено из архива: {summary['restored']}")
+        self.stdout.write(f"  без изменений: {summary['unchanged']}")
+        if summary['archived']:
+            self.stdout.write(f"  перенесено в архив: {summary['archived']}")
+        elif summary['missing']:
+            self.stdout.write(f"  отсутствуют в файле: {summary['missing']} (для переноса в архив используйте --soft-delete)")
+        if summary['duplicates']:
+            self.stdout.write(self.style.WARNING(f"  повторы в файле: {summary['duplicates']}"))
+        if summary['skipped']:
+            self.stdout.write(self.style.WARNING(f"  пропущено строк: {summary['skipped']}"))
+
+    @transaction.atomic
+    def load_materials(self, csv_files):
+        """Загрузка материалов"""
+        self.stdout.write(f'Загрузка материалов из {len(csv_files)} файлов...')
+
+        urls = set(Material.objects.values_list('url', flat=True))
+        tags = NamedLookup(Tag, fallback='tag')
+        through = Material.tags.through
+        progress = Progress(self.stdout, 'материалы')
+        count = 0
+
+        for rows, _ in self.parsed_chunks(csv_files, parse_material_chunk, progress):
+            materials = []
+            material_tags = []
+            for title, course, author, url, names in rows:
+                # Дубликаты определяются по ссылке, в том числе внутри файла
+                if url in urls:
                     continue
-                
-                # Создаем материал
-                material, created = Material.objects.get_or_create(
-                    url=url,
-                    defaults={
-                        'title': title,
-                        'course': course,
-                        'author': author,
-                    }
-                )
-                
-                if created:
-                    # Обрабатываем теги (разделены {{)
-                    if tags_str:
-                        tag_names = [t.strip() for t in tags_str.split('{{') if t.strip()]
-                        for tag_name in tag_names:
-                            tag_slug = slugify(tag_name)
-                            tag, _ = Tag.objects.get_or_create(
-                                slug=tag_slug,
-                                defaults={'name': tag_name}
-                            )
-                            material.tags.add(tag)
-                    
-                    count += 1
-            
-            self.stdout.write(self.style.SUCCESS(f'Загружено {count} материалов'))
+                urls.add(url)
+                materials.append(Material(title=title, course=course, author=author, url=url))
+                material_tags.append(names)
+
+            # Новые теги пачки - одним bulk_create
+            tags.ensure(tag_name for names in material_tags for tag_name in names)
+
+            # bulk_create возвращает id (SQLite 3.35+, PostgreSQL), связи с тегами - одной вставкой
+            Material.objects.bulk_create(materials, batch_size=1000)
+            links = {
+                (material.id, tags.get(tag_name))
+                for material, names in zip(materials, material_tags)
+                for tag_name in names
+            }
+            through.objects.bulk_create(
+                [through(material_id=material_id, tag_id=tag_id) for material_id, tag_id in links],
+                batch_size=1000,
+                ignore_conflicts=True
+            )
+            count += len(materials)
 
+        self.stdout.write(self.style.SUCCESS(f'Загружено {count} материалов: {progress.summary()}'))
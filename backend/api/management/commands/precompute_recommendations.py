@@ -0,0 +1,148 @@
+"""
+Команда для офлайн-расчета рекомендаций всех активных пользователей
+Использование:
+    python manage.py precompute_recommendations
+    python manage.py precompute_recommendations --incremental --workers 4
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from api.models import (
+    User, Favorite, ActivityHistory, Review, EventRegistration,
+    PrecomputedRecommendation
+)
+
+
+def init_worker():
+    """Инициализация Django в процессе-воркере"""
+    import django
+    django.setup()
+
+
+def compute_chunk(user_ids, limit):
+    """
+    Расчет рекомендаций для пачки пользователей (выполняется в воркере)
+
+    Признаки будущих событий загружаются один раз на город и переиспользуются
+    для всех пользователей пачки.
+    """
+    from api.recommendations import get_ngo_recommendations, rank_event_ids, load_event_candidates
+
+    users = User.objects.in_bulk(user_ids)
+    event_candidates = {}
+    results = []
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        if user.city not in event_candidates:
+            event_candidates[user.city] = load_event_candidates(user.city)
+        ngo_ids = [ngo.id for ngo in get_ngo_recommendations(user, limit)]
+        event_ids = rank_event_ids(user, limit, candidates=event_candidates[user.city])
+        results.append((user_id, ngo_ids, event_ids))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Рассчитывает рекомендации НКО и событий для активных пользователей и сохраняет их в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Пересчитать только пользователей без рекомендаций или с активностью после прошлого запуска'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Количество процессов (1 - расчет в текущем процессе)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=200, help='Пользователей в одной пачке')
+        parser.add_argument('--limit', type=int, default=20, help='Количество сохраняемых рекомендаций каждого типа')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        user_ids = self.get_user_ids(options['incremental'])
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        self.stdout.write(f'Пользователей к расчету: {len(user_ids)}, пачек: {len(chunks)}')
+
+        start = time.monotonic()
+        processed = 0
+        if options['workers'] <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                processed += self.save_results(compute_chunk(chunk, options['limit']), started_at)
+                self.report_progress(processed, len(user_ids), start)
+        else:
+            # Соединения с БД не должны наследоваться дочерними процессами
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+                futures = [executor.submit(compute_chunk, chunk, options['limit']) for chunk in chunks]
+                for future in as_completed(futures):
+                    processed += self.save_results(future.result(), started_at)
+                    self.report_progress(processed, len(user_ids), start)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации рассчитаны для {processed} пользователей за {time.monotonic() - start:.1f} с'
+        ))
+
+    def get_user_ids(self, incremental):
+        users = User.objects.filter(is_active=True)
+        if not incremental:
+            return list(users.order_by('id').values_list('id', flat=True))
+
+        # Пользователи без полного набора рекомендаций (в т.ч. сброшенных сигналами)
+        stale_ids = set(
+            users.annotate(rec_count=Count('precomputed_recommendations'))
+            .filter(rec_count__lt=len(PrecomputedRecommendation.REC_TYPES))
+            .values_list('id', flat=True)
+        )
+
+        # Пользователи с активностью после самого раннего расчета
+        last_run = PrecomputedRecommendation.objects.aggregate(last_run=Min('computed_at'))['last_run']
+        if last_run:
+            stale_ids.update(users.filter(updated_at__gte=last_run).values_list('id', flat=True))
+            for model, date_field in (
+                (Favorite, 'created_at'),
+                (ActivityHistory, 'created_at'),
+                (Review, 'updated_at'),
+                (EventRegistration, 'created_at'),
+            ):
+                stale_ids.update(
+                    model.objects.filter(**{f'{date_field}__gte': last_run})
+                    .values_list('user_id', flat=True)
+                    .distinct()
+                )
+            stale_ids &= set(users.values_list('id', flat=True))
+
+        return sorted(stale_ids)
+
+    def save_results(self, results, computed_at):
+        """Запись результатов пачки одним bulk upsert"""
+        objs = []
+        for user_id, ngo_ids, event_ids in results:
+            objs.append(PrecomputedRecommendation(
+                user_id=user_id, rec_type='ngos', item_ids=ngo_ids, computed_at=computed_at
+            ))
+            objs.append(PrecomputedRecommendation(
+                user_id=user_id, rec_type='events', item_ids=event_ids, computed_at=computed_at
+            ))
+        PrecomputedRecommendation.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=['user', 'rec_type'],
+            update_fields=['item_ids', 'computed_at'],
+        )
+        return len(results)
+
+    def report_progress(self, processed, total, start):
+        elapsed = time.monotonic() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(f'  {processed}/{total} ({rate:.0f} польз./с)')
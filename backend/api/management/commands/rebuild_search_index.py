@@ -0,0 +1,22 @@
+"""
+Команда для полной перестройки полнотекстового индекса
+Использование: python manage.py rebuild_search_index
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.search import SEARCH_DOCUMENTS, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс НКО, событий, материалов и новостей'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        for doc_type, config in SEARCH_DOCUMENTS.items():
+            model = apps.get_model(config['model'])
+            count = backend.rebuild(doc_type, model.objects.filter(**config['filter']).iterator())
+            self.stdout.write(f'{doc_type}: {count}')
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
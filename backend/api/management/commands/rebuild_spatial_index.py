@@ -0,0 +1,20 @@
+"""
+Команда для полной перестройки пространственного индекса НКО (R*Tree на SQLite)
+Нужна после массовой загрузки или изменения координат без сигналов.
+Использование: python manage.py rebuild_spatial_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import NGO
+from api.spatial import get_spatial_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает пространственный индекс одобренных НКО для поиска ближайших'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        ngos = NGO.objects.filter(status='approved').only('id', 'status', 'latitude', 'longitude')
+        count = get_spatial_index().rebuild(ngos.iterator(chunk_size=2000))
+        self.stdout.write(self.style.SUCCESS(f'Пространственный индекс перестроен: {count} НКО'))
@@ -0,0 +1,29 @@
+"""
+Команда для сверки счетчиков оценок НКО с отзывами
+Пересчитывает rating_sum, rating_count и rating по таблице отзывов и выводит расхождения.
+Запускать периодически и после массовых операций с отзывами (bulk_create, update, загрузка дампа).
+Использование: python manage.py reconcile_ratings
+"""
+from django.core.management.base import BaseCommand
+
+from api.ratings import reconcile
+from api.response_cache import bump_version
+from api.models import NGO
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сумму и число оценок НКО по отзывам и исправляет расхождения'
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        for ngo_id, ((old_sum, old_count), (new_sum, new_count)) in list(drift.items())[:20]:
+            self.stdout.write(self.style.WARNING(
+                f'НКО {ngo_id}: сумма {old_sum} -> {new_sum}, оценок {old_count} -> {new_count}'
+            ))
+        if len(drift) > 20:
+            self.stdout.write(self.style.WARNING(f'... и еще {len(drift) - 20} НКО'))
+        if drift:
+            bump_version(NGO)
+        else:
+            self.stdout.write('Расхождений нет')
+        self.stdout.write(self.style.SUCCESS('Рейтинги пересчитаны'))
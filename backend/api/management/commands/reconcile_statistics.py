@@ -0,0 +1,26 @@
+"""
+Команда для сверки снимка статистики платформы с данными
+Пересчитывает все счетчики PlatformStatistics и выводит найденные расхождения.
+Запускать периодически (например, раз в час из cron) и после массовой загрузки данных.
+Использование: python manage.py reconcile_statistics
+"""
+from django.core.management.base import BaseCommand
+
+from api.statistics import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает снимок статистики платформы и исправляет расхождения счетчиков'
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        categories = drift.pop('categories', {})
+        for field, (old, new) in drift.items():
+            self.stdout.write(self.style.WARNING(f'{field}: {old} -> {new}'))
+        for category_id, (old, new) in list(categories.items())[:20]:
+            self.stdout.write(self.style.WARNING(f'категория {category_id}: {old} -> {new}'))
+        if len(categories) > 20:
+            self.stdout.write(self.style.WARNING(f'... и еще {len(categories) - 20} категорий'))
+        if not drift and not categories:
+            self.stdout.write('Расхождений нет')
+        self.stdout.write(self.style.SUCCESS('Статистика пересчитана'))
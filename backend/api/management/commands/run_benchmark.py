@@ -0,0 +1,301 @@
+"""
+Команда для замера времени ответа горячих эндпоинтов API
+Запросы выполняются в процессе через тестовый клиент Django (без сети и веб-сервера), для каждого
+эндпоинта - --warmup запросов без замера и --iterations с замером времени и числа SQL-запросов.
+Результат - JSON с p50/p95/p99 (коммит git, размеры таблиц, параметры запуска), который удобно
+сохранять и сравнивать между коммитами. Данные для замера: python manage.py generate_data.
+--no-cache отключает кеш ответов и кеш рекомендаций, чтобы мерить саму выборку.
+--scorer-sizes добавляет замер подсчета баллов событий для рекомендаций без БД: на N синтетических
+кандидатах (генератор с --seed, результат повторяем) сравниваются векторный подсчет
+(score_events + top_k_indices) и прежний построчный, с проверкой, что топ совпадает.
+Использование:
+    python manage.py run_benchmark --output bench.json
+    python manage.py run_benchmark --iterations 200 --no-cache --endpoints ngos search
+    python manage.py run_benchmark --endpoints --scorer-sizes 10000 100000 --output scorer.json
+"""
+import json
+import platform
+import subprocess
+import time
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.cities import NO_CITY
+from api.metrics import percentile
+from api.models import User, NGO, Event, Material, News, ActivityHistory
+from api.recommendation_cache import recommendation_cache
+from api.recommendations import score_events, top_k_indices
+
+# Слова запросов поиска по очереди (есть в данных generate_data)
+SEARCH_QUERIES = ['помощь', 'дети', 'экология', 'ветераны', 'волонтеры', 'приют', 'фестиваль']
+
+# Имя -> (путь, нужна ли авторизация); {city} и {query} подставляются на каждой итерации
+ENDPOINTS = {
+    'ngos': ('/api/ngos/', False),
+    'events_upcoming': ('/api/events/?upcoming=true', False),
+    'search': ('/api/search?q={query}', False),
+    'recommendations': ('/api/recommendations?type=ngos', True),
+    'map_ngos': ('/api/map/ngos?city={city}', False),
+    'statistics': ('/api/statistics', False),
+    'materials_all': ('/api/materials/all/', False),
+}
+
+# Замер подсчета баллов: число категорий НКО, категории интересов пользователя и размер топа
+SCORER_CATEGORIES = 20
+SCORER_INTEREST_CATEGORY_IDS = {1, 2, 3}
+SCORER_LIMIT = 5
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {
+        'p50': round(percentile(ordered, 0.50), 2),
+        'p95': round(percentile(ordered, 0.95), 2),
+        'p99': round(percentile(ordered, 0.99), 2),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'max': round(ordered[-1], 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scorer_candidates(size, seed):
+    """Синтетические колонки признаков событий (как у load_event_candidates), одинаковые при одном seed"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    return {
+        'category_ids': rng.integers(1, SCORER_CATEGORIES + 1, size),
+        'registrations': rng.integers(0, 60, size).astype(np.float64),
+        'ratings': np.round(rng.uniform(0, 5, size), 1),
+        'days_until': rng.integers(0, 365, size),
+    }
+
+
+def scalar_top(candidates, interest_category_ids, limit):
+    """Прежний построчный подсчет баллов и стабильная сортировка (эталон для сравнения)"""
+    scored = []
+    for i in range(len(candidates['category_ids'])):
+        score = 0
+        if int(candidates['category_ids'][i]) in interest_category_ids:
+            score += 10
+        score += min(float(candidates['registrations'][i]) / 5, 5)
+        score += float(candidates['ratings'][i]) * 2
+        days_until = int(candidates['days_until'][i])
+        if days_until <= 7:
+            score += 5
+        elif days_until <= 30:
+            score += 3
+        scored.append((i, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return [i for i, _ in scored[:limit]]
+
+
+def vector_top(candidates, interest_category_ids, limit):
+    scores = score_events(
+        candidates['category_ids'], candidates['registrations'], candidates['ratings'],
+        candidates['days_until'], interest_category_ids,
+    )
+    return [int(i) for i in top_k_indices(scores, limit)]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет p50/p95/p99 времени ответа и число SQL-запросов горячих эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Число замеряемых запросов к каждому эндпоинту'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Число запросов без замера перед замером'
+        )
+        parser.add_argument(
+            '--endpoints',
+            nargs='*',
+            choices=list(ENDPOINTS),
+            default=list(ENDPOINTS),
+            help='Эндпоинты для замера (без значений - только замер подсчета баллов)'
+        )
+        parser.add_argument(
+            '--scorer-sizes',
+            nargs='+',
+            type=int,
+            default=[],
+            metavar='N',
+            help='Замер подсчета баллов событий на N синтетических кандидатах, например 10000 100000'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed генератора кандидатов для --scorer-sizes'
+        )
+        parser.add_argument(
+            '--user',
+            help='Логин пользователя для рекомендаций (по умолчанию - первый с избранным)'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Отключить кеш ответов и кеш рекомендаций'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-результата (по умолчанию - вывод в консоль)'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше 0')
+        if any(size < 1 for size in options['scorer_sizes']):
+            raise CommandError('--scorer-sizes должны быть больше 0')
+
+        user = self.get_user(options['user'])
+        cities = [
+            city for city in NGO.objects.filter(status='approved').values_list('city', flat=True).distinct()
+            if city and city != NO_CITY
+        ] or ['']
+        anonymous = Client()
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}') if user else anonymous
+
+        results = {}
+        with ExitStack() as stack:
+            if options['no_cache']:
+                stack.enter_context(override_settings(
+                    RESPONSE_CACHE={**getattr(settings, 'RESPONSE_CACHE', {}), 'ENABLED': False}
+                ))
+            for name in options['endpoints']:
+                path, needs_user = ENDPOINTS[name]
+                if needs_user and user is None:
+                    self.stderr.write(self.style.WARNING(f'{name}: нет пользователя, пропущен'))
+                    continue
+                results[name] = self.measure(
+                    client if needs_user else anonymous, path, cities, options['warmup'],
+                    options['iterations'], options['no_cache']
+                )
+
+        scorer = {
+            str(size): self.measure_scorer(size, options['seed'], options['warmup'], options['iterations'])
+            for size in options['scorer_sizes']
+        }
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'no_cache': options['no_cache'],
+                'user': user.username if user else None,
+                'seed': options['seed'],
+                'dataset': {
+                    model._meta.model_name: model.objects.count()
+                    for model in (User, NGO, Event, Material, News, ActivityHistory)
+                },
+            },
+            'endpoints': results,
+            'scorer': scorer,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            for name, result in results.items():
+                self.stdout.write(
+                    f"{name:16} p50 {result['latency_ms']['p50']:8.2f} мс  p95 {result['latency_ms']['p95']:8.2f} мс  "
+                    f"p99 {result['latency_ms']['p99']:8.2f} мс  SQL {result['queries']['p50']:g}"
+                )
+            for size, result in scorer.items():
+                self.stdout.write(
+                    f"scorer {size:>9} векторно p50 {result['vectorized_ms']['p50']:8.2f} мс  "
+                    f"построчно p50 {result['scalar_ms']['p50']:8.2f} мс  x{result['speedup']:g}"
+                    + ('' if result['same_top'] else '  ТОП НЕ СОВПАДАЕТ')
+                )
+            self.stdout.write(self.style.SUCCESS(f'Результат записан в {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден')
+            return user
+        return User.objects.filter(favorites__isnull=False).order_by('id').first() or User.objects.order_by('id').first()
+
+    def measure(self, client, path, cities, warmup, iterations, no_cache):
+        """Время ответа (мс) и число SQL-запросов на каждой итерации"""
+        latencies = []
+        queries = []
+        statuses = set()
+        for number in range(warmup + iterations):
+            url = path.format(
+                city=cities[number % len(cities)],
+                query=SEARCH_QUERIES[number % len(SEARCH_QUERIES)],
+            )
+            if no_cache:
+                recommendation_cache.clear()
+            # Журнал запросов ограничен 9000 записями, при переполнении подсчет сбивается
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if number < warmup:
+                continue
+            statuses.add(response.status_code)
+            latencies.append(elapsed * 1000)
+            queries.append(len(captured))
+        return {
+            'path': path,
+            'status': sorted(statuses),
+            'latency_ms': summarize(latencies),
+            'queries': summarize(queries),
+        }
+
+    def measure_scorer(self, size, seed, warmup, iterations):
+        """Время (мс) векторного и построчного подсчета баллов на одних и тех же кандидатах"""
+        candidates = scorer_candidates(size, seed)
+        timings = {}
+        tops = {}
+        for name, rank in (('vectorized', vector_top), ('scalar', scalar_top)):
+            latencies = []
+            for number in range(warmup + iterations):
+                started = time.perf_counter()
+                tops[name] = rank(candidates, SCORER_INTEREST_CATEGORY_IDS, SCORER_LIMIT)
+                elapsed = time.perf_counter() - started
+                if number >= warmup:
+                    latencies.append(elapsed * 1000)
+            timings[name] = summarize(latencies)
+        return {
+            'size': size,
+            'limit': SCORER_LIMIT,
+            'vectorized_ms': timings['vectorized'],
+            'scalar_ms': timings['scalar'],
+            'speedup': round(timings['scalar']['p50'] / max(timings['vectorized']['p50'], 1e-3), 1),
+            'same_top': tops['vectorized'] == tops['scalar'],
+        }
@@ -0,0 +1,234 @@
+"""
+Метрики запросов к API
+MetricsMiddleware для каждого запроса к /api/ считает число SQL-запросов и время в БД
+(execute_wrapper), время сериализации (BaseSerializer.data, включая запросы из сериализатора)
+и общее время ответа. Значения копятся по представлениям в скользящих окнах последних WINDOW
+запросов (процентили и гистограмма времени ответа) в памяти процесса и отдаются
+в /api/_metrics. Медленные запросы (SLOW_REQUEST_MS или SLOW_QUERY_COUNT) пишутся в лог
+вместе с их SQL. Настройки - METRICS.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени ответа, мс
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+
+
+def _settings():
+    return getattr(settings, 'METRICS', {})
+
+
+def percentile(ordered, fraction):
+    """Процентиль по отсортированному списку (ближайший ранг)"""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RollingHistogram:
+    """Последние window значений и общее число наблюдений"""
+
+    def __init__(self, window, buckets=None):
+        self.samples = deque(maxlen=window)
+        self.buckets = buckets
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        result = {
+            'count': self.count,
+            'mean': round(sum(ordered) / len(ordered), 2) if ordered else 0,
+            'p50': round(percentile(ordered, 0.50), 2),
+            'p95': round(percentile(ordered, 0.95), 2),
+            'p99': round(percentile(ordered, 0.99), 2),
+            'max': round(ordered[-1], 2) if ordered else 0,
+        }
+        if self.buckets:
+            counts = {f'le_{bound}': 0 for bound in self.buckets}
+            counts['inf'] = 0
+            for value in ordered:
+                bound = next((bound for bound in self.buckets if value <= bound), None)
+                counts[f'le_{bound}' if bound is not None else 'inf'] += 1
+            result['histogram'] = counts
+        return result
+
+
+class ViewMetrics:
+    """Метрики одного представления (метод + имя маршрута)"""
+
+    def __init__(self, window):
+        self.requests = 0
+        self.errors = 0
+        self.slow = 0
+        self.latency_ms = RollingHistogram(window, LATENCY_BUCKETS_MS)
+        self.db_ms = RollingHistogram(window)
+        self.queries = RollingHistogram(window)
+        self.serializer_ms = RollingHistogram(window)
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'slow': self.slow,
+            'latency_ms': self.latency_ms.summary(),
+            'db_ms': self.db_ms.summary(),
+            'queries': self.queries.summary(),
+            'serializer_ms': self.serializer_ms.summary(),
+        }
+
+
+class RequestStats:
+    """Счетчики текущего запроса; wrapper подключается через connection.execute_wrapper"""
+
+    def __init__(self, sql_limit):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.in_serializer = False
+        self.sql = []
+        self.sql_limit = sql_limit
+
+    def wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            if len(self.sql) < self.sql_limit:
+                self.sql.append((duration, sql))
+
+
+class MetricsRegistry:
+    """Метрики по представлениям в памяти процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.started_at = time.time()
+
+    def record(self, key, status_code, latency, stats, slow):
+        window = _settings().get('WINDOW', 1000)
+        with self.lock:
+            metrics = self.views.get(key)
+            if metrics is None:
+                metrics = self.views[key] = ViewMetrics(window)
+            metrics.requests += 1
+            if status_code >= 500:
+                metrics.errors += 1
+            if slow:
+                metrics.slow += 1
+            metrics.latency_ms.add(latency * 1000)
+            metrics.db_ms.add(stats.db_time * 1000)
+            metrics.queries.add(stats.queries)
+            metrics.serializer_ms.add(stats.serializer_time * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started_at),
+                'views': {key: metrics.summary() for key, metrics in sorted(self.views.items())},
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.started_at = time.time()
+
+
+metrics_registry = MetricsRegistry()
+
+
+def current_stats():
+    """Счетчики запроса, который обрабатывает текущий поток (None вне MetricsMiddleware)"""
+    return getattr(_local, 'stats', None)
+
+
+def view_key(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return f'{request.method} <не найден>'
+    return f'{request.method} {match.view_name or match.route}'
+
+
+class MetricsMiddleware:
+    """Замер числа запросов к БД, времени в БД, сериализации и ответа для запросов к API"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = _settings()
+        if not options.get('ENABLED', True) or not request.path.startswith(options.get('PATH_PREFIX', '/api/')):
+            return self.get_response(request)
+
+        stats = RequestStats(options.get('SLOW_SQL_LIMIT', 20))
+        _local.stats = stats
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.wrapper))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        latency = time.perf_counter() - started
+
+        slow = (
+            latency * 1000 >= options.get('SLOW_REQUEST_MS', 500)
+            or stats.queries >= options.get('SLOW_QUERY_COUNT', 50)
+        )
+        key = view_key(request)
+        metrics_registry.record(key, response.status_code, latency, stats, slow)
+        if slow:
+            self.log_slow_request(request, key, response, latency, stats)
+        return response
+
+    def log_slow_request(self, request, key, response, latency, stats):
+        lines = [f'  {duration * 1000:.1f} мс: {sql}' for duration, sql in stats.sql]
+        if stats.queries > len(stats.sql):
+            lines.append(f'  ... и еще {stats.queries - len(stats.sql)} запросов')
+        logger.warning(
+            'Медленный запрос %s (%s) -> %s: %.0f мс, SQL: %d за %.0f мс, сериализация %.0f мс\n%s',
+            request.get_full_path(), key, response.status_code, latency * 1000,
+            stats.queries, stats.db_time * 1000, stats.serializer_time * 1000, '\n'.join(lines)
+        )
+
+
+def instrument_serializers():
+    """Замер времени BaseSerializer.data (вложенные вызовы не суммируются); вызывается в ApiConfig.ready"""
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data.fget
+    if getattr(original, 'instrumented', False):
+        return
+
+    def data(self):
+        stats = current_stats()
+        if stats is None or stats.in_serializer:
+            return original(self)
+        stats.in_serializer = True
+        started = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.in_serializer = False
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
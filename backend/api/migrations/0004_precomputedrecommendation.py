@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_news'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rec_type', models.CharField(choices=[('ngos', 'НКО'), ('events', 'События')], max_length=10, verbose_name='Тип рекомендаций')),
+                ('item_ids', models.JSONField(default=list, verbose_name='ID рекомендованных объектов')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчета')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_recommendations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Предрассчитанная рекомендация',
+                'verbose_name_plural': 'Предрассчитанные рекомендации',
+                'unique_together': {('user', 'rec_type')},
+            },
+        ),
+    ]
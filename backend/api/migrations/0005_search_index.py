@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Строки индекса FTS5 получают rowid по типу и id документа (см. api.search.doc_rowid)"""
+    from api.search import FTS_TABLE, SEARCH_DOCUMENTS, SQLiteFTSBackend, PostgresSearchBackend
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"doc_type UNINDEXED, doc_id UNINDEXED, title, body, "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        backend = SQLiteFTSBackend()
+        for doc_type, config in SEARCH_DOCUMENTS.items():
+            model = apps.get_model(config['model'])
+            backend.rebuild(doc_type, model.objects.filter(**config['filter']).iterator())
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        backend = PostgresSearchBackend()
+        for doc_type, config in SEARCH_DOCUMENTS.items():
+            model = apps.get_model(config['model'])
+            schema_editor.add_index(model, GinIndex(backend.vector(doc_type), name=f'api_{doc_type}_search_gin'))
+
+
+def drop_search_index(apps, schema_editor):
+    from api.search import FTS_TABLE, SEARCH_DOCUMENTS, PostgresSearchBackend
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        backend = PostgresSearchBackend()
+        for doc_type, config in SEARCH_DOCUMENTS.items():
+            model = apps.get_model(config['model'])
+            schema_editor.remove_index(model, GinIndex(backend.vector(doc_type), name=f'api_{doc_type}_search_gin'))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0004_precomputedrecommendation"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='api_event_event_d_e1b72f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='news',
+            name='api_news_status_793508_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_date', 'id'], name='api_event_event_d_b29012_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['-created_at', '-id'], name='api_materia_created_22f213_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='api_news_status_c0e023_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['-created_at', '-id'], name='api_news_created_c0807f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ngo',
+            index=models.Index(fields=['status', '-rating', '-created_at', '-id'], name='api_ngo_status_7165dc_idx'),
+        ),
+    ]
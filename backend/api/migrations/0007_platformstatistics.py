@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_ngos', models.IntegerField(default=0, verbose_name='Одобренных НКО')),
+                ('total_events', models.IntegerField(default=0, verbose_name='Предстоящих событий')),
+                ('total_users', models.IntegerField(default=0, verbose_name='Пользователей')),
+                ('total_registrations', models.IntegerField(default=0, verbose_name='Регистраций на события')),
+                ('categories', models.JSONField(default=list, verbose_name='НКО по категориям')),
+                ('events_valid_until', models.DateTimeField(blank=True, null=True, verbose_name='Ближайшее событие')),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата сверки')),
+            ],
+            options={
+                'verbose_name': 'Статистика платформы',
+                'verbose_name_plural': 'Статистика платформы',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+def fill_quadkeys(apps, schema_editor):
+    from api.geo import quadkey_for
+
+    NGO = apps.get_model('api', 'NGO')
+    batch = []
+    for ngo in NGO.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True).only('id', 'latitude', 'longitude').iterator():
+        ngo.quadkey = quadkey_for(ngo.latitude, ngo.longitude)
+        batch.append(ngo)
+        if len(batch) >= 1000:
+            NGO.objects.bulk_update(batch, ['quadkey'])
+            batch = []
+    NGO.objects.bulk_update(batch, ['quadkey'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_platformstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ngo',
+            name='quadkey',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Quadkey'),
+        ),
+        migrations.AddIndex(
+            model_name='ngo',
+            index=models.Index(fields=['status', 'quadkey'], name='api_ngo_status_c5dcaa_idx'),
+        ),
+        migrations.RunPython(fill_quadkeys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_rtree(apps, schema_editor):
+    from api.spatial import RTREE_TABLE
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lng, max_lng)'
+    )
+    NGO = apps.get_model('api', 'NGO')
+    rows = NGO.objects.filter(
+        status='approved', latitude__isnull=False, longitude__isnull=False
+    ).values_list('id', 'latitude', 'longitude')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)',
+            [(pk, lat, lat, lng, lng) for pk, lat, lng in rows.iterator()]
+        )
+
+
+def drop_rtree(apps, schema_editor):
+    from api.spatial import RTREE_TABLE
+
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {RTREE_TABLE}')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_ngo_quadkey"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ngo_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ngo',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Хеш строки импорта'),
+        ),
+        migrations.AlterField(
+            model_name='ngo',
+            name='status',
+            field=models.CharField(choices=[('pending', 'На модерации'), ('approved', 'Одобрено'), ('rejected', 'Отклонено'), ('archived', 'В архиве')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+    ]
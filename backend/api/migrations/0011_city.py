@@ -0,0 +1,95 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+NO_CITY = 'Не указан'
+
+
+def fill_cities(apps, schema_editor):
+    """Справочник из городов НКО и новостей; поля city переписываются на канонические названия"""
+    from api.text import city_key, clean_city
+
+    City = apps.get_model('api', 'City')
+    CityAlias = apps.get_model('api', 'CityAlias')
+    models_with_city = [apps.get_model('api', name) for name in ('NGO', 'News', 'User')]
+
+    def distinct_cities(model):
+        return [
+            value for value in model.objects.values_list('city', flat=True).distinct()
+            if value and value.strip() and value.strip() != NO_CITY
+        ]
+
+    # Ключ варианта написания -> (название города, написание)
+    aliases = {}
+    for model in models_with_city[:2]:
+        for value in distinct_cities(model):
+            name = clean_city(value)
+            name_key = city_key(name)
+            if not name_key:
+                continue
+            name = aliases.setdefault(name_key, (name, name))[0]
+            aliases.setdefault(city_key(value), (name, value.strip()))
+
+    names = sorted({name for name, _ in aliases.values()})
+    City.objects.bulk_create([City(name=name) for name in names], batch_size=500)
+    ids = dict(City.objects.values_list('name', 'id'))
+    CityAlias.objects.bulk_create(
+        [CityAlias(city_id=ids[name], name=spelling, key=key) for key, (name, spelling) in aliases.items()],
+        batch_size=500
+    )
+
+    # Город пользователя, которого нет в справочнике, только очищается от региона
+    for model in models_with_city:
+        for value in distinct_cities(model):
+            canonical = next(
+                (aliases[key][0] for key in (city_key(value), city_key(clean_city(value))) if key in aliases),
+                clean_city(value)
+            )
+            if canonical != value:
+                model.objects.filter(city=value).update(city=canonical)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_ngo_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Город',
+                'verbose_name_plural': 'Города',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CityAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Написание')),
+                ('key', models.CharField(editable=False, max_length=100, unique=True, verbose_name='Ключ')),
+            ],
+            options={
+                'verbose_name': 'Вариант названия города',
+                'verbose_name_plural': 'Варианты названий городов',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['city'], name='api_user_city_793b27_idx'),
+        ),
+        migrations.AddField(
+            model_name='cityalias',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='api.city', verbose_name='Город'),
+        ),
+        migrations.RunPython(fill_cities, migrations.RunPython.noop),
+    ]
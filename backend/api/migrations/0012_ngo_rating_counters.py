@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:45
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_counters(apps, schema_editor):
+    NGO = apps.get_model('api', 'NGO')
+    Review = apps.get_model('api', 'Review')
+    batch = []
+    totals = (
+        Review.objects.order_by().values('ngo_id')
+        .annotate(total=Sum('rating'), count=Count('id')).values_list('ngo_id', 'total', 'count')
+    )
+    for ngo_id, total, count in totals.iterator():
+        batch.append(NGO(pk=ngo_id, rating_sum=total, rating_count=count, rating=total / count))
+        if len(batch) >= 1000:
+            NGO.objects.bulk_update(batch, ['rating_sum', 'rating_count', 'rating'])
+            batch = []
+    NGO.objects.bulk_update(batch, ['rating_sum', 'rating_count', 'rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_city'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ngo',
+            name='rating_count',
+            field=models.IntegerField(default=0, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='ngo',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_activity_summary(apps, schema_editor):
+    """Сводка активности по существующей истории"""
+    from django.db.models import Case, Count, IntegerField, Max, When
+
+    ActivityHistory = apps.get_model('api', 'ActivityHistory')
+    ActivitySummary = apps.get_model('api', 'ActivitySummary')
+    fields = {'view': 'views_count', 'favorite': 'favorites_count', 'review': 'reviews_count'}
+    counters = {
+        field: Count(Case(When(activity_type=activity_type, then=1), output_field=IntegerField()))
+        for activity_type, field in fields.items()
+    }
+    rows = (
+        ActivityHistory.objects.filter(ngo__isnull=False, activity_type__in=fields)
+        .values('user_id', 'ngo_id')
+        .annotate(last_activity_at=Max('created_at'), **counters)
+        .order_by()
+    )
+    ActivitySummary.objects.bulk_create([ActivitySummary(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_ngo_rating_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_type', models.CharField(choices=[('view', 'Просмотр'), ('favorite', 'Добавлено в избранное'), ('event_registration', 'Регистрация на событие'), ('review', 'Отзыв')], max_length=20, verbose_name='Тип активности')),
+                ('metadata', models.JSONField(blank=True, default=dict, verbose_name='Метаданные')),
+                ('created_at', models.DateTimeField(verbose_name='Дата активности')),
+                ('month', models.DateField(db_index=True, verbose_name='Месяц')),
+            ],
+            options={
+                'verbose_name': 'Архивное событие активности',
+                'verbose_name_plural': 'Архив истории активности',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivitySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views_count', models.IntegerField(default=0, verbose_name='Просмотров')),
+                ('favorites_count', models.IntegerField(default=0, verbose_name='Добавлений в избранное')),
+                ('reviews_count', models.IntegerField(default=0, verbose_name='Отзывов')),
+                ('last_activity_at', models.DateTimeField(verbose_name='Последняя активность')),
+            ],
+            options={
+                'verbose_name': 'Сводка активности',
+                'verbose_name_plural': 'Сводки активности',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activityhistory',
+            index=models.Index(fields=['created_at'], name='api_activit_created_654590_idx'),
+        ),
+        migrations.AddField(
+            model_name='activitysummary',
+            name='ngo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.ngo', verbose_name='НКО'),
+        ),
+        migrations.AddField(
+            model_name='activitysummary',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_summary', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='activityhistoryarchive',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.event', verbose_name='Событие'),
+        ),
+        migrations.AddField(
+            model_name='activityhistoryarchive',
+            name='ngo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.ngo', verbose_name='НКО'),
+        ),
+        migrations.AddField(
+            model_name='activityhistoryarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activitysummary',
+            unique_together={('user', 'ngo')},
+        ),
+        migrations.RunPython(fill_activity_summary, migrations.RunPython.noop),
+    ]
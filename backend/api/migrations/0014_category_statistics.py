@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_category_statistics(apps, schema_editor):
+    """Счетчики категорий по существующим НКО (раньше хранились списком в PlatformStatistics)"""
+    from django.db.models import Count, Q
+
+    Category = apps.get_model('api', 'Category')
+    CategoryStatistics = apps.get_model('api', 'CategoryStatistics')
+    counts = Category.objects.annotate(ngo_count=Count('ngos', filter=Q(ngos__status='approved')))
+    CategoryStatistics.objects.bulk_create(
+        [CategoryStatistics(category_id=pk, approved_ngos=count) for pk, count in counts.values_list('id', 'ngo_count')],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_activity_archive_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStatistics',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='api.category', verbose_name='Категория')),
+                ('approved_ngos', models.IntegerField(default=0, verbose_name='Одобренных НКО')),
+            ],
+            options={
+                'verbose_name': 'Статистика категории',
+                'verbose_name_plural': 'Статистика категорий',
+            },
+        ),
+        migrations.RunPython(fill_category_statistics, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='platformstatistics',
+            name='categories',
+        ),
+    ]
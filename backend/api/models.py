@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .geo import quadkey_for
+from .text import city_key
+
 
 class User(AbstractUser):
     """Расширенная модель пользователя"""
@@ -17,6 +20,9 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            models.Index(fields=['city']),
+        ]
 
     def __str__(self):
         return self.username
@@ -38,12 +44,45 @@ class Category(models.Model):
         return self.name
 
 
+class City(models.Model):
+    """Город: поля city у НКО, новостей и пользователей хранят его каноническое название"""
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название')
+
+    class Meta:
+        verbose_name = 'Город'
+        verbose_name_plural = 'Города'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class CityAlias(models.Model):
+    """Вариант написания города ("Глазов, УР", "г. Глазов"); key - нормализованное написание"""
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='aliases', verbose_name='Город')
+    name = models.CharField(max_length=100, verbose_name='Написание')
+    key = models.CharField(max_length=100, unique=True, editable=False, verbose_name='Ключ')
+
+    class Meta:
+        verbose_name = 'Вариант названия города'
+        verbose_name_plural = 'Варианты названий городов'
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} -> {self.city.name}"
+
+    def save(self, *args, **kwargs):
+        self.key = city_key(self.name)
+        super().save(*args, **kwargs)
+
+
 class NGO(models.Model):
     """Некоммерческая организация"""
     STATUS_CHOICES = [
         ('pending', 'На модерации'),
         ('approved', 'Одобрено'),
         ('rejected', 'Отклонено'),
+        ('archived', 'В архиве'),  # Отсутствует в последнем импорте CSV (load_csv_data --soft-delete)
     ]
 
     name = models.CharField(max_length=200, verbose_name='Название')
@@ -61,6 +100,9 @@ class NGO(models.Model):
     
     # Статистика
     rating = models.FloatField(default=0.0, validators=[MinValueValidator(0), MaxValueValidator(5)], verbose_name='Рейтинг')
+    # Сумма и число оценок отзывов, rating = rating_sum / rating_count (см. ratings.py)
+    rating_sum = models.IntegerField(default=0, verbose_name='Сумма оценок')
+    rating_count = models.IntegerField(default=0, verbose_name='Количество оценок')
     participants_count = models.IntegerField(default=0, verbose_name='Количество участников')
     events_count = models.IntegerField(default=0, verbose_name='Количество событий')
     
@@ -73,6 +115,10 @@ class NGO(models.Model):
     # Координаты для карты
     latitude = models.FloatField(null=True, blank=True, verbose_name='Широта')
     longitude = models.FloatField(null=True, blank=True, verbose_name='Долгота')
+    # Quadkey тайла с координатами (см. geo.py), заполняется при сохранении
+    quadkey = models.CharField(max_length=32, blank=True, default='', editable=False, verbose_name='Quadkey')
+    # Хеш строки CSV, из которой НКО загружена последний раз (load_csv_data --mode upsert)
+    import_hash = models.CharField(max_length=40, blank=True, default='', editable=False, verbose_name='Хеш строки импорта')
 
     class Meta:
         verbose_name = 'НКО'
@@ -81,11 +127,20 @@ class NGO(models.Model):
         indexes = [
             models.Index(fields=['city', 'status']),
             models.Index(fields=['category', 'status']),
+            models.Index(fields=['status', '-rating', '-created_at', '-id']),
+            models.Index(fields=['status', 'quadkey']),
         ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.quadkey = quadkey_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'quadkey'}
+        super().save(*args, **kwargs)
+
 
 class Favorite(models.Model):
     """Избранные НКО пользователя"""
@@ -120,7 +175,7 @@ class Event(models.Model):
         verbose_name_plural = 'События'
         ordering = ['event_date']
         indexes = [
-            models.Index(fields=['event_date']),
+            models.Index(fields=['event_date', 'id']),
             models.Index(fields=['ngo']),
         ]
 
@@ -192,12 +247,50 @@ class ActivityHistory(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'activity_type']),
+            models.Index(fields=['created_at']),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_activity_type_display()}"
 
 
+class ActivityHistoryArchive(models.Model):
+    """Архив истории активности: события старше срока хранения (archive_activity), по месяцам"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    activity_type = models.CharField(max_length=20, choices=ActivityHistory.ACTIVITY_TYPES, verbose_name='Тип активности')
+    ngo = models.ForeignKey(NGO, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='НКО')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='Событие')
+    metadata = models.JSONField(default=dict, blank=True, verbose_name='Метаданные')
+    created_at = models.DateTimeField(verbose_name='Дата активности')
+    month = models.DateField(db_index=True, verbose_name='Месяц')
+
+    class Meta:
+        verbose_name = 'Архивное событие активности'
+        verbose_name_plural = 'Архив истории активности'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user_id} - {self.get_activity_type_display()} ({self.month:%m.%Y})"
+
+
+class ActivitySummary(models.Model):
+    """Сводка активности пользователя по НКО (все события, включая архивные) для рекомендаций"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_summary', verbose_name='Пользователь')
+    ngo = models.ForeignKey(NGO, on_delete=models.CASCADE, related_name='+', verbose_name='НКО')
+    views_count = models.IntegerField(default=0, verbose_name='Просмотров')
+    favorites_count = models.IntegerField(default=0, verbose_name='Добавлений в избранное')
+    reviews_count = models.IntegerField(default=0, verbose_name='Отзывов')
+    last_activity_at = models.DateTimeField(verbose_name='Последняя активность')
+
+    class Meta:
+        verbose_name = 'Сводка активности'
+        verbose_name_plural = 'Сводки активности'
+        unique_together = ['user', 'ngo']
+
+    def __str__(self):
+        return f"{self.user_id} - {self.ngo_id}"
+
+
 class ModerationRequest(models.Model):
     """Заявки на модерацию"""
     STATUS_CHOICES = [
@@ -271,6 +364,9 @@ class Material(models.Model):
         verbose_name = 'Материал'
         verbose_name_plural = 'Материалы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
 
     def __str__(self):
         return self.title
@@ -319,9 +415,62 @@ class News(models.Model):
         verbose_name_plural = 'Новости'
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
             models.Index(fields=['city']),
         ]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+class PrecomputedRecommendation(models.Model):
+    """Предрассчитанные рекомендации пользователя (заполняются командой precompute_recommendations)"""
+    REC_TYPES = [
+        ('ngos', 'НКО'),
+        ('events', 'События'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='precomputed_recommendations', verbose_name='Пользователь')
+    rec_type = models.CharField(max_length=10, choices=REC_TYPES, verbose_name='Тип рекомендаций')
+    item_ids = models.JSONField(default=list, verbose_name='ID рекомендованных объектов')
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+
+    class Meta:
+        verbose_name = 'Предрассчитанная рекомендация'
+        verbose_name_plural = 'Предрассчитанные рекомендации'
+        unique_together = ['user', 'rec_type']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_rec_type_display()}"
+
+
+class PlatformStatistics(models.Model):
+    """Снимок статистики платформы (одна строка с pk=1, обновляется счетчиками в signals.py)"""
+    total_ngos = models.IntegerField(default=0, verbose_name='Одобренных НКО')
+    total_events = models.IntegerField(default=0, verbose_name='Предстоящих событий')
+    total_users = models.IntegerField(default=0, verbose_name='Пользователей')
+    total_registrations = models.IntegerField(default=0, verbose_name='Регистраций на события')
+    events_valid_until = models.DateTimeField(null=True, blank=True, verbose_name='Ближайшее событие')
+    reconciled_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата сверки')
+
+    class Meta:
+        verbose_name = 'Статистика платформы'
+        verbose_name_plural = 'Статистика платформы'
+
+    def __str__(self):
+        return f"Статистика ({self.reconciled_at})"
+
+
+class CategoryStatistics(models.Model):
+    """Число одобренных НКО в категории (строка на категорию, меняется UPDATE с F() в statistics.py)"""
+    category = models.OneToOneField(
+        Category, on_delete=models.CASCADE, primary_key=True, related_name='statistics', verbose_name='Категория'
+    )
+    approved_ngos = models.IntegerField(default=0, verbose_name='Одобренных НКО')
+
+    class Meta:
+        verbose_name = 'Статистика категории'
+        verbose_name_plural = 'Статистика категорий'
+
+    def __str__(self):
+        return f"{self.category_id}: {self.approved_ngos}"
@@ -0,0 +1,121 @@
+"""
+Пагинация API
+По умолчанию - постраничная (page=N, с общим количеством). Если в запросе есть
+параметр cursor (для первой страницы - пустой), а у view задан cursor_ordering,
+используется keyset-пагинация: следующая страница выбирается условием по значениям
+полей сортировки последнего элемента, без COUNT(*) и OFFSET. Keyset-пагинация задает
+свой порядок, поэтому с ?ordering= или ?search= (порядок по релевантности) используется
+постраничная: ссылка next в ответе есть в обоих режимах.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Keyset-пагинация по составному ключу сортировки
+
+    Последнее поле ordering должно быть уникальным (id), чтобы порядок был строгим.
+    Курсор - base64 от JSON со значениями полей сортировки последнего элемента.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = list(ordering)
+        self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after_position_filter(position))
+
+        # Берем на один элемент больше, чтобы узнать, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def after_position_filter(self, position):
+        """(f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... с учетом направления каждого поля"""
+        condition = Q()
+        equal_prefix = Q()
+        for (field, descending), value in zip(self.fields(), position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal_prefix & Q(**{f'{field}__{lookup}': value})
+            equal_prefix &= Q(**{field: value})
+        return condition
+
+    def fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for field, _ in self.fields():
+            value = getattr(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            fields = self.fields()
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for (field, _), value in zip(fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class HybridPagination(PageNumberPagination):
+    """PageNumberPagination с опциональным режимом ?cursor= для бесконечной прокрутки"""
+    cursor_query_param = KeysetPagination.cursor_query_param
+    # Параметры, задающие порядок, несовместимый с курсором
+    ordering_query_params = (api_settings.ORDERING_PARAM, api_settings.SEARCH_PARAM)
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'cursor_ordering', None) or self.cursor_query_param not in request.query_params:
+            return False
+        return not any(request.query_params.get(param) for param in self.ordering_query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_ordering = getattr(view, 'cursor_ordering', None)
+        self.keyset = None
+        if self.use_keyset(request, view):
+            self.keyset = KeysetPagination(cursor_ordering, self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,65 @@
+"""
+Рейтинг НКО
+У НКО хранятся сумма и число оценок отзывов (rating_sum, rating_count), rating - их отношение.
+Сигналы отзывов меняют все три поля одним UPDATE с выражениями F(): отзывы не читаются,
+параллельные запросы не теряют изменения. Массовые операции без сигналов исправляет
+команда reconcile_ratings.
+"""
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import NGO, Review
+
+
+def adjust(ngo_id, delta_sum, delta_count):
+    """
+    Изменение суммы и числа оценок НКО
+
+    В UPDATE правые части вычисляются по значениям до изменения, поэтому новый рейтинг
+    считается из старых счетчиков и тех же приращений.
+    """
+    NGO.objects.filter(pk=ngo_id).update(
+        rating_sum=F('rating_sum') + delta_sum,
+        rating_count=F('rating_count') + delta_count,
+        rating=Case(
+            When(
+                rating_count__gt=-delta_count,
+                then=Cast(F('rating_sum') + delta_sum, FloatField()) / (F('rating_count') + delta_count),
+            ),
+            default=Value(0.0),
+        ),
+        # updated_at входит в ETag ответов с НКО
+        updated_at=timezone.now(),
+    )
+
+
+def reconcile(batch_size=500):
+    """
+    Пересчет счетчиков по отзывам
+
+    Возвращает словарь расхождений {id НКО: ((сумма, число), (сумма, число))}. Рейтинг НКО
+    без отзывов, у которой и раньше не было оценок, не меняется.
+    """
+    totals = {
+        ngo_id: (total, count)
+        for ngo_id, total, count in Review.objects.order_by().values('ngo_id')
+        .annotate(total=Sum('rating'), count=Count('id')).values_list('ngo_id', 'total', 'count')
+    }
+    now = timezone.now()
+    drift = {}
+    fixed = []
+    rows = NGO.objects.order_by('id').values_list('id', 'rating_sum', 'rating_count', 'rating')
+    for pk, rating_sum, rating_count, rating in rows.iterator(chunk_size=10000):
+        actual_sum, actual_count = totals.get(pk, (0, 0))
+        if actual_count:
+            expected = actual_sum / actual_count
+        else:
+            expected = rating if rating_count == 0 else 0.0
+        if (rating_sum, rating_count) != (actual_sum, actual_count) or abs(rating - expected) > 1e-9:
+            drift[pk] = ((rating_sum, rating_count), (actual_sum, actual_count))
+            fixed.append(NGO(
+                pk=pk, rating_sum=actual_sum, rating_count=actual_count, rating=expected, updated_at=now
+            ))
+    NGO.objects.bulk_update(fixed, ['rating_sum', 'rating_count', 'rating', 'updated_at'], batch_size=batch_size)
+    return drift
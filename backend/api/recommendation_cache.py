@@ -0,0 +1,123 @@
+"""
+Кеш рекомендаций
+Хранит id рекомендованных НКО и событий для каждого пользователя в памяти процесса
+с ограничением по времени жизни (TTL) и вытеснением давно неиспользуемых записей (LRU).
+Записи пользователя сбрасываются сигналами (см. signals.py) при изменении его
+избранного, истории, отзывов, регистраций, интересов или города. Сброс должен дойти до всех
+процессов, поэтому каждая запись хранит версию пользователя (и всего кеша) из общего кеша версий
+response_cache и при чтении сверяется с ней; сброс увеличивает версию. Если версии не общие
+(LocMemCache при нескольких воркерах), кеш не используется.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .response_cache import get_versions, bump_version, versions_shared
+
+# Ключи версий в кеше версий response_cache
+GLOBAL_VERSION_KEY = 'recommendations'
+USER_VERSION_PREFIX = 'recommendations:user:'
+
+
+class RecommendationCache:
+    """LRU-кеш с TTL для списков id рекомендаций"""
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, rec_type, limit) -> (expires_at, version, ids)
+        self._keys_by_user = {}  # user_id -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def version(self, user_id):
+        """
+        Текущая версия записей пользователя (общая для процессов) или None, если кеш не используется.
+        Берется до расчета рекомендаций: сброс во время расчета сделает результат неактуальным.
+        """
+        if not versions_shared():
+            return None
+        return tuple(get_versions([GLOBAL_VERSION_KEY, f'{USER_VERSION_PREFIX}{user_id}']))
+
+    def get(self, user_id, rec_type, limit, version):
+        """Возвращает список id или None, если записи нет, она устарела или сброшена"""
+        if version is None:
+            return None
+        key = (user_id, rec_type, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, entry_version, ids = entry
+            if expires_at <= time.monotonic() or entry_version != version:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(ids)
+
+    def set(self, user_id, rec_type, limit, ids, version):
+        if version is None:
+            return
+        key = (user_id, rec_type, limit)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, tuple(ids))
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает все записи пользователя во всех процессах"""
+        bump_version(f'{USER_VERSION_PREFIX}{user_id}')
+        with self._lock:
+            keys = self._keys_by_user.pop(user_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            if keys:
+                self.invalidations += 1
+
+    def clear(self):
+        """Сбрасывает все записи во всех процессах"""
+        bump_version(GLOBAL_VERSION_KEY)
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self):
+        """Счетчики для мониторинга"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        user_keys = self._keys_by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[key[0]]
+
+
+_cache_settings = getattr(settings, 'RECOMMENDATIONS_CACHE', {})
+
+recommendation_cache = RecommendationCache(
+    ttl=_cache_settings.get('TTL', 300),
+    max_entries=_cache_settings.get('MAX_ENTRIES', 10000),
+)
@@ -1,8 +1,9 @@
 """
 Модуль для AI-рекомендаций
-Реализует алгоритм рекомендаций на основе правил и опционально внешние AI-сервисы
+Реализует алгоритм рекомендаций на основе правил и по смысловой близости описаний НКО
+(локальный индекс эмбеддингов, см. similarity.py)
 """
-from django.conf import settings
+from .recommendation_cache import recommendation_cache
 
 
 def get_recommendations(user, rec_type='ngos', limit=5):
@@ -11,22 +12,80 @@ def get_recommendations(user, rec_type='ngos', limit=5):
     
     Args:
         user: Объект пользователя
-        rec_type: Тип рекомендаций ('ngos' или 'events')
+        rec_type: Тип рекомендаций ('ngos', 'events' или 'similar' - НКО по близости описаний)
         limit: Количество рекомендаций
     
     Returns:
         Список рекомендованных объектов
     """
-    if rec_type == 'ngos':
-        return get_ngo_recommendations(user, limit)
-    elif rec_type == 'events':
-        return get_event_recommendations(user, limit)
-    return []
+    if rec_type not in ('ngos', 'events', 'similar'):
+        return []
+    
+    # Сначала пробуем кеш id рекомендаций
+    version = recommendation_cache.version(user.id)
+    cached_ids = recommendation_cache.get(user.id, rec_type, limit, version)
+    if cached_ids is not None:
+        return load_recommended_objects(rec_type, cached_ids)
+    
+    # Затем результаты офлайн-расчета (команда precompute_recommendations); список берется
+    # целиком, чтобы после отсева неактуальных объектов хватило на limit
+    precomputed_ids = get_precomputed_ids(user, rec_type)
+    if precomputed_ids is not None:
+        recommended = load_recommended_objects(rec_type, precomputed_ids)[:limit]
+    elif rec_type == 'ngos':
+        recommended = get_ngo_recommendations(user, limit)
+    elif rec_type == 'similar':
+        recommended = get_similar_ngo_recommendations(user, limit)
+    else:
+        recommended = get_event_recommendations(user, limit)
+    
+    recommendation_cache.set(user.id, rec_type, limit, [obj.id for obj in recommended], version)
+    return recommended
+
+
+def get_precomputed_ids(user, rec_type):
+    """Список id из таблицы предрассчитанных рекомендаций или None"""
+    from .models import PrecomputedRecommendation
+    
+    return PrecomputedRecommendation.objects.filter(
+        user=user,
+        rec_type=rec_type
+    ).values_list('item_ids', flat=True).first()
+
+
+def load_recommended_objects(rec_type, ids):
+    """Загрузка объектов по сохраненным id с сохранением порядка рекомендаций"""
+    from django.db.models import Count
+    from django.utils import timezone
+    from .models import NGO, Event
+    
+    # Фильтры те же, что при расчете: за время жизни кеша или с момента офлайн-расчета
+    # НКО могли снять с публикации, а события - пройти
+    if rec_type in ('ngos', 'similar'):
+        queryset = NGO.objects.filter(status='approved').select_related('category')
+    else:
+        queryset = Event.objects.filter(
+            event_date__gte=timezone.now(),
+            ngo__status='approved'
+        ).select_related('ngo__category').annotate(
+            registrations_count=Count('registrations')
+        )
+    objects_by_id = queryset.in_bulk(ids)
+    # Удаленные и отфильтрованные объекты пропускаем
+    return [objects_by_id[obj_id] for obj_id in ids if obj_id in objects_by_id]
 
 
 def get_ngo_recommendations(user, limit=5):
-    """Рекомендации НКО на основе правил"""
-    from .models import NGO, Favorite, Review, ActivityHistory
+    """
+    Рекомендации НКО на основе правил
+
+    Балл считается одним аннотированным запросом в БД, отбор топ-N выполняется
+    через ORDER BY ... LIMIT, поэтому количество запросов не зависит от
+    размера каталога.
+    """
+    from django.db.models import Case, When, Value, F, FloatField, ExpressionWrapper
+    from django.db.models.functions import Least
+    from .models import NGO, Category, Favorite, Review, ActivitySummary
     
     # Базовый queryset - только одобренные НКО
     ngos = NGO.objects.filter(status='approved')
@@ -35,60 +94,54 @@ def get_ngo_recommendations(user, limit=5):
     if user.city:
         ngos = ngos.filter(city=user.city)
     
-    # Получаем уже просмотренные/избранные НКО
-    favorite_ngo_ids = Favorite.objects.filter(user=user).values_list('ngo_id', flat=True)
-    viewed_ngo_ids = ActivityHistory.objects.filter(
-        user=user,
-        activity_type='view'
-    ).values_list('ngo_id', flat=True)
-    excluded_ids = list(set(list(favorite_ngo_ids) + list(viewed_ngo_ids)))
-    
-    if excluded_ids:
-        ngos = ngos.exclude(id__in=excluded_ids)
+    # Исключаем уже просмотренные/избранные НКО (подзапросами, без выгрузки id);
+    # просмотры берутся из сводки активности, а не из сырой истории
+    ngos = ngos.exclude(
+        id__in=Favorite.objects.filter(user=user).values('ngo_id')
+    ).exclude(
+        id__in=ActivitySummary.objects.filter(user=user, views_count__gt=0).values('ngo_id')
+    )
     
-    # Подсчет баллов для каждого НКО
-    scored_ngos = []
+    # Категории, совпадающие с интересами, и категории, на НКО которых пользователь оставлял отзывы
     user_interests = user.interests or []
+    interest_category_ids = set()
+    if user_interests:
+        interest_category_ids = set(
+            Category.objects.filter(name__in=user_interests).values_list('id', flat=True)
+        )
+    reviewed_category_ids = set(
+        Review.objects.filter(user=user).values_list('ngo__category_id', flat=True)
+    )
     
-    for ngo in ngos:
-        score = 0
-        
-        # Совпадение категории с интересами пользователя
-        if user_interests and ngo.category.name in user_interests:
-            score += 10
-        
+    score = (
         # Популярность (количество участников)
-        score += min(ngo.participants_count / 10, 5)
-        
+        Least(F('participants_count') / Value(10.0), Value(5.0))
         # Активность (количество событий)
-        score += min(ngo.events_count, 5)
-        
+        + Least(F('events_count'), Value(5))
         # Рейтинг
-        score += ngo.rating * 2
-        
+        + F('rating') * Value(2.0)
+        # Совпадение категории с интересами пользователя
+        + Case(
+            When(category_id__in=interest_category_ids, then=Value(10.0)),
+            default=Value(0.0),
+        )
         # Если пользователь оставлял отзывы на похожие НКО
-        similar_reviews = Review.objects.filter(
-            user=user,
-            ngo__category=ngo.category
-        ).count()
-        if similar_reviews > 0:
-            score += 3
-        
-        scored_ngos.append({
-            'ngo': ngo,
-            'score': score
-        })
-    
-    # Сортировка по баллам
-    scored_ngos.sort(key=lambda x: x['score'], reverse=True)
+        + Case(
+            When(category_id__in=reviewed_category_ids, then=Value(3.0)),
+            default=Value(0.0),
+        )
+    )
     
-    # Возвращаем топ-N
-    recommended_ngos = [item['ngo'] for item in scored_ngos[:limit]]
+    recommended_ngos = list(
+        ngos.select_related('category')
+        .annotate(score=ExpressionWrapper(score, output_field=FloatField()))
+        .order_by('-score', '-created_at')[:limit]
+    )
     
     # Если не хватает рекомендаций, добавляем случайные
     if len(recommended_ngos) < limit:
         remaining = limit - len(recommended_ngos)
-        additional = NGO.objects.filter(status='approved').exclude(
+        additional = NGO.objects.filter(status='approved').select_related('category').exclude(
             id__in=[n.id for n in recommended_ngos]
         )[:remaining]
         recommended_ngos.extend(additional)
@@ -96,83 +149,201 @@ def get_ngo_recommendations(user, limit=5):
     return recommended_ngos
 
 
-def get_event_recommendations(user, limit=5):
-    """Рекомендации событий на основе правил"""
-    from .models import Event, EventRegistration, ActivityHistory
+def score_events(category_ids, registrations, ratings, days_until, interest_category_ids):
+    """
+    Векторизованный подсчет баллов событий
+
+    Все аргументы, кроме interest_category_ids, - колонки признаков кандидатов
+    (массивы NumPy одинаковой длины). Правила совпадают с прежним построчным
+    подсчетом, включая порядок сложения слагаемых.
+    """
+    import numpy as np
+    
+    # Совпадение категории НКО с интересами
+    interest = np.where(
+        np.isin(category_ids, list(interest_category_ids)), 10.0, 0.0
+    )
+    
+    # Популярность события
+    popularity = np.minimum(registrations / 5, 5)
+    
+    # Рейтинг НКО
+    rating = ratings * 2
+    
+    # Близость события (чем ближе, тем выше балл)
+    closeness = np.where(days_until <= 7, 5.0, np.where(days_until <= 30, 3.0, 0.0))
+    
+    return interest + popularity + rating + closeness
+
+
+def top_k_indices(scores, k):
+    """
+    Индексы k лучших баллов по убыванию
+
+    Кандидаты отбираются через argpartition за O(N), сортируется только
+    небольшой хвост. При равных баллах сохраняется исходный порядок строк,
+    как при стабильной сортировке всего списка.
+    """
+    import numpy as np
+    
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+        threshold = scores[top].min()
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def load_event_candidates(city=''):
+    """
+    Колонки признаков будущих событий для векторного подсчета баллов
+
+    Выгружаются одним запросом. Результат не зависит от пользователя, кроме
+    города, поэтому его можно переиспользовать для всех пользователей одного
+    города (см. команду precompute_recommendations).
+
+    В отличие от прежнего построчного подсчета кандидаты - только события одобренных
+    НКО: такие же фильтры применяются к спискам из кеша и офлайн-расчета
+    (load_recommended_objects), и выдача не зависит от того, откуда она взята.
+    Порядок оставшихся событий прежний.
+    """
+    import numpy as np
+    from django.db.models import Count
+    from .models import Event
     from django.utils import timezone
     
-    # Будущие события
-    events = Event.objects.filter(event_date__gte=timezone.now())
+    # Будущие события одобренных НКО
+    events = Event.objects.filter(event_date__gte=timezone.now(), ngo__status='approved')
     
     # Фильтр по городу пользователя
-    if user.city:
-        events = events.filter(ngo__city=user.city)
+    if city:
+        events = events.filter(ngo__city=city)
     
-    # Исключаем уже зарегистрированные события
-    registered_event_ids = EventRegistration.objects.filter(
-        user=user
-    ).values_list('event_id', flat=True)
+    rows = list(
+        events.annotate(registrations_total=Count('registrations'))
+        .order_by('event_date', 'id')
+        .values_list('id', 'event_date', 'ngo__category_id', 'ngo__rating', 'registrations_total')
+    )
+    if not rows:
+        ids = event_dates = category_ids = ratings = registrations = ()
+    else:
+        ids, event_dates, category_ids, ratings, registrations = zip(*rows)
     
-    if registered_event_ids:
-        events = events.exclude(id__in=registered_event_ids)
+    today = timezone.now().date().toordinal()
+    return {
+        'ids': np.array(ids, dtype=np.int64),
+        'category_ids': np.array(category_ids, dtype=np.int64),
+        'registrations': np.array(registrations, dtype=np.float64),
+        'ratings': np.array(ratings, dtype=np.float64),
+        'days_until': np.fromiter(
+            (event_date.date().toordinal() - today for event_date in event_dates),
+            dtype=np.int64,
+            count=len(rows)
+        ),
+    }
+
+
+def rank_event_ids(user, limit=5, candidates=None):
+    """
+    ID рекомендованных событий в порядке убывания балла
+
+    Признаки кандидатов берутся из load_event_candidates, баллы считаются
+    векторно (score_events), топ-N - через argpartition (top_k_indices).
+    """
+    import numpy as np
+    from .models import Category, EventRegistration
+    
+    if candidates is None:
+        candidates = load_event_candidates(user.city)
+    
+    # Исключаем уже зарегистрированные события
+    registered_event_ids = list(
+        EventRegistration.objects.filter(user=user).values_list('event_id', flat=True)
+    )
+    keep = ~np.isin(candidates['ids'], registered_event_ids)
+    if not keep.any():
+        return []
     
-    # Подсчет баллов
-    scored_events = []
     user_interests = user.interests or []
+    interest_category_ids = set()
+    if user_interests:
+        interest_category_ids = set(
+            Category.objects.filter(name__in=user_interests).values_list('id', flat=True)
+        )
     
-    for event in events:
-        score = 0
-        
-        # Совпадение категории НКО с интересами
-        if user_interests and event.ngo.category.name in user_interests:
-            score += 10
-        
-        # Популярность события
-        score += min(event.registered_count / 5, 5)
-        
-        # Рейтинг НКО
-        score += event.ngo.rating * 2
-        
-        # Близость события (чем ближе, тем выше балл)
-        days_until = (event.event_date.date() - timezone.now().date()).days
-        if days_until <= 7:
-            score += 5
-        elif days_until <= 30:
-            score += 3
-        
-        scored_events.append({
-            'event': event,
-            'score': score
-        })
-    
-    # Сортировка
-    scored_events.sort(key=lambda x: x['score'], reverse=True)
+    ids = candidates['ids'][keep]
+    scores = score_events(
+        candidates['category_ids'][keep],
+        candidates['registrations'][keep],
+        candidates['ratings'][keep],
+        candidates['days_until'][keep],
+        interest_category_ids,
+    )
+    return [int(ids[i]) for i in top_k_indices(scores, limit)]
+
+
+def get_event_recommendations(user, limit=5):
+    """Рекомендации событий на основе правил (см. rank_event_ids)"""
+    from django.db.models import Count
+    from .models import Event
     
-    # Возвращаем топ-N
-    recommended_events = [item['event'] for item in scored_events[:limit]]
+    top_ids = rank_event_ids(user, limit)
+    events_by_id = Event.objects.select_related('ngo__category').annotate(
+        registrations_count=Count('registrations')
+    ).in_bulk(top_ids)
     
-    return recommended_events
+    # Возвращаем топ-N
+    return [events_by_id[event_id] for event_id in top_ids]
 
 
-def get_ai_recommendations_huggingface(user, ngos, limit=5):
+def get_similar_ngo_recommendations(user, limit=5):
     """
-    Получение рекомендаций через Hugging Face API
-    Требует настройки HUGGINGFACE_API_KEY в settings
+    Рекомендации НКО по смысловой близости описаний (индекс similarity.ngo_index)
+
+    Профиль пользователя - среднее векторов избранных НКО и НКО с его отзывами
+    плюс вектор текста интересов. Если индекс не построен или профиль пуст,
+    используются рекомендации на основе правил.
     """
-    if not settings.HUGGINGFACE_API_KEY:
-        return get_ngo_recommendations(user, limit)
+    from .models import NGO, Favorite, Review, ActivitySummary
+    from .similarity import ngo_index
     
-    try:
-        # Формируем запрос к Hugging Face
-        user_text = f"Интересы: {', '.join(user.interests or [])}. Город: {user.city or 'не указан'}"
-        
-        ngo_texts = [f"{ngo.name}: {ngo.short_description}" for ngo in ngos]
-        
-        # Здесь должна быть логика получения эмбеддингов и сравнения
-        # Упрощенная версия - возвращаем рекомендации на основе правил
+    if not ngo_index.load():
         return get_ngo_recommendations(user, limit)
-        
-    except Exception as e:
-        # В случае ошибки возвращаем рекомендации на основе правил
+    
+    favorite_ngo_ids = set(Favorite.objects.filter(user=user).values_list('ngo_id', flat=True))
+    reviewed_ngo_ids = set(Review.objects.filter(user=user).values_list('ngo_id', flat=True))
+    parts = []
+    seed_vectors = ngo_index.vectors_for(favorite_ngo_ids | reviewed_ngo_ids)
+    if seed_vectors is not None:
+        parts.append(seed_vectors.mean(axis=0))
+    if user.interests:
+        parts.append(ngo_index.encode(' '.join(user.interests)))
+    if not parts:
         return get_ngo_recommendations(user, limit)
-
+    profile = sum(parts)
+    
+    viewed_ngo_ids = set(
+        ActivitySummary.objects.filter(user=user, views_count__gt=0).values_list('ngo_id', flat=True)
+    )
+    excluded_ids = favorite_ngo_ids | viewed_ngo_ids
+    
+    # Берем кандидатов с запасом: часть может не подойти по городу
+    candidate_ids = ngo_index.search(profile, limit * 10, exclude_ids=excluded_ids)
+    candidates = NGO.objects.filter(id__in=candidate_ids, status='approved').select_related('category')
+    if user.city:
+        candidates = candidates.filter(city=user.city)
+    candidates_by_id = candidates.in_bulk()
+    recommended_ngos = [candidates_by_id[ngo_id] for ngo_id in candidate_ids if ngo_id in candidates_by_id][:limit]
+    
+    # Если не хватает рекомендаций, добавляем рекомендации на основе правил
+    if len(recommended_ngos) < limit:
+        recommended_ids = {ngo.id for ngo in recommended_ngos}
+        for ngo in get_ngo_recommendations(user, limit):
+            if ngo.id not in recommended_ids and len(recommended_ngos) < limit:
+                recommended_ngos.append(ngo)
+    
+    return recommended_ngos
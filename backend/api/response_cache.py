@@ -0,0 +1,156 @@
+"""
+Кеш ответов для анонимных GET-запросов
+Ответ кешируется по пути и нормализованным параметрам запроса. В ключ входят версии
+моделей, от которых зависит ответ; сигналы post_save/post_delete увеличивают версию
+модели (см. signals.py), поэтому, например, одобрение НКО сразу делает неактуальными
+только ключи, зависящие от NGO. Ответы хранятся в кеше Django RESPONSE_CACHE['ALIAS'],
+версии - в отдельном RESPONSE_CACHE['VERSION_ALIAS'], где их не вытесняют ответы.
+Версии должны быть общими для всех процессов: с LocMemCache (у каждого процесса свой) при
+WORKERS > 1 кеш ответов отключается - для нескольких процессов нужен общий бэкенд (Redis и т.п.).
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.response import Response
+
+VERSION_PREFIX = 'response-cache:version:'
+KEY_PREFIX = 'response-cache:'
+
+
+def _settings():
+    return getattr(settings, 'RESPONSE_CACHE', {})
+
+
+def get_cache():
+    return caches[_settings().get('ALIAS', 'default')]
+
+
+def get_version_cache():
+    options = _settings()
+    return caches[options.get('VERSION_ALIAS') or options.get('ALIAS', 'default')]
+
+
+def is_process_local():
+    """Версии или ответы хранятся в памяти процесса и не видны другим воркерам"""
+    return isinstance(get_cache(), LocMemCache) or isinstance(get_version_cache(), LocMemCache)
+
+
+def versions_shared():
+    """Версии видны всем воркерам: воркер один или кеш версий общий"""
+    return _settings().get('WORKERS', 1) <= 1 or not isinstance(get_version_cache(), LocMemCache)
+
+
+def is_enabled():
+    """Кеш включен и, если воркеров несколько, его бэкенд общий для них"""
+    options = _settings()
+    if not options.get('ENABLED', True):
+        return False
+    return options.get('WORKERS', 1) <= 1 or not is_process_local()
+
+
+def _label(model):
+    return model if isinstance(model, str) else model._meta.label
+
+
+def _new_version():
+    # Не 1: если ключ версии потерян (вытеснение, перезапуск кеша), новая версия не совпадет
+    # ни с одной из прежних и старые ответы не станут снова актуальными
+    return time.time_ns()
+
+
+def get_versions(models):
+    """Текущие версии моделей (отсутствующие инициализируются новым значением)"""
+    cache = get_version_cache()
+    keys = [VERSION_PREFIX + _label(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    """Увеличивает версию модели, делая неактуальными все зависящие от нее ответы; возвращает новую версию"""
+    cache = get_version_cache()
+    key = VERSION_PREFIX + _label(model)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _new_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def make_key(request, models):
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    versions = get_versions(models)
+    raw = f'{request.path}?{urlencode(params)}|{versions}'
+    return KEY_PREFIX + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cached_response(request, models, view, timeout=None):
+    """Возвращает ответ из кеша или вызывает view и кеширует успешный ответ"""
+    if not is_enabled() or request.method != 'GET' or request.user.is_authenticated:
+        return view()
+
+    cache = get_cache()
+    key = make_key(request, models)
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = view()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout=timeout or _settings().get('TIMEOUT', 300))
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cache_anonymous_response(models, timeout=None):
+    """Декоратор для function-based view (ставится под @api_view и @permission_classes)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            return cached_response(request, models, lambda: func(request, *args, **kwargs), timeout)
+        return wrapper
+    return decorator
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширование list() для анонимных пользователей; зависимости - в cache_models"""
+    cache_models = ()
+    cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            self.cache_models,
+            lambda: super(AnonymousResponseCacheMixin, self).list(request, *args, **kwargs),
+            self.cache_timeout
+        )
+
+
+def check_response_cache(app_configs=None, **kwargs):
+    """Системная проверка: кеши с версиями в памяти процесса при нескольких воркерах отключаются"""
+    from django.core.checks import Warning
+
+    options = _settings()
+    if options.get('ENABLED', True) and options.get('WORKERS', 1) > 1 and is_process_local():
+        return [Warning(
+            'Кеш ответов и кеш рекомендаций отключены: LocMemCache не общий для нескольких воркеров',
+            hint="Укажите общий бэкенд (например, Redis) для RESPONSE_CACHE['ALIAS'] и 'VERSION_ALIAS'",
+            id='api.W001',
+        )]
+    return []
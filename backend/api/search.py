@@ -0,0 +1,272 @@
+"""
+Полнотекстовый поиск
+Бэкенд выбирается настройкой SEARCH_BACKEND, по умолчанию - по типу БД:
+- SQLite: виртуальная таблица FTS5 api_search_index с основами слов (стеммер из text.py),
+  синхронизируется сигналами при сохранении/удалении НКО, событий, материалов и новостей;
+- PostgreSQL: to_tsvector/websearch_to_tsquery с конфигурацией 'russian' и GIN-индексами.
+Результаты упорядочены по релевантности (bm25 / ts_rank). Поиск в списках (search_queryset)
+выполняется одним SQL-запросом вместе с остальными фильтрами: совпадения не ограничиваются
+заранее, count и страницы считаются по всем найденным объектам.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .text import stem_tokens
+
+FTS_TABLE = 'api_search_index'
+
+# Индексируемые документы: модель, поля заголовка и текста, условие видимости
+SEARCH_DOCUMENTS = {
+    'ngo': {
+        'model': 'api.NGO',
+        'title': ['name'],
+        'body': ['short_description', 'description'],
+        'filter': {'status': 'approved'},
+    },
+    'event': {
+        'model': 'api.Event',
+        'title': ['title'],
+        'body': ['description'],
+        'filter': {},
+    },
+    'material': {
+        'model': 'api.Material',
+        'title': ['title'],
+        'body': ['description', 'course', 'author'],
+        'filter': {},
+    },
+    'news': {
+        'model': 'api.News',
+        'title': ['title'],
+        'body': ['snippet', 'content'],
+        # Видимость новостей зависит от пользователя, ее проверяет NewsViewSet
+        'filter': {},
+    },
+}
+
+
+# rowid строки индекса однозначно задается типом и id документа: выборка и удаление по rowid
+# не просматривают таблицу FTS
+DOC_TYPE_INDEX = {doc_type: position for position, doc_type in enumerate(SEARCH_DOCUMENTS)}
+
+
+def doc_rowid(doc_type, pk):
+    return pk * len(SEARCH_DOCUMENTS) + DOC_TYPE_INDEX[doc_type]
+
+
+def get_doc_type(model):
+    """Тип документа для модели или None, если модель не индексируется"""
+    label = model._meta.label
+    for doc_type, config in SEARCH_DOCUMENTS.items():
+        if config['model'] == label:
+            return doc_type
+    return None
+
+
+def is_searchable(doc_type, obj):
+    return all(getattr(obj, field) == value for field, value in SEARCH_DOCUMENTS[doc_type]['filter'].items())
+
+
+def _join_fields(obj, fields):
+    return ' '.join(str(getattr(obj, field) or '') for field in fields)
+
+
+class SQLiteFTSBackend:
+    """FTS5 по основам слов; русская морфология обрабатывается стеммером до индексации"""
+
+    insert_sql = f'INSERT INTO {FTS_TABLE} (rowid, doc_type, doc_id, title, body) VALUES (%s, %s, %s, %s, %s)'
+
+    def _row(self, doc_type, obj):
+        config = SEARCH_DOCUMENTS[doc_type]
+        return [
+            doc_rowid(doc_type, obj.pk),
+            doc_type,
+            obj.pk,
+            ' '.join(stem_tokens(_join_fields(obj, config['title']))),
+            ' '.join(stem_tokens(_join_fields(obj, config['body']))),
+        ]
+
+    def index(self, doc_type, obj):
+        self.remove(doc_type, obj.pk)
+        if not is_searchable(doc_type, obj):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(self.insert_sql, self._row(doc_type, obj))
+
+    def remove(self, doc_type, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [doc_rowid(doc_type, pk)])
+
+    def rebuild(self, doc_type, objects, batch_size=1000):
+        # Вставка пачками без удаления по одному
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE doc_type = %s', [doc_type])
+            batch = []
+            for obj in objects:
+                if is_searchable(doc_type, obj):
+                    batch.append(self._row(doc_type, obj))
+                if len(batch) >= batch_size:
+                    cursor.executemany(self.insert_sql, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(self.insert_sql, batch)
+                count += len(batch)
+        return count
+
+    def build_query(self, query):
+        """Все слова запроса обязательны, последнее - как префикс (поиск по мере ввода)"""
+        stems = stem_tokens(query, min_length=1)
+        if not stems:
+            return None
+        terms = [f'"{term}"' for term in stems[:-1]] + [f'"{stems[-1]}"*']
+        return ' AND '.join(terms)
+
+    def filter_queryset(self, queryset, doc_type, query):
+        """
+        Фильтр по совпадениям и сортировка по bm25 в том же запросе, что и остальные фильтры
+
+        bm25 нельзя вызвать в запросе с GROUP BY (аннотации Count), поэтому релевантность
+        считается подзапросом по rowid документа.
+        """
+        from django.db.models.expressions import RawSQL
+
+        match = self.build_query(query)
+        if match is None:
+            return queryset.none()
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        rowid = f'{table}.id * {len(SEARCH_DOCUMENTS)} + {DOC_TYPE_INDEX[doc_type]}'
+        matched_ids = RawSQL(
+            f'SELECT doc_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND doc_type = %s',
+            [match, doc_type]
+        )
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, 0, 0, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {rowid}',
+            [match]
+        )
+        return queryset.filter(id__in=matched_ids).annotate(search_rank=rank).order_by('search_rank', 'id')
+
+    def search(self, doc_type, query, limit):
+        match = self.build_query(query)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            # Совпадение в заголовке весит больше, чем в тексте
+            cursor.execute(
+                f'SELECT doc_id FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND doc_type = %s '
+                f'ORDER BY bm25({FTS_TABLE}, 0, 0, 10.0, 1.0) LIMIT %s',
+                [match, doc_type, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """tsvector с конфигурацией 'russian'; индексы GIN создаются миграцией 0005"""
+
+    config = 'russian'
+
+    def vector(self, doc_type):
+        from django.contrib.postgres.search import SearchVector
+        config = SEARCH_DOCUMENTS[doc_type]
+        return (
+            SearchVector(*config['title'], config=self.config, weight='A')
+            + SearchVector(*config['body'], config=self.config, weight='B')
+        )
+
+    def index(self, doc_type, obj):
+        pass
+
+    def remove(self, doc_type, pk):
+        pass
+
+    def rebuild(self, doc_type, objects):
+        return 0
+
+    def filter_queryset(self, queryset, doc_type, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        from django.db.models import F
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return (
+            queryset.annotate(document=self.vector(doc_type))
+            .filter(document=search_query)
+            .annotate(search_rank=SearchRank(F('document'), search_query))
+            # id - однозначный порядок при равной релевантности (границы страниц)
+            .order_by('-search_rank', '-id')
+        )
+
+    def search(self, doc_type, query, limit):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        from django.db.models import F
+        config = SEARCH_DOCUMENTS[doc_type]
+        model = apps.get_model(config['model'])
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return list(
+            model.objects.filter(**config['filter'])
+            .annotate(document=self.vector(doc_type))
+            .filter(document=search_query)
+            .annotate(search_rank=SearchRank(F('document'), search_query))
+            .order_by('-search_rank', '-id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'SEARCH_BACKEND', '')
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = SQLiteFTSBackend()
+    return _backend
+
+
+def search_ids(doc_type, query, limit=20):
+    """id документов, найденных по запросу, по убыванию релевантности (без учета фильтров)"""
+    return get_search_backend().search(doc_type, query, limit)
+
+
+def search_queryset(queryset, doc_type, query):
+    """queryset, отфильтрованный поиском и упорядоченный по релевантности"""
+    return get_search_backend().filter_queryset(queryset, doc_type, query)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter через полнотекстовый индекс
+
+    Используется, если у view задан search_doc_type; результаты упорядочены
+    по релевантности (см. RelevanceOrderingFilter).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        doc_type = getattr(view, 'search_doc_type', None)
+        query = request.query_params.get(self.search_param, '').strip()
+        if not doc_type or not query:
+            return super().filter_queryset(request, queryset, view)
+        return search_queryset(queryset, doc_type, query)
+
+
+class RelevanceOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter, который не перебивает сортировку по релевантности при поиске"""
+
+    def get_ordering(self, request, queryset, view):
+        query = request.query_params.get(FullTextSearchFilter.search_param, '').strip()
+        if getattr(view, 'search_doc_type', None) and query and not request.query_params.get(self.ordering_param):
+            return None
+        ordering = super().get_ordering(request, queryset, view)
+        # Уникальный последний ключ сортировки: при равных значениях страницы не пересекаются
+        if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = [*ordering, 'id']
+        return ordering
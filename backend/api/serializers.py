@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import get_user_model
+from django.db.models import Count
 from .models import (
     Category, NGO, Favorite, Event, EventRegistration,
     Review, ActivityHistory, ModerationRequest, ContactMessage,
@@ -37,16 +38,13 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'city', 'phone']
     
     def validate(self, attrs):
-        print("validate", attrs)
         if attrs['password'] != attrs['password_confirm']:
             raise serializers.ValidationError({"password": "Пароли не совпадают"})
         return attrs
     
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        print("before create user", validated_data)
         user = User.objects.create_user(**validated_data)
-        print("after create user", user)
         return user
 
 
@@ -57,6 +55,31 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'icon']
 
 
+def preload_ngo_stats(context):
+    """
+    Загружает данные для поля is_favorite пачкой
+
+    Избранное текущего пользователя загружается одним запросом и кешируется
+    в контексте сериализатора; количество отзывов хранится у НКО (rating_count).
+    """
+    request = context.get('request')
+    if 'favorite_ngo_ids' not in context:
+        if request and request.user.is_authenticated:
+            context['favorite_ngo_ids'] = set(
+                Favorite.objects.filter(user=request.user).values_list('ngo_id', flat=True)
+            )
+        else:
+            context['favorite_ngo_ids'] = set()
+
+
+class NGOListSerializer(serializers.ListSerializer):
+    """Список НКО с фиксированным количеством запросов на страницу"""
+
+    def to_representation(self, data):
+        preload_ngo_stats(self.context)
+        return super().to_representation(data)
+
+
 class NGOSerializer(serializers.ModelSerializer):
     """Сериализатор НКО"""
     category = CategorySerializer(read_only=True)
@@ -79,15 +102,28 @@ class NGOSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'slug', 'rating', 'participants_count', 
                           'events_count', 'status', 'created_at', 'updated_at']
+        list_serializer_class = NGOListSerializer
     
     def get_is_favorite(self, obj):
+        favorite_ngo_ids = self.context.get('favorite_ngo_ids')
+        if favorite_ngo_ids is not None:
+            return obj.id in favorite_ngo_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user, ngo=obj).exists()
         return False
     
     def get_reviews_count(self, obj):
-        return obj.reviews.count()
+        # У каждого отзыва одна оценка: число отзывов - счетчик rating_count
+        return obj.rating_count
+
+
+class NestedNGOListSerializer(serializers.ListSerializer):
+    """Список объектов с вложенным НКО (избранное, отзывы): избранное пользователя грузится один раз"""
+
+    def to_representation(self, data):
+        preload_ngo_stats(self.context)
+        return super().to_representation(data)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -98,6 +134,50 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = ['id', 'ngo', 'created_at']
         read_only_fields = ['id', 'created_at']
+        list_serializer_class = NestedNGOListSerializer
+
+
+def preload_event_stats(context, events):
+    """
+    Загружает данные для полей registered_count и is_registered пачкой
+
+    Регистрации текущего пользователя загружаются одним запросом, количество
+    регистраций - одним агрегирующим запросом для событий без аннотации
+    registrations_count. Вложенные НКО обрабатываются через preload_ngo_stats.
+    """
+    request = context.get('request')
+    if 'registered_event_ids' not in context:
+        if request and request.user.is_authenticated:
+            context['registered_event_ids'] = set(
+                EventRegistration.objects.filter(user=request.user).values_list('event_id', flat=True)
+            )
+        else:
+            context['registered_event_ids'] = set()
+
+    registered_counts = context.setdefault('event_registered_counts', {})
+    missing_ids = {
+        event.id for event in events
+        if not hasattr(event, 'registrations_count') and event.id not in registered_counts
+    }
+    if missing_ids:
+        registered_counts.update({event_id: 0 for event_id in missing_ids})
+        registered_counts.update(
+            EventRegistration.objects.filter(event_id__in=missing_ids)
+            .values('event_id')
+            .annotate(count=Count('id'))
+            .values_list('event_id', 'count')
+        )
+
+    preload_ngo_stats(context)
+
+
+class EventListSerializer(serializers.ListSerializer):
+    """Список событий с фиксированным количеством запросов на страницу"""
+
+    def to_representation(self, data):
+        events = list(data.all() if hasattr(data, 'all') else data)
+        preload_event_stats(self.context, events)
+        return super().to_representation(events)
 
 
 class EventSerializer(serializers.ModelSerializer):
@@ -108,7 +188,7 @@ class EventSerializer(serializers.ModelSerializer):
         source='ngo',
         write_only=True
     )
-    registered_count = serializers.ReadOnlyField()
+    registered_count = serializers.SerializerMethodField()
     is_registered = serializers.SerializerMethodField()
     
     class Meta:
@@ -119,8 +199,21 @@ class EventSerializer(serializers.ModelSerializer):
             'is_registered', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        list_serializer_class = EventListSerializer
+    
+    def get_registered_count(self, obj):
+        # Аннотация из queryset (EventViewSet) или предзагрузка из EventListSerializer
+        if hasattr(obj, 'registrations_count'):
+            return obj.registrations_count
+        registered_counts = self.context.get('event_registered_counts', {})
+        if obj.id in registered_counts:
+            return registered_counts[obj.id]
+        return obj.registered_count
     
     def get_is_registered(self, obj):
+        registered_event_ids = self.context.get('registered_event_ids')
+        if registered_event_ids is not None:
+            return obj.id in registered_event_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return EventRegistration.objects.filter(
@@ -177,18 +270,13 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'ngo', 'ngo_id', 'user', 'rating', 'comment', 'created_at', 'updated_at']
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+        list_serializer_class = NestedNGOListSerializer
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         review = super().create(validated_data)
-        
-        # Обновление рейтинга НКО
-        ngo = review.ngo
-        reviews = ngo.reviews.all()
-        if reviews.exists():
-            ngo.rating = sum(r.rating for r in reviews) / reviews.count()
-            ngo.save()
-        
+        # Рейтинг НКО обновлен сигналом (ratings.adjust) в БД - перечитываем для ответа
+        review.ngo.refresh_from_db(fields=['rating', 'rating_sum', 'rating_count', 'updated_at'])
         return review
 
 
@@ -0,0 +1,258 @@
+"""
+Сигналы приложения api
+"""
+import logging
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    User, Category, City, CityAlias, NGO, Event, Material, News, Tag, Favorite, ActivityHistory, Review,
+    EventRegistration, PrecomputedRecommendation
+)
+from .recommendation_cache import recommendation_cache
+from .response_cache import bump_version
+from . import ratings, statistics
+from .cities import add_city, canonical_city
+from .activity import rollup_activity
+from .search import get_doc_type, get_search_backend
+from .suggest import suggest_index, get_suggest_doc_type, invalidate_suggest_index, suggest_fields
+from .similarity import ngo_index, TEXT_FIELDS
+from .spatial import get_spatial_index
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=ActivityHistory)
+def rollup_saved_activity(sender, instance, created, **kwargs):
+    """Учет события, созданного через save(), в сводке активности (bulk_create учитывает ActivityWriter)"""
+    if created:
+        rollup_activity([instance])
+
+
+# Удаление событий истории (перенос в архив) рекомендации не меняет: они читают сводку
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver(post_save, sender=ActivityHistory)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=EventRegistration)
+def invalidate_user_recommendations(sender, instance, **kwargs):
+    """Сброс кеша рекомендаций пользователя при изменении его активности"""
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_recommendations_on_profile_change(sender, instance, update_fields=None, **kwargs):
+    """Сброс кеша рекомендаций при изменении интересов или города"""
+    if update_fields is not None and not {'interests', 'city'} & set(update_fields):
+        return
+    invalidate_recommendations(instance.pk)
+
+
+def invalidate_recommendations(user_id):
+    """
+    Сброс кеша и предрассчитанных рекомендаций пользователя
+
+    Удаленные строки PrecomputedRecommendation пересчитываются при следующем
+    запуске precompute_recommendations --incremental.
+    """
+    recommendation_cache.invalidate_user(user_id)
+    PrecomputedRecommendation.objects.filter(user_id=user_id).delete()
+
+
+@receiver(post_save, sender=NGO)
+def update_ngo_similarity_index(sender, instance, update_fields=None, **kwargs):
+    """Пересчет вектора НКО при одобрении или изменении описания"""
+    if update_fields is not None and not TEXT_FIELDS & set(update_fields):
+        return
+    try:
+        ngo_index.update_ngo(instance)
+    except Exception:
+        # Индекс восстанавливается командой build_ngo_index, сохранение НКО не должно падать
+        logger.exception('Не удалось обновить индекс сходства для НКО %s', instance.pk)
+
+
+@receiver(post_delete, sender=NGO)
+def remove_ngo_from_similarity_index(sender, instance, **kwargs):
+    try:
+        ngo_index.remove_ngo(instance.pk)
+    except Exception:
+        logger.exception('Не удалось удалить НКО %s из индекса сходства', instance.pk)
+
+
+@receiver(post_save, sender=NGO)
+def update_spatial_index(sender, instance, update_fields=None, **kwargs):
+    """Синхронизация R*Tree при изменении координат или статуса НКО"""
+    if update_fields is not None and not {'latitude', 'longitude', 'status'} & set(update_fields):
+        return
+    get_spatial_index().index(instance)
+
+
+@receiver(post_delete, sender=NGO)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    get_spatial_index().remove(instance.pk)
+
+
+@receiver(post_save, sender=NGO)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Material)
+@receiver(post_save, sender=News)
+def update_search_index(sender, instance, **kwargs):
+    """Синхронизация полнотекстового индекса при сохранении"""
+    get_search_backend().index(get_doc_type(sender), instance)
+
+
+@receiver(post_delete, sender=NGO)
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Material)
+@receiver(post_delete, sender=News)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(get_doc_type(sender), instance.pk)
+
+
+@receiver(post_save, sender=NGO)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Material)
+@receiver(post_save, sender=Tag)
+def update_suggest_index(sender, instance, update_fields=None, **kwargs):
+    """Обновление индекса подсказок при сохранении; другие процессы узнают о нем по версии"""
+    doc_type = get_suggest_doc_type(sender)
+    if update_fields is not None and not suggest_fields(doc_type) & set(update_fields):
+        return
+    if suggest_index.update(doc_type, instance):
+        suggest_index.adopt_version(invalidate_suggest_index())
+
+
+@receiver(post_delete, sender=NGO)
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Material)
+@receiver(post_delete, sender=Tag)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    if suggest_index.remove(get_suggest_doc_type(sender), instance.pk):
+        suggest_index.adopt_version(invalidate_suggest_index())
+
+
+@receiver([post_save, post_delete], sender=NGO)
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=News)
+@receiver([post_save, post_delete], sender=Review)
+def bump_response_cache_version(sender, instance, **kwargs):
+    """Новая версия модели делает неактуальными закешированные ответы, зависящие от нее"""
+    bump_version(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=EventRegistration)
+def increment_statistics(sender, instance, created, **kwargs):
+    """Счетчики пользователей и регистраций в снимке статистики"""
+    if created:
+        field = 'total_users' if sender is User else 'total_registrations'
+        statistics.adjust(**{field: 1})
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=EventRegistration)
+def decrement_statistics(sender, instance, **kwargs):
+    field = 'total_users' if sender is User else 'total_registrations'
+    statistics.adjust(**{field: -1})
+
+
+@receiver(pre_save, sender=NGO)
+def remember_ngo_statistics_state(sender, instance, **kwargs):
+    """Статус и категория до сохранения, чтобы учесть одобрение или смену категории"""
+    previous = None
+    if instance.pk:
+        previous = NGO.objects.filter(pk=instance.pk).values_list('status', 'category_id').first()
+    instance._statistics_previous = previous
+
+
+@receiver(post_save, sender=NGO)
+def update_ngo_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, '_statistics_previous', None)
+    current = (instance.status, instance.category_id)
+    if previous == current:
+        return
+    if previous and previous[0] == 'approved':
+        statistics.adjust_approved_ngos(previous[1], -1)
+    if instance.status == 'approved':
+        statistics.adjust_approved_ngos(instance.category_id, 1)
+
+
+@receiver(post_delete, sender=NGO)
+def remove_ngo_from_statistics(sender, instance, **kwargs):
+    if instance.status == 'approved':
+        statistics.adjust_approved_ngos(instance.category_id, -1)
+
+
+@receiver([post_save, post_delete], sender=Event)
+def update_event_statistics(sender, instance, **kwargs):
+    statistics.refresh_events()
+
+
+@receiver(pre_save, sender=NGO)
+@receiver(pre_save, sender=News)
+@receiver(pre_save, sender=User)
+def canonicalize_city(sender, instance, update_fields=None, **kwargs):
+    """
+    Каноническое название города вместо варианта написания
+
+    Новые города НКО и новостей добавляются в справочник; город из профиля пользователя
+    только сопоставляется, чтобы опечатки не попадали в справочник.
+    """
+    if update_fields is not None and 'city' not in update_fields:
+        return
+    instance.city = canonical_city(instance.city, create=sender is not User)
+
+
+@receiver(pre_save, sender=City)
+def remember_city_name(sender, instance, **kwargs):
+    instance._previous_name = (
+        City.objects.filter(pk=instance.pk).values_list('name', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=City)
+def sync_city_name(sender, instance, **kwargs):
+    """Название города - тоже вариант написания; при переименовании обновляются поля city"""
+    add_city(instance.name)
+    previous = getattr(instance, '_previous_name', None)
+    if previous and previous != instance.name:
+        for model in (NGO, News, User):
+            model.objects.filter(city=previous).update(city=instance.name)
+
+
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=CityAlias)
+def bump_city_filter_cache_version(sender, instance, **kwargs):
+    """Ответы с фильтром по городу зависят от сопоставления вариантов написания"""
+    bump_version(NGO)
+    bump_version(News)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """НКО и оценка до изменения отзыва (при создании запроса нет)"""
+    instance._rating_previous = (
+        Review.objects.filter(pk=instance.pk).values_list('ngo_id', 'rating').first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_ngo_rating(sender, instance, **kwargs):
+    """Сумма и число оценок НКО (см. ratings.py)"""
+    previous = getattr(instance, '_rating_previous', None)
+    if previous is None:
+        ratings.adjust(instance.ngo_id, instance.rating, 1)
+        return
+    ngo_id, rating = previous
+    if ngo_id != instance.ngo_id:
+        ratings.adjust(ngo_id, -rating, -1)
+        ratings.adjust(instance.ngo_id, instance.rating, 1)
+    elif rating != instance.rating:
+        ratings.adjust(ngo_id, instance.rating - rating, 0)
+
+
+@receiver(post_delete, sender=Review)
+def remove_ngo_rating(sender, instance, **kwargs):
+    ratings.adjust(instance.ngo_id, -instance.rating, -1)
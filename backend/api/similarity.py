@@ -0,0 +1,419 @@
+"""
+Индекс сходства НКО на эмбеддингах
+Тексты НКО (название, краткое и полное описание) переводятся в векторы локально:
+моделью sentence-transformers, если она указана в NGO_EMBEDDING_MODEL и установлена,
+иначе через TF-IDF + усеченное SVD (только NumPy). Сеть не требуется.
+Векторы хранятся в NGO_INDEX_DIR как float32-матрица, открываемая через memory map
+(каталог сборки на каждую перестройку, текущая сборка - по указателю meta.json);
+поиск ближайших соседей - полный перебор скалярным произведением нормированных векторов.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+from .text import stem_tokens
+
+logger = logging.getLogger(__name__)
+
+# Поля НКО, изменение которых требует пересчета вектора
+TEXT_FIELDS = {'name', 'short_description', 'description', 'status'}
+
+
+def ngo_text(ngo):
+    """Текст НКО для построения эмбеддинга"""
+    return ' '.join(part for part in (ngo.name, ngo.short_description, ngo.description) if part)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+class TfidfSvdEncoder:
+    """TF-IDF по основам слов + проекция на главные компоненты (усеченное SVD)"""
+
+    kind = 'tfidf'
+
+    def __init__(self, vocabulary, idf, components):
+        self.vocabulary = vocabulary
+        self.term_index = {term: i for i, term in enumerate(vocabulary)}
+        self.idf = idf
+        self.components = components  # (dim, len(vocabulary))
+
+    @property
+    def dim(self):
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, texts, dim=128, max_features=20000, chunk_size=256, seed=0):
+        docs = [Counter(stem_tokens(text, min_length=3)) for text in texts]
+        df = Counter(term for doc in docs for term in doc)
+        min_df = 2 if len(docs) >= 50 else 1
+        vocabulary = sorted(
+            (term for term, count in df.items() if count >= min_df),
+            key=lambda term: (-df[term], term)
+        )[:max_features]
+        vocabulary.sort()
+        idf = np.array(
+            [math.log((1 + len(docs)) / (1 + df[term])) + 1 for term in vocabulary],
+            dtype=np.float64
+        )
+        encoder = cls(vocabulary, idf, np.zeros((0, len(vocabulary))))
+        if not vocabulary or not docs:
+            return encoder
+
+        # Рандомизированное SVD (Halko et al.) по блокам строк, без хранения плотной матрицы целиком
+        rank = min(dim + 10, len(docs), len(vocabulary))
+        rng = np.random.default_rng(seed)
+
+        def blocks():
+            for start in range(0, len(docs), chunk_size):
+                yield start, encoder._tfidf(docs[start:start + chunk_size])
+
+        def multiply(matrix):  # A @ matrix
+            return np.vstack([block @ matrix for _, block in blocks()])
+
+        def multiply_transposed(matrix):  # A.T @ matrix
+            result = np.zeros((len(vocabulary), matrix.shape[1]))
+            for start, block in blocks():
+                result += block.T @ matrix[start:start + block.shape[0]]
+            return result
+
+        basis = multiply(rng.standard_normal((len(vocabulary), rank)))
+        for _ in range(2):
+            basis, _ = np.linalg.qr(basis)
+            basis = multiply(multiply_transposed(basis))
+        basis, _ = np.linalg.qr(basis)
+        _, _, vt = np.linalg.svd(multiply_transposed(basis).T, full_matrices=False)
+        encoder.components = vt[:min(dim, vt.shape[0])]
+        return encoder
+
+    def _tfidf(self, docs):
+        matrix = np.zeros((len(docs), len(self.vocabulary)))
+        for row, doc in enumerate(docs):
+            for term, count in doc.items():
+                column = self.term_index.get(term)
+                if column is not None:
+                    matrix[row, column] = 1 + math.log(count)
+        matrix *= self.idf
+        return _normalize(matrix).astype(np.float64)
+
+    def encode(self, texts):
+        if not len(self.components):
+            return np.zeros((len(texts), 1), dtype=np.float32)
+        docs = [Counter(stem_tokens(text, min_length=3)) for text in texts]
+        return _normalize(self._tfidf(docs) @ self.components.T)
+
+    def save(self, directory):
+        with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        np.save(os.path.join(directory, 'idf.npy'), self.idf)
+        np.save(os.path.join(directory, 'components.npy'), self.components)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        return cls(
+            vocabulary,
+            np.load(os.path.join(directory, 'idf.npy')),
+            np.load(os.path.join(directory, 'components.npy')),
+        )
+
+
+class SentenceTransformerEncoder:
+    """Локальная модель sentence-transformers (загружается без обращения к сети)"""
+
+    kind = 'sentence-transformers'
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, local_files_only=True)
+
+    def encode(self, texts):
+        vectors = self.model.encode(list(texts), convert_to_numpy=True, show_progress_bar=False)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+    def save(self, directory):
+        pass
+
+    @classmethod
+    def fit(cls, texts, **kwargs):
+        return cls(settings.NGO_EMBEDDING_MODEL)
+
+    @classmethod
+    def load(cls, directory):
+        return cls(settings.NGO_EMBEDDING_MODEL)
+
+
+def get_encoder_class():
+    """Модель из NGO_EMBEDDING_MODEL, если она доступна локально, иначе TF-IDF/SVD"""
+    if getattr(settings, 'NGO_EMBEDDING_MODEL', ''):
+        try:
+            import sentence_transformers  # noqa: F401
+            return SentenceTransformerEncoder
+        except ImportError:
+            logger.warning('sentence-transformers не установлен, используется TF-IDF/SVD')
+    return TfidfSvdEncoder
+
+
+class NGOSimilarityIndex:
+    """
+    Матрица векторов одобренных НКО в каталоге на диске
+    Каждая сборка (build) пишется в свой подкаталог builds/<build>: файлы кодировщика и
+    версии матрицы matrix_<id> (ids.npy + vectors.npy с запасом строк). meta.json - указатель
+    на текущую сборку и матрицу и число занятых строк, он заменяется атомарно (os.replace).
+    Изменения из сигналов выполняются на месте под межпроцессной блокировкой каталога (flock):
+    новая НКО пишется в свободную строку, удаленная помечается id = -1; матрица копируется
+    только при исчерпании запаса (с удвоением) или когда удаленных строк больше четверти.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self._lock = threading.Lock()
+        self._loaded_stat = None
+        self._build = None
+        self.encoder = None
+        self.ids = None
+        self.vectors = None
+        self.positions = {}
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def exists(self):
+        return os.path.exists(self._path('meta.json'))
+
+    @contextmanager
+    def _locked(self):
+        """Блокировка потоков процесса и, где есть fcntl, других процессов (файл .lock каталога)"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path('.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if 'build' not in meta or 'matrix' not in meta:
+            logger.warning('Индекс сходства НКО в старом формате, выполните python manage.py build_ngo_index')
+            return None
+        return meta
+
+    def _write_meta(self, meta):
+        """Атомарная замена указателя meta.json"""
+        tmp_path = self._path(f'meta.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path('meta.json'))
+        self._loaded_stat = None
+
+    def _switch(self, meta):
+        """
+        Переключение указателя на новую сборку/матрицу и удаление устаревших версий.
+        Предыдущая версия сохраняется: ее мог только что прочитать другой процесс; уже
+        открытые через memory map файлы доступны и после удаления (POSIX).
+        """
+        previous = self._read_meta() or {}
+        self._write_meta(meta)
+
+        keep = {meta['build'], previous.get('build')}
+        builds_dir = self._path('builds')
+        for name in os.listdir(builds_dir):
+            if name not in keep:
+                shutil.rmtree(os.path.join(builds_dir, name), ignore_errors=True)
+        keep = {meta['matrix'], previous.get('matrix')}
+        for name in os.listdir(os.path.join(builds_dir, meta['build'])):
+            if name.startswith('matrix_') and name not in keep:
+                shutil.rmtree(os.path.join(builds_dir, meta['build'], name), ignore_errors=True)
+
+    def build(self, ngos, dim=128):
+        """Полная перестройка индекса по списку НКО"""
+        ngos = list(ngos)
+        texts = [ngo_text(ngo) for ngo in ngos]
+        encoder_class = get_encoder_class()
+        encoder = encoder_class.fit(texts, dim=dim)
+        vectors = encoder.encode(texts) if ngos else np.zeros((0, 1), dtype=np.float32)
+        ids = np.array([ngo.id for ngo in ngos], dtype=np.int64)
+
+        build = f'{time.strftime("%Y%m%d%H%M%S")}_{uuid.uuid4().hex[:8]}'
+        os.makedirs(self._path('builds', build))
+        encoder.save(self._path('builds', build))
+        # Запас строк для НКО, добавляемых сигналами до следующей перестройки
+        matrix = self._write_matrix(build, ids, vectors, capacity=len(ids) + max(16, len(ids) // 10))
+        with self._locked():
+            self._switch({
+                'build': build, 'matrix': matrix, 'encoder': encoder.kind, 'count': len(ids), 'removed': 0
+            })
+        return len(ids)
+
+    def _write_matrix(self, build, ids, vectors, capacity=None):
+        """Новая версия матрицы с capacity строками (свободные - с id -1); видна после _switch"""
+        capacity = max(capacity or 0, len(ids))
+        matrix = f'matrix_{uuid.uuid4().hex[:12]}'
+        os.makedirs(self._path('builds', build, matrix))
+        full_ids = np.full(capacity, -1, dtype=np.int64)
+        full_ids[:len(ids)] = ids
+        full_vectors = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+        full_vectors[:len(ids)] = vectors
+        np.save(self._path('builds', build, matrix, 'ids.npy'), full_ids)
+        np.save(self._path('builds', build, matrix, 'vectors.npy'), full_vectors)
+        return matrix
+
+    def _open(self, meta, mode):
+        directory = self._path('builds', meta['build'], meta['matrix'])
+        return (
+            np.load(os.path.join(directory, 'ids.npy'), mmap_mode=mode),
+            np.load(os.path.join(directory, 'vectors.npy'), mmap_mode=mode),
+        )
+
+    def _ensure_encoder(self, meta):
+        """Кодировщик сборки из meta (вызывается под self._lock); при новой сборке перечитывается"""
+        if meta['build'] != self._build or self.encoder is None:
+            encoder_class = (
+                SentenceTransformerEncoder if meta['encoder'] == SentenceTransformerEncoder.kind
+                else TfidfSvdEncoder
+            )
+            self.encoder = encoder_class.load(self._path('builds', meta['build']))
+            self._build = meta['build']
+            self._loaded_stat = None
+        return self.encoder
+
+    def load(self):
+        """Открывает индекс (повторно - если указатель meta.json изменен, в том числе другим процессом)"""
+        try:
+            stat = os.stat(self._path('meta.json'))
+        except OSError:
+            return False
+        stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._loaded_stat:
+            return True
+        with self._lock:
+            meta = self._read_meta()
+            if meta is None:
+                return False
+            self._ensure_encoder(meta)
+            ids, vectors = self._open(meta, 'r')
+            self.ids = ids[:meta['count']]
+            self.vectors = vectors[:meta['count']]
+            self.positions = {int(ngo_id): i for i, ngo_id in enumerate(self.ids) if ngo_id >= 0}
+            self._loaded_stat = stat_key
+        return True
+
+    def update_ngo(self, ngo):
+        """Пересчет вектора НКО; неодобренные НКО удаляются из индекса"""
+        if ngo.status != 'approved':
+            self.remove_ngo(ngo.id)
+            return
+        if not self.exists():
+            return
+        text = ngo_text(ngo)
+        with self._locked():
+            # Под блокировкой - актуальный указатель: другой процесс мог сменить сборку или матрицу
+            meta = self._read_meta()
+            if meta is None:
+                return
+            vector = self._ensure_encoder(meta).encode([text])[0]
+            ids, vectors = self._open(meta, 'r+')
+            count = meta['count']
+            found = np.flatnonzero(ids[:count] == ngo.id)
+            if len(found):
+                vectors[found[0]] = vector
+                vectors.flush()
+                return
+            if count < len(ids):
+                # Сначала вектор, затем id, затем указатель: читатели не видят строку до смены count
+                vectors[count] = vector
+                vectors.flush()
+                ids[count] = ngo.id
+                ids.flush()
+                self._write_meta({**meta, 'count': count + 1})
+                return
+            # Запас исчерпан: копия с удвоенным запасом (амортизированно O(1) на добавление)
+            matrix = self._write_matrix(
+                meta['build'],
+                np.append(ids[:count], ngo.id),
+                np.vstack([np.asarray(vectors[:count]), vector[None, :]]),
+                capacity=max(16, 2 * count),
+            )
+            self._switch({**meta, 'matrix': matrix, 'count': count + 1})
+
+    def remove_ngo(self, ngo_id):
+        if not self.exists():
+            return
+        with self._locked():
+            meta = self._read_meta()
+            if meta is None:
+                return
+            ids, vectors = self._open(meta, 'r+')
+            count = meta['count']
+            found = np.flatnonzero(ids[:count] == ngo_id)
+            if not len(found):
+                return
+            ids[found] = -1
+            ids.flush()
+            vectors[found] = 0
+            vectors.flush()
+            removed = meta.get('removed', 0) + len(found)
+            if removed > max(16, count // 4):
+                # Много удаленных строк - уплотнение копией
+                keep = ids[:count] >= 0
+                matrix = self._write_matrix(
+                    meta['build'], np.asarray(ids[:count])[keep], np.asarray(vectors[:count])[keep],
+                    capacity=2 * int(keep.sum())
+                )
+                self._switch({**meta, 'matrix': matrix, 'count': int(keep.sum()), 'removed': 0})
+            else:
+                self._write_meta({**meta, 'removed': removed})
+
+    def vectors_for(self, ngo_ids):
+        positions = [self.positions[ngo_id] for ngo_id in ngo_ids if ngo_id in self.positions]
+        return np.asarray(self.vectors[positions]) if positions else None
+
+    def encode(self, text):
+        return self.encoder.encode([text])[0]
+
+    def search(self, vector, k, exclude_ids=()):
+        """id k ближайших НКО по косинусной близости, по убыванию"""
+        if self.vectors is None or not len(self.ids) or k <= 0:
+            return []
+        ids = np.asarray(self.ids)
+        scores = np.asarray(self.vectors) @ vector.astype(np.float32)
+        # Удаленные строки (id -1) и исключенные НКО
+        scores[ids < 0] = -np.inf
+        if exclude_ids:
+            scores[np.isin(ids, list(exclude_ids))] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [int(ids[i]) for i in top if np.isfinite(scores[i])]
+
+
+ngo_index = NGOSimilarityIndex(getattr(settings, 'NGO_INDEX_DIR', os.path.join(settings.BASE_DIR, 'ngo_index')))
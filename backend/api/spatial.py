@@ -0,0 +1,142 @@
+"""
+Поиск ближайших НКО
+На SQLite координаты одобренных НКО хранятся в виртуальной таблице R*Tree api_ngo_rtree
+(создается миграцией 0009, синхронизируется сигналами). Запрос выбирает кандидатов по
+ограничивающему прямоугольнику круга поиска, затем кандидаты ранжируются по расстоянию
+гаверсинуса с ограниченной кучей на limit элементов. На других БД прямоугольник
+выбирается из таблицы НКО.
+"""
+import heapq
+import math
+
+from django.db import connection
+
+RTREE_TABLE = 'api_ngo_rtree'
+
+# Радиус поиска по умолчанию и максимальный, км
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 500
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Расстояние по большому кругу в километрах"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Прямоугольник (min_lat, max_lat, min_lng, max_lng), содержащий круг поиска
+
+    Если круг захватывает полюс или 180-й меридиан, берется вся полоса долгот.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = lat - delta_lat, lat + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), -180, 180
+    delta_lng = math.degrees(math.asin(min(1.0, math.sin(math.radians(delta_lat)) / math.cos(math.radians(lat)))))
+    min_lng, max_lng = lng - delta_lng, lng + delta_lng
+    if min_lng < -180 or max_lng > 180:
+        return min_lat, max_lat, -180, 180
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def is_indexed(ngo):
+    return ngo.status == 'approved' and ngo.latitude is not None and ngo.longitude is not None
+
+
+class SQLiteRTreeIndex:
+    """R*Tree: точки НКО хранятся как вырожденные прямоугольники"""
+
+    def index(self, ngo):
+        self.remove(ngo.pk)
+        if not is_indexed(ngo):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)',
+                [ngo.pk, ngo.latitude, ngo.latitude, ngo.longitude, ngo.longitude]
+            )
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {RTREE_TABLE} WHERE id = %s', [pk])
+
+    def rebuild(self, ngos):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {RTREE_TABLE}')
+            cursor.executemany(
+                f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)',
+                [
+                    (ngo.pk, ngo.latitude, ngo.latitude, ngo.longitude, ngo.longitude)
+                    for ngo in ngos if is_indexed(ngo)
+                ]
+            )
+            return cursor.rowcount
+
+    def candidates(self, min_lat, max_lat, min_lng, max_lng):
+        """(id, широта, долгота) точек в прямоугольнике"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, (min_lat + max_lat) / 2, (min_lng + max_lng) / 2 FROM {RTREE_TABLE} '
+                f'WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s',
+                [min_lat, max_lat, min_lng, max_lng]
+            )
+            return cursor.fetchall()
+
+
+class BoundingBoxIndex:
+    """Прямоугольник по столбцам latitude/longitude таблицы НКО (без отдельного индекса)"""
+
+    def index(self, ngo):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self, ngos):
+        return 0
+
+    def candidates(self, min_lat, max_lat, min_lng, max_lng):
+        from .models import NGO
+        return list(
+            NGO.objects.filter(
+                status='approved',
+                latitude__gte=min_lat, latitude__lte=max_lat,
+                longitude__gte=min_lng, longitude__lte=max_lng,
+            ).values_list('id', 'latitude', 'longitude')
+        )
+
+
+_index = None
+
+
+def get_spatial_index():
+    global _index
+    if _index is None:
+        _index = SQLiteRTreeIndex() if connection.vendor == 'sqlite' else BoundingBoxIndex()
+    return _index
+
+
+def nearest_ngo_ids(lat, lng, radius_km, limit):
+    """[(id, расстояние в км)] не дальше radius_km, по возрастанию расстояния"""
+    candidates = get_spatial_index().candidates(*bounding_box(lat, lng, radius_km))
+    # Ограниченная куча: максимум из limit ближайших на вершине (расстояния со знаком минус)
+    heap = []
+    for ngo_id, ngo_lat, ngo_lng in candidates:
+        distance = haversine_km(lat, lng, ngo_lat, ngo_lng)
+        if distance > radius_km:
+            continue
+        item = (-distance, -ngo_id)
+        if len(heap) < limit:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+    return [(-neg_id, -neg_distance) for neg_distance, neg_id in sorted(heap, reverse=True)]
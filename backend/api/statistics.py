@@ -0,0 +1,147 @@
+"""
+Материализованная статистика платформы
+Эндпоинт /api/statistics читает одну строку PlatformStatistics по первичному ключу и
+список категорий со строками CategoryStatistics (один запрос по небольшой таблице).
+Счетчики пользователей, регистраций и одобренных НКО (в том числе по категориям)
+обновляются сигналами при сохранении/удалении запросами UPDATE с F(): счетчики не читаются
+перед записью, поэтому параллельные изменения не теряются. Число предстоящих событий зависит от
+времени, поэтому хранится вместе с датой ближайшего события и пересчитывается, когда она
+проходит. Массовые операции без сигналов (bulk_create, update) исправляет команда
+reconcile_statistics.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import PlatformStatistics, CategoryStatistics, Category, NGO, Event, EventRegistration, User
+
+SNAPSHOT_PK = 1
+
+COUNTER_FIELDS = ['total_ngos', 'total_events', 'total_users', 'total_registrations']
+
+
+def _category_counts():
+    """{id категории: число одобренных НКО} для всех категорий"""
+    return dict(
+        Category.objects.annotate(
+            ngo_count=Count('ngos', filter=Q(ngos__status='approved'))
+        ).values_list('id', 'ngo_count')
+    )
+
+
+def _reconcile_categories(counts):
+    """Запись пересчитанных счетчиков категорий; возвращает расхождения {id: (было, стало)}"""
+    # Нет строки - то же, что 0 (см. statistics_data)
+    stored = dict(CategoryStatistics.objects.values_list('category_id', 'approved_ngos'))
+    drift = {
+        category_id: (stored.get(category_id, 0), count)
+        for category_id, count in counts.items()
+        if stored.get(category_id, 0) != count
+    }
+    CategoryStatistics.objects.bulk_create(
+        [CategoryStatistics(category_id=category_id, approved_ngos=new) for category_id, (_, new) in drift.items()],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['category'],
+        update_fields=['approved_ngos'],
+    )
+    return drift
+
+
+def _upcoming_events(now):
+    return Event.objects.filter(event_date__gte=now).aggregate(
+        total=Count('id'), valid_until=Min('event_date')
+    )
+
+
+def reconcile():
+    """
+    Полный пересчет снимка
+
+    Возвращает словарь расхождений {поле: (было, стало)} для полей, которые
+    отличались от сохраненных счетчиков, и 'categories': {id категории: (было, стало)}.
+    """
+    now = timezone.now()
+    events = _upcoming_events(now)
+    values = {
+        'total_ngos': NGO.objects.filter(status='approved').count(),
+        'total_events': events['total'],
+        'total_users': User.objects.count(),
+        'total_registrations': EventRegistration.objects.count(),
+        'events_valid_until': events['valid_until'],
+        'reconciled_at': now,
+    }
+    categories = _category_counts()
+    with transaction.atomic():
+        snapshot, created = PlatformStatistics.objects.select_for_update().get_or_create(
+            pk=SNAPSHOT_PK, defaults=values
+        )
+        category_drift = _reconcile_categories(categories)
+        if created:
+            return {}
+        drift = {
+            field: (getattr(snapshot, field), values[field])
+            for field in COUNTER_FIELDS
+            if getattr(snapshot, field) != values[field]
+        }
+        if category_drift:
+            drift['categories'] = category_drift
+        for field, value in values.items():
+            setattr(snapshot, field, value)
+        snapshot.save()
+    return drift
+
+
+def get_snapshot():
+    """Снимок статистики (создается при первом обращении)"""
+    snapshot = PlatformStatistics.objects.filter(pk=SNAPSHOT_PK).first()
+    if snapshot is None:
+        reconcile()
+        return PlatformStatistics.objects.get(pk=SNAPSHOT_PK)
+    if snapshot.events_valid_until and snapshot.events_valid_until < timezone.now():
+        refresh_events()
+        snapshot.refresh_from_db()
+    return snapshot
+
+
+def statistics_data():
+    """Данные для /api/statistics в прежнем формате ответа"""
+    snapshot = get_snapshot()
+    data = {field: getattr(snapshot, field) for field in COUNTER_FIELDS}
+    # Категория без строки статистики (создана, одобренных НКО еще не было) - 0
+    data['categories'] = [
+        {'name': name, 'ngo_count': ngo_count or 0}
+        for name, ngo_count in Category.objects.order_by('name').values_list('name', 'statistics__approved_ngos')
+    ]
+    return data
+
+
+def adjust(**deltas):
+    """Атомарное изменение счетчиков: adjust(total_users=1); False, если снимка еще нет"""
+    return PlatformStatistics.objects.filter(pk=SNAPSHOT_PK).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    ) > 0
+
+
+def adjust_approved_ngos(category_id, delta):
+    """
+    Изменение числа одобренных НКО (всего и в категории)
+
+    Без снимка ничего не меняется: его создаст полный пересчет (reconcile). Строка категории,
+    которой еще нет, создается с нулем и увеличивается тем же UPDATE.
+    """
+    with transaction.atomic():
+        if not adjust(total_ngos=delta):
+            return
+        rows = CategoryStatistics.objects.filter(category_id=category_id)
+        if not rows.update(approved_ngos=F('approved_ngos') + delta):
+            CategoryStatistics.objects.bulk_create([CategoryStatistics(category_id=category_id)], ignore_conflicts=True)
+            rows.update(approved_ngos=F('approved_ngos') + delta)
+
+
+def refresh_events():
+    """Пересчет предстоящих событий (диапазон по индексу event_date)"""
+    events = _upcoming_events(timezone.now())
+    PlatformStatistics.objects.filter(pk=SNAPSHOT_PK).update(
+        total_events=events['total'], events_valid_until=events['valid_until']
+    )
@@ -0,0 +1,249 @@
+"""
+Подсказки при вводе (search-as-you-type)
+Инвертированный индекс в памяти процесса по названиям НКО, событий, материалов и тегов.
+Словарь - отсортированный список терминов (префиксный поиск через bisect), списки
+документов - компактные массивы array('I'). Индекс строится при первом обращении и
+дальше обновляется сигналами сохранения/удаления, без запросов к БД. Изменение названия или
+видимости из сигнала и массовые загрузки (bulk_create, без сигналов) вызывают
+invalidate_suggest_index(): версия в кеше версий response_cache общая для процессов, индекс
+сверяет ее не чаще CHECK_INTERVAL секунд и перестраивается при расхождении или по истечении
+MAX_AGE (настройки SUGGEST_INDEX). Процесс, изменивший свой индекс, перестраивать его не будет.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from django.apps import apps
+from django.conf import settings
+
+from .response_cache import get_versions, bump_version
+from .text import tokenize
+
+# Ключ версии индекса в кеше версий response_cache
+VERSION_KEY = 'suggest-index'
+
+# Удаленных документов больше этой доли (и не меньше COMPACT_MIN_DEAD) - индекс уплотняется
+COMPACT_DEAD_RATIO = 0.25
+COMPACT_MIN_DEAD = 1000
+
+# Индексируемые документы: модель, поле названия, условие видимости
+SUGGEST_DOCUMENTS = {
+    'ngo': {'model': 'api.NGO', 'field': 'name', 'filter': {'status': 'approved'}},
+    'event': {'model': 'api.Event', 'field': 'title', 'filter': {}},
+    'material': {'model': 'api.Material', 'field': 'title', 'filter': {}},
+    'tag': {'model': 'api.Tag', 'field': 'name', 'filter': {}},
+}
+
+
+def _settings():
+    return getattr(settings, 'SUGGEST_INDEX', {})
+
+
+def invalidate_suggest_index():
+    """Помечает индексы подсказок всех процессов устаревшими; возвращает новую версию"""
+    return bump_version(VERSION_KEY)
+
+
+def suggest_fields(doc_type):
+    """Поля модели, от которых зависит документ: название и условие видимости"""
+    config = SUGGEST_DOCUMENTS[doc_type]
+    return {config['field'], *config['filter']}
+
+
+def get_suggest_doc_type(model):
+    label = model._meta.label
+    for doc_type, config in SUGGEST_DOCUMENTS.items():
+        if config['model'] == label:
+            return doc_type
+    return None
+
+
+class SuggestIndex:
+    """Инвертированный индекс названий с поиском по префиксу"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.built = False
+        self.version = None
+        self.built_at = 0.0
+        self.checked_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.terms = []  # отсортированный словарь
+        self.postings = {}  # термин -> array('I') номеров документов
+        self.doc_keys = []  # номер документа -> (doc_type, id)
+        self.doc_titles = []  # номер документа -> название
+        self.doc_numbers = {}  # (doc_type, id) -> номер документа
+        self.alive = bytearray()  # 0 для удаленных документов
+        self.dead = 0  # число удаленных документов
+
+    def build(self):
+        """Полная загрузка из БД"""
+        # Версия берется до чтения БД: увеличенная во время загрузки вызовет еще одну перестройку
+        version = get_versions([VERSION_KEY])[0]
+        with self._lock:
+            self._reset()
+            for doc_type, config in SUGGEST_DOCUMENTS.items():
+                model = apps.get_model(config['model'])
+                rows = model.objects.filter(**config['filter']).values_list('id', config['field'])
+                for pk, title in rows.iterator():
+                    self._add(doc_type, pk, title, keep_sorted=False)
+            self.terms.sort()
+            self.version = version
+            self.built_at = self.checked_at = time.monotonic()
+            self.built = True
+
+    def is_stale(self):
+        """Индекс не построен, старше MAX_AGE или версия в кеше изменилась"""
+        if not self.built:
+            return True
+        options = _settings()
+        now = time.monotonic()
+        max_age = options.get('MAX_AGE', 3600)
+        if max_age and now - self.built_at > max_age:
+            return True
+        if now - self.checked_at < options.get('CHECK_INTERVAL', 5):
+            return False
+        self.checked_at = now
+        return get_versions([VERSION_KEY])[0] != self.version
+
+    def ensure_fresh(self):
+        """Перестройка устаревшего индекса; одновременные запросы ждут одну перестройку"""
+        if not self.is_stale():
+            return
+        requested_at = time.monotonic()
+        with self._build_lock:
+            if self.built and self.built_at >= requested_at:
+                return
+            self.build()
+
+    def _compact(self):
+        """Пересборка структур без удаленных документов (без запросов к БД)"""
+        documents = [
+            (doc_key, title)
+            for doc_key, title, alive in zip(self.doc_keys, self.doc_titles, self.alive)
+            if alive
+        ]
+        self._reset()
+        for (doc_type, pk), title in documents:
+            self._add(doc_type, pk, title, keep_sorted=False)
+        self.terms.sort()
+
+    def _add(self, doc_type, pk, title, keep_sorted=True):
+        number = len(self.doc_keys)
+        self.doc_keys.append((doc_type, pk))
+        self.doc_titles.append(title)
+        self.doc_numbers[(doc_type, pk)] = number
+        self.alive.append(1)
+        for term in set(tokenize(title, min_length=1)):
+            posting = self.postings.get(term)
+            if posting is None:
+                self.postings[term] = array('I', [number])
+                if keep_sorted:
+                    insort(self.terms, term)
+                else:
+                    self.terms.append(term)
+            else:
+                posting.append(number)
+
+    def _remove(self, doc_type, pk):
+        number = self.doc_numbers.pop((doc_type, pk), None)
+        if number is not None:
+            self.alive[number] = 0
+            self.dead += 1
+        if self.dead >= max(COMPACT_MIN_DEAD, len(self.doc_keys) * COMPACT_DEAD_RATIO):
+            self._compact()
+
+    def update(self, doc_type, obj):
+        """
+        Добавление/обновление документа (если индекс уже построен)
+
+        Возвращает True, если документ изменился или индекс не построен (изменение неизвестно).
+        """
+        if not self.built:
+            return True
+        config = SUGGEST_DOCUMENTS[doc_type]
+        visible = all(getattr(obj, field) == value for field, value in config['filter'].items())
+        title = getattr(obj, config['field'])
+        with self._lock:
+            number = self.doc_numbers.get((doc_type, obj.pk))
+            if visible and number is not None and self.doc_titles[number] == title:
+                return False
+            if not visible and number is None:
+                return False
+            self._remove(doc_type, obj.pk)
+            if visible:
+                self._add(doc_type, obj.pk, title)
+        return True
+
+    def remove(self, doc_type, pk):
+        """Удаление документа; возвращает True, если он был в индексе или индекс не построен"""
+        if not self.built:
+            return True
+        with self._lock:
+            if (doc_type, pk) not in self.doc_numbers:
+                return False
+            self._remove(doc_type, pk)
+        return True
+
+    def adopt_version(self, version):
+        """
+        Версия после invalidate_suggest_index() из этого процесса: изменение в индексе уже есть.
+        Если версию за это время меняли и другие процессы, индекс остается устаревшим.
+        """
+        with self._lock:
+            if self.built and self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _prefix_matches(self, prefix):
+        """Номера документов, содержащих термин с данным префиксом"""
+        matches = set()
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            matches.update(self.postings[self.terms[position]])
+            position += 1
+        return matches
+
+    def suggest(self, query, limit=10, doc_types=None):
+        """
+        Документы, в названии которых есть слова, начинающиеся со всех слов запроса
+
+        Выше - названия, начинающиеся с запроса, затем более короткие.
+        """
+        self.ensure_fresh()
+        words = tokenize(query, min_length=1)
+        if not words:
+            return []
+        with self._lock:
+            # Сначала самое длинное (обычно самое редкое) слово, чтобы пересечение было минимальным
+            candidates = None
+            for word in sorted(words, key=len, reverse=True):
+                matches = self._prefix_matches(word)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+            query_lower = ' '.join(words)
+            results = []
+            for number in candidates:
+                if not self.alive[number]:
+                    continue
+                doc_type, pk = self.doc_keys[number]
+                if doc_types and doc_type not in doc_types:
+                    continue
+                title = self.doc_titles[number]
+                results.append((
+                    not title.lower().replace('ё', 'е').startswith(query_lower),
+                    len(title),
+                    number,
+                ))
+        return [
+            {'type': self.doc_keys[number][0], 'id': self.doc_keys[number][1], 'title': self.doc_titles[number]}
+            for _, _, number in heapq.nsmallest(limit, results)
+        ]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,669 @@
+"""
+Тесты API
+"""
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api import activity
+from api.activity import ActivityWriter
+from api.csv_import import row_hash
+from api.management.commands.load_csv_data import Command as LoadCsvCommand
+from api.models import (
+    User, Category, NGO, Event, EventRegistration, Favorite, Review, Tag, Material, ActivityHistory, ActivitySummary,
+)
+from api.ratings import reconcile
+from api.recommendations import rank_event_ids
+from api.recommendation_cache import RecommendationCache, recommendation_cache
+from api.response_cache import get_versions
+from api.statistics import reconcile as reconcile_statistics
+from api.suggest import SuggestIndex, suggest_index, VERSION_KEY as SUGGEST_VERSION_KEY
+
+
+# История активности пишется в запросе: фоновый поток ActivityWriter не обращается к тестовой БД
+SYNC_ACTIVITY = {'ASYNC': False}
+
+
+@override_settings(ACTIVITY_WRITER=SYNC_ACTIVITY)
+class SyncActivityTestCase(APITestCase):
+    """База тестов API с синхронной записью истории активности"""
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class EventListQueryCountTests(SyncActivityTestCase):
+    """Число SQL-запросов списка событий не зависит от числа событий (нет N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='password')
+        cls.category = Category.objects.create(name='Экология', slug='ecology')
+
+    def create_event(self, number):
+        ngo = NGO.objects.create(
+            name=f'НКО {number}',
+            slug=f'ngo-{number}',
+            category=self.category,
+            short_description='Описание',
+            description='Подробное описание',
+            city='Москва',
+            status='approved',
+        )
+        event = Event.objects.create(
+            ngo=ngo,
+            title=f'Событие {number}',
+            description='Описание события',
+            event_date=timezone.now() + timedelta(days=number + 1),
+            location='Москва',
+        )
+        EventRegistration.objects.create(event=event, user=self.user, name='Тестер', email='tester@example.com')
+        Favorite.objects.create(user=self.user, ngo=ngo)
+        return event
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response
+
+    def assert_constant_queries(self, path):
+        self.create_event(0)
+        single_count, response = self.count_queries(path)
+        self.assertEqual(len(response.data['results']), 1)
+
+        # Полная страница (PAGE_SIZE) событий разных НКО
+        for number in range(1, 9):
+            self.create_event(number)
+        with self.assertNumQueries(single_count):
+            response = self.client.get(path)
+        self.assertEqual(len(response.data['results']), 9)
+        return response
+
+    def test_anonymous_list(self):
+        self.assert_constant_queries('/api/events/')
+
+    def test_authenticated_list(self):
+        self.client.force_authenticate(self.user)
+        response = self.assert_constant_queries('/api/events/?upcoming=true')
+        for event in response.data['results']:
+            self.assertTrue(event['is_registered'])
+            self.assertEqual(event['registered_count'], 1)
+            self.assertTrue(event['ngo']['is_favorite'])
+
+
+def create_ngo(category, number, **fields):
+    values = {
+        'name': f'НКО {number}',
+        'slug': f'ngo-{number}',
+        'category': category,
+        'short_description': 'Помощь детям',
+        'description': 'Помощь детям и семьям',
+        'city': 'Москва',
+        'status': 'approved',
+    }
+    values.update(fields)
+    return NGO.objects.create(**values)
+
+
+def create_event(ngo, number, **fields):
+    values = {
+        'ngo': ngo,
+        'title': f'Событие {number}',
+        'description': 'Помощь детям',
+        'event_date': timezone.now() + timedelta(days=number + 1),
+        'location': 'Москва',
+    }
+    values.update(fields)
+    return Event.objects.create(**values)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class PaginationTests(SyncActivityTestCase):
+    """Обход списков по ссылкам next: без повторов и пропусков в обоих режимах пагинации"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Дети', slug='children')
+        # Повторяющиеся значения полей сортировки: порядок на границах страниц решает id
+        ngos = [create_ngo(category, number, rating=float(number % 3 + 3)) for number in range(23)]
+        NGO.objects.update(created_at=timezone.now())
+        create_ngo(category, 'pending', status='pending')
+        event_date = timezone.now() + timedelta(days=7)
+        for number in range(23):
+            create_event(ngos[number % 5], number, event_date=event_date + timedelta(days=number % 4))
+        cls.ngo_ids = set(NGO.objects.filter(status='approved').values_list('id', flat=True))
+        cls.event_ids = set(Event.objects.values_list('id', flat=True))
+
+    def walk(self, path):
+        """id всех элементов по цепочке ссылок next и ответ первой страницы"""
+        ids = []
+        first = None
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            first = first or response.data
+            ids.extend(item['id'] for item in response.data['results'])
+            path = response.data['next']
+        self.assertEqual(len(ids), len(set(ids)), 'повторы между страницами')
+        return ids, first
+
+    def test_cursor_ngos(self):
+        ids, first = self.walk('/api/ngos/?cursor=')
+        self.assertNotIn('count', first)
+        self.assertEqual(set(ids), self.ngo_ids)
+        expected = NGO.objects.filter(status='approved').order_by('-rating', '-created_at', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_cursor_events(self):
+        ids, first = self.walk('/api/events/?cursor=')
+        self.assertNotIn('count', first)
+        self.assertEqual(ids, list(Event.objects.order_by('event_date', 'id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/ngos/?cursor=bad').status_code, 404)
+
+    def test_ordering_falls_back_to_pages(self):
+        ids, first = self.walk('/api/ngos/?cursor=&ordering=rating')
+        self.assertEqual(first['count'], len(self.ngo_ids))
+        self.assertEqual(set(ids), self.ngo_ids)
+        ratings = [NGO.objects.get(id=ngo_id).rating for ngo_id in ids]
+        self.assertEqual(ratings, sorted(ratings))
+
+        ids, first = self.walk('/api/events/?cursor=&ordering=-event_date')
+        self.assertEqual(first['count'], len(self.event_ids))
+        self.assertEqual(set(ids), self.event_ids)
+
+    def test_search_falls_back_to_pages(self):
+        ids, first = self.walk(f'/api/ngos/?cursor=&search={quote("помощь")}')
+        self.assertEqual(first['count'], len(self.ngo_ids))
+        self.assertEqual(set(ids), self.ngo_ids)
+
+        ids, first = self.walk(f'/api/events/?cursor=&search={quote("помощь")}')
+        self.assertEqual(first['count'], len(self.event_ids))
+        self.assertEqual(set(ids), self.event_ids)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class ConditionalGetTests(SyncActivityTestCase):
+    """304 на повторный If-None-Match и новый ETag после изменения данных ответа"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='password')
+        cls.reviewer = User.objects.create_user(username='reviewer', password='password')
+        cls.category = Category.objects.create(name='Экология', slug='ecology')
+        cls.ngo = create_ngo(cls.category, 1)
+        cls.event = create_event(cls.ngo, 1)
+        cls.tag = Tag.objects.create(name='Волонтерство', slug='volunteering')
+        cls.material = Material.objects.create(title='Материал', url='https://example.com/material')
+        cls.material.tags.add(cls.tag)
+
+    def etag(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def assert_changed(self, paths, change):
+        """change() меняет ответ каждого пути: старый ETag больше не дает 304"""
+        etags = {path: self.etag(path) for path in paths}
+        change()
+        for path, etag in etags.items():
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotEqual(response['ETag'], etag, path)
+
+    def test_not_modified(self):
+        for path in ('/api/ngos/', f'/api/ngos/{self.ngo.id}/', '/api/events/', f'/api/events/{self.event.id}/'):
+            self.etag(path)
+
+    def test_last_modified(self):
+        response = self.client.get(f'/api/events/{self.event.id}/')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(
+            f'/api/events/{self.event.id}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_review_changes_etag(self):
+        self.assert_changed(
+            ['/api/ngos/', f'/api/ngos/{self.ngo.id}/', '/api/events/', f'/api/events/{self.event.id}/'],
+            lambda: Review.objects.create(ngo=self.ngo, user=self.reviewer, rating=4, comment='Хорошо'),
+        )
+
+    def test_favorite_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        self.assert_changed(
+            [f'/api/ngos/{self.ngo.id}/', '/api/events/', f'/api/events/{self.event.id}/'],
+            lambda: Favorite.objects.create(user=self.user, ngo=self.ngo),
+        )
+
+    def test_registration_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        self.assert_changed(
+            ['/api/events/', f'/api/events/{self.event.id}/'],
+            lambda: EventRegistration.objects.create(
+                event=self.event, user=self.user, name='Тестер', email='tester@example.com'
+            ),
+        )
+
+    def test_category_rename_changes_etag(self):
+        def rename():
+            self.category.name = 'Экология и природа'
+            self.category.save()
+
+        self.assert_changed(
+            ['/api/ngos/', f'/api/ngos/{self.ngo.id}/', '/api/events/', f'/api/events/{self.event.id}/'],
+            rename,
+        )
+
+    def test_tag_rename_changes_etag(self):
+        def rename():
+            self.tag.name = 'Добровольчество'
+            self.tag.save()
+
+        self.assert_changed(['/api/materials/', f'/api/materials/{self.material.id}/'], rename)
+
+
+@override_settings(SUGGEST_INDEX={'CHECK_INTERVAL': 0, 'MAX_AGE': 3600})
+class SuggestIndexTests(SyncActivityTestCase):
+    """Изменения из сигналов видны индексам других процессов через общую версию"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Экология', slug='ecology')
+        cls.ngo = create_ngo(cls.category, 1, name='Зеленый город')
+
+    def setUp(self):
+        # other - индекс другого процесса: сигналы этого процесса обновляют только suggest_index
+        suggest_index.build()
+        self.other = SuggestIndex()
+        self.other.build()
+
+    def titles(self, index, query):
+        return [item['title'] for item in index.suggest(query)]
+
+    def test_rename_reaches_other_process(self):
+        built_at = suggest_index.built_at
+        self.ngo.name = 'Чистый берег'
+        self.ngo.save()
+        self.assertEqual(self.titles(suggest_index, 'чист'), ['Чистый берег'])
+        # Процесс, изменивший индекс сам, его не перестраивает
+        self.assertEqual(suggest_index.built_at, built_at)
+        self.assertEqual(self.titles(self.other, 'чист'), ['Чистый берег'])
+        self.assertEqual(self.titles(self.other, 'зелен'), [])
+
+    def test_visibility_and_delete_reach_other_process(self):
+        self.ngo.status = 'rejected'
+        self.ngo.save()
+        self.assertEqual(self.titles(self.other, 'зелен'), [])
+        event = create_event(self.ngo, 1, title='Субботник')
+        self.assertEqual(self.titles(self.other, 'суббот'), ['Субботник'])
+        event.delete()
+        self.assertEqual(self.titles(self.other, 'суббот'), [])
+
+    def test_unrelated_update_fields_keep_version(self):
+        version = get_versions([SUGGEST_VERSION_KEY])[0]
+        self.ngo.save(update_fields=['participants_count'])
+        self.assertEqual(get_versions([SUGGEST_VERSION_KEY])[0], version)
+
+
+class RecommendationCacheTests(SyncActivityTestCase):
+    """Сброс кеша рекомендаций в одном процессе виден кешам других процессов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='password')
+        cls.category = Category.objects.create(name='Экология', slug='ecology')
+        cls.ngo = create_ngo(cls.category, 1)
+
+    def setUp(self):
+        # other - кеш другого процесса: сигналы этого процесса сбрасывают только recommendation_cache
+        self.other = RecommendationCache()
+        self.version = self.other.version(self.user.id)
+        self.other.set(self.user.id, 'ngos', 5, [self.ngo.id], self.version)
+
+    def test_hit_with_same_version(self):
+        self.assertEqual(self.other.get(self.user.id, 'ngos', 5, self.other.version(self.user.id)), [self.ngo.id])
+
+    def test_signal_invalidates_other_process(self):
+        Favorite.objects.create(user=self.user, ngo=self.ngo)
+        self.assertIsNone(self.other.get(self.user.id, 'ngos', 5, self.other.version(self.user.id)))
+
+    def test_clear_invalidates_other_process(self):
+        recommendation_cache.clear()
+        self.assertIsNone(self.other.get(self.user.id, 'ngos', 5, self.other.version(self.user.id)))
+
+    def test_stale_result_not_cached(self):
+        # Сброс во время расчета: результат сохраняется со старой версией и не отдается
+        recommendation_cache.invalidate_user(self.user.id)
+        self.other.set(self.user.id, 'ngos', 5, [self.ngo.id], self.version)
+        self.assertIsNone(self.other.get(self.user.id, 'ngos', 5, self.other.version(self.user.id)))
+
+    @override_settings(RESPONSE_CACHE={'WORKERS': 2})
+    def test_disabled_without_shared_versions(self):
+        self.assertIsNone(self.other.version(self.user.id))
+        self.other.set(self.user.id, 'events', 5, [1], None)
+        self.assertIsNone(self.other.get(self.user.id, 'events', 5, None))
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class CsvUpsertTests(SyncActivityTestCase):
+    """Повторная загрузка CSV в режиме upsert: счетчики, хеши и статусы НКО"""
+
+    ROWS = [
+        ['Москва', 'Дети', 'Фонд Радуга', 'Помощь детям', 'https://raduga.example.com'],
+        ['Казань', 'Дети', 'Центр Опора', 'Помощь семьям', '-'],
+        ['Тверь', 'Экология', 'Зеленый берег', 'Уборка берегов', ''],
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.materials = self.write('materials.csv', [])
+        # НКО, созданная на сайте (без хеша импорта), не затрагивается --soft-delete
+        category = Category.objects.create(name='Дети', slug='deti')
+        self.manual = create_ngo(category, 'manual', name='Центр Опора', city='Самара')
+
+    def write(self, name, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines('; '.join(row) + '\n' for row in rows)
+        return path
+
+    def load(self, rows, *args):
+        command = LoadCsvCommand()
+        call_command(
+            command, '--mode', 'upsert', '--workers', '1', *args,
+            ngos=[self.write('ngos.csv', rows)], materials=[self.materials], stdout=StringIO(),
+        )
+        return command.summary
+
+    def imported(self, name):
+        return NGO.objects.get(name=name, import_hash__gt='')
+
+    def assert_counts(self, summary, **expected):
+        counts = {key: summary[key] for key in ('created', 'updated', 'unchanged', 'restored', 'archived')}
+        self.assertEqual(counts, {key: expected.get(key, 0) for key in counts})
+
+    def test_reload_with_edit_and_removal(self):
+        self.assert_counts(self.load(self.ROWS), created=3)
+        hashes = dict(NGO.objects.filter(import_hash__gt='').values_list('name', 'import_hash'))
+        self.assertEqual(hashes['Фонд Радуга'], row_hash(tuple(self.ROWS[0])))
+
+        # Тот же файл: хеши стабильны, ничего не меняется
+        self.assert_counts(self.load(self.ROWS), unchanged=3)
+        self.assertEqual(dict(NGO.objects.filter(import_hash__gt='').values_list('name', 'import_hash')), hashes)
+
+        # Одна строка изменена, одна удалена
+        edited = [self.ROWS[0], ['Казань', 'Дети', 'Центр Опора', 'Помощь семьям с детьми', '-']]
+        self.assert_counts(self.load(edited, '--soft-delete'), updated=1, unchanged=1, archived=1)
+        self.assertEqual(self.imported('Фонд Радуга').import_hash, hashes['Фонд Радуга'])
+        opora = self.imported('Центр Опора')
+        self.assertEqual(opora.description, 'Помощь семьям с детьми')
+        self.assertEqual(opora.import_hash, row_hash(tuple(edited[1])))
+        self.assertEqual(
+            dict(NGO.objects.values_list('name', 'status').filter(import_hash__gt='')),
+            {'Фонд Радуга': 'approved', 'Центр Опора': 'approved', 'Зеленый берег': 'archived'},
+        )
+        self.manual.refresh_from_db()
+        self.assertEqual(self.manual.status, 'approved')
+        self.assertEqual(NGO.objects.count(), 4)
+
+        # Удаленная строка вернулась: НКО восстанавливается из архива
+        self.assert_counts(self.load(self.ROWS), updated=1, unchanged=1, restored=1)
+        self.assertEqual(self.imported('Зеленый берег').status, 'approved')
+        self.assertEqual(NGO.objects.count(), 4)
+
+
+class RatingCounterTests(SyncActivityTestCase):
+    """Счетчики оценок, которые ведут сигналы отзывов, совпадают с пересчетом reconcile_ratings"""
+
+    def test_counters_match_reconcile(self):
+        category = Category.objects.create(name='Экология', slug='ecology')
+        first, second = create_ngo(category, 1), create_ngo(category, 2)
+        users = [User.objects.create_user(username=f'user{number}', password='password') for number in range(4)]
+        reviews = [
+            Review.objects.create(ngo=first, user=user, rating=rating, comment='Отзыв')
+            for user, rating in zip(users, [5, 4, 2, 3])
+        ]
+        Review.objects.create(ngo=second, user=users[0], rating=1, comment='Отзыв')
+
+        # Изменение оценки, перенос отзыва в другую НКО и удаление
+        reviews[0].rating = 3
+        reviews[0].save()
+        reviews[1].ngo = second
+        reviews[1].save()
+        reviews[2].delete()
+        reviews[3].comment = 'Без изменения оценки'
+        reviews[3].save()
+
+        counters = dict(NGO.objects.values_list('id', 'rating_count'))
+        rating_values = dict(NGO.objects.values_list('id', 'rating'))
+        self.assertEqual(counters, {first.id: 2, second.id: 2})
+        self.assertAlmostEqual(rating_values[first.id], 3.0)
+        self.assertAlmostEqual(rating_values[second.id], 2.5)
+        self.assertEqual(reconcile(), {})
+        self.assertEqual(dict(NGO.objects.values_list('id', 'rating_count')), counters)
+
+        # Все отзывы удалены: счетчики и рейтинг обнуляются
+        Review.objects.all().delete()
+        self.assertEqual(list(NGO.objects.values_list('rating_sum', 'rating_count', 'rating')), [(0, 0, 0.0)] * 2)
+        self.assertEqual(reconcile(), {})
+
+
+def activity_entries(user, ngo_id, types):
+    return [ActivityHistory(user=user, ngo_id=ngo_id, activity_type=activity_type) for activity_type in types]
+
+
+def summary_counts(user):
+    return dict(ActivitySummary.objects.filter(user=user).values_list('ngo_id', 'views_count'))
+
+
+@override_settings(ACTIVITY_WRITER={**SYNC_ACTIVITY, 'FLUSH_INTERVAL': 1, 'MAX_RETRY_DELAY': 60})
+class ActivityWriterTests(SyncActivityTestCase):
+    """Запись пачки истории: повтор после OperationalError и сводка в той же транзакции"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='password')
+        cls.ngo = create_ngo(Category.objects.create(name='Экология', slug='ecology'), 1)
+
+    def test_retry_after_operational_error(self):
+        writer = ActivityWriter()
+        rollup = activity.rollup_activity
+        calls = []
+
+        def failing_once(entries):
+            calls.append(len(entries))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return rollup(entries)
+
+        with mock.patch.object(activity, 'rollup_activity', side_effect=failing_once), \
+                self.assertLogs('api.activity', 'WARNING'):
+            # Как в фоновом потоке: при ошибке пачка возвращается в очередь
+            self.assertEqual(writer._write(activity_entries(self.user, self.ngo.id, ['view'] * 3), requeue=True), 0)
+            # Сводка не записалась - откатились и события
+            self.assertEqual(ActivityHistory.objects.count(), 0)
+            self.assertEqual(len(writer.queue), 3)
+            self.assertEqual(writer.retries, 1)
+            self.assertIsNotNone(writer.retry_at)
+
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(calls, [3, 3])
+        self.assertEqual(ActivityHistory.objects.count(), 3)
+        self.assertEqual(summary_counts(self.user), {self.ngo.id: 3})
+        self.assertEqual((writer.retries, writer.retry_at, writer.written, writer.failed), (0, None, 3, 0))
+
+    def test_lost_without_requeue(self):
+        writer = ActivityWriter()
+        with mock.patch.object(activity, 'rollup_activity', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('api.activity', 'ERROR'):
+            self.assertEqual(writer._write(activity_entries(self.user, self.ngo.id, ['view'])), 0)
+        self.assertEqual((writer.queue, writer.failed), ([], 1))
+        self.assertEqual(ActivityHistory.objects.count(), 0)
+
+    def test_request_writes_synchronously(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(f'/api/ngos/{self.ngo.id}/favorite/').status_code, 201)
+        self.assertEqual(ActivityHistory.objects.filter(user=self.user, activity_type='favorite').count(), 1)
+        self.assertEqual(
+            list(ActivitySummary.objects.filter(user=self.user).values_list('ngo_id', 'favorites_count')),
+            [(self.ngo.id, 1)],
+        )
+
+
+@override_settings(ACTIVITY_WRITER=SYNC_ACTIVITY)
+class ActivityWriterIntegrityTests(APITransactionTestCase):
+    """
+    Пачка с ошибочным событием пишется по одному
+
+    Внешние ключи SQLite проверяются при фиксации транзакции, поэтому нужен TransactionTestCase.
+    """
+
+    def test_per_row_fallback(self):
+        user = User.objects.create_user(username='tester', password='password')
+        ngo = create_ngo(Category.objects.create(name='Экология', slug='ecology'), 1)
+        other = create_ngo(Category.objects.get(), 2)
+        batch = activity_entries(user, ngo.id, ['view', 'view']) + activity_entries(user, other.id, ['view'])
+        other.delete()
+
+        writer = ActivityWriter()
+        with self.assertLogs('api.activity', 'ERROR'):
+            self.assertEqual(writer._write(batch, requeue=True), 2)
+        self.assertEqual((writer.written, writer.failed, writer.queue), (2, 1, []))
+        self.assertEqual(list(ActivityHistory.objects.values_list('ngo_id', flat=True)), [ngo.id, ngo.id])
+        # Сводка записана только для сохраненных событий
+        self.assertEqual(summary_counts(user), {ngo.id: 2})
+
+
+class EventRankingTests(SyncActivityTestCase):
+    """Векторный подсчет баллов событий против прежнего построчного"""
+
+    @classmethod
+    def setUpTestData(cls):
+        interest = Category.objects.create(name='Экология', slug='ecology')
+        other = Category.objects.create(name='Дети', slug='children')
+        cls.user = User.objects.create_user(username='tester', password='password', interests=['Экология'])
+        ngos = [
+            create_ngo(interest, 1, rating=4.0),
+            create_ngo(other, 2, rating=5.0),
+            create_ngo(interest, 3, rating=1.5),
+        ]
+        # Лучшие признаки у события НКО на модерации: отсеивается фильтром одобренных НКО
+        cls.pending_ngo = create_ngo(interest, 'pending', status='pending', rating=5.0)
+        for number, days in enumerate([3, 10, 45, 20, 3, 100]):
+            create_event(ngos[number % 3], number, event_date=timezone.now() + timedelta(days=days, hours=1))
+        cls.pending_event = create_event(cls.pending_ngo, 10, event_date=timezone.now() + timedelta(days=2))
+        registered = create_event(ngos[0], 11, event_date=timezone.now() + timedelta(days=1))
+        EventRegistration.objects.create(event=registered, user=cls.user, name='Тестер', email='tester@example.com')
+
+    def baseline(self, events):
+        """Прежние правила: построчный балл и стабильная сортировка по убыванию"""
+        scored = []
+        for event in events:
+            score = 0
+            if event.ngo.category.name in self.user.interests:
+                score += 10
+            score += min(event.registrations.count() / 5, 5)
+            score += event.ngo.rating * 2
+            days_until = (event.event_date.date() - timezone.now().date()).days
+            if days_until <= 7:
+                score += 5
+            elif days_until <= 30:
+                score += 3
+            scored.append((event.id, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return [event_id for event_id, _ in scored]
+
+    def test_same_order_as_baseline(self):
+        events = Event.objects.filter(ngo__status='approved', event_date__gte=timezone.now()).exclude(
+            registrations__user=self.user
+        ).order_by('event_date', 'id')
+        expected = self.baseline(events)
+        self.assertEqual(rank_event_ids(self.user, limit=len(expected)), expected)
+        self.assertEqual(rank_event_ids(self.user, limit=3), expected[:3])
+
+    def test_pending_ngo_events_excluded(self):
+        ranked = rank_event_ids(self.user, limit=100)
+        self.assertNotIn(self.pending_event.id, ranked)
+        self.pending_ngo.status = 'approved'
+        self.pending_ngo.save()
+        self.assertEqual(rank_event_ids(self.user, limit=1), [self.pending_event.id])
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class NearbyValidationTests(SyncActivityTestCase):
+    """Параметры /api/ngos/nearby: нечисловые, бесконечные и вне диапазона - 400"""
+
+    def test_invalid_parameters(self):
+        for query in (
+            'lng=37.6', 'lat=abc&lng=37.6',
+            'lat=nan&lng=37.6', 'lat=55.7&lng=nan', 'lat=55.7&lng=37.6&radius=nan',
+            'lat=inf&lng=37.6', 'lat=55.7&lng=-inf', 'lat=55.7&lng=37.6&radius=inf',
+            'lat=90.5&lng=37.6', 'lat=-91&lng=37.6', 'lat=55.7&lng=180.1', 'lat=55.7&lng=-181',
+            'lat=55.7&lng=37.6&radius=0', 'lat=55.7&lng=37.6&radius=-5',
+        ):
+            self.assertEqual(self.client.get(f'/api/ngos/nearby/?{query}').status_code, 400, query)
+
+    def test_valid_bounds(self):
+        for query in ('lat=90&lng=180&radius=1', 'lat=-90&lng=-180', 'lat=55.7&lng=37.6&radius=100000'):
+            response = self.client.get(f'/api/ngos/nearby/?{query}')
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(response.data['results'], [])
+
+
+class StatisticsTests(SyncActivityTestCase):
+    """Счетчики одобренных НКО по категориям, которые ведут сигналы, совпадают с полным пересчетом"""
+
+    def categories(self):
+        response = self.client.get('/api/statistics')
+        self.assertEqual(response.status_code, 200)
+        return response.data['total_ngos'], {item['name']: item['ngo_count'] for item in response.data['categories']}
+
+    def test_counters_match_reconcile(self):
+        ecology = Category.objects.create(name='Экология', slug='ecology')
+        children = Category.objects.create(name='Дети', slug='children')
+        self.assertEqual(reconcile_statistics(), {})
+        first = create_ngo(ecology, 1)
+        second = create_ngo(ecology, 2)
+        pending = create_ngo(children, 3, status='pending')
+        self.assertEqual(self.categories(), (2, {'Экология': 2, 'Дети': 0}))
+
+        # Одобрение, смена категории, снятие с публикации и удаление
+        pending.status = 'approved'
+        pending.save()
+        first.category = children
+        first.save()
+        second.status = 'rejected'
+        second.save()
+        create_ngo(ecology, 4).delete()
+        # Новая категория без НКО и переименование видны сразу
+        Category.objects.create(name='Животные', slug='animals')
+        ecology.name = 'Экология и природа'
+        ecology.save()
+
+        self.assertEqual(self.categories(), (2, {'Экология и природа': 0, 'Дети': 2, 'Животные': 0}))
+        self.assertEqual(reconcile_statistics(), {})
+
+    def test_reconcile_fixes_bulk_changes(self):
+        ecology = Category.objects.create(name='Экология', slug='ecology')
+        create_ngo(ecology, 1)
+        self.assertEqual(self.categories(), (1, {'Экология': 1}))
+        # update() не вызывает сигналы
+        NGO.objects.update(status='archived')
+        drift = reconcile_statistics()
+        self.assertEqual(drift['total_ngos'], (1, 0))
+        self.assertEqual(drift['categories'], {ecology.id: (1, 0)})
+        self.assertEqual(self.categories(), (0, {'Экология': 0}))
@@ -0,0 +1,171 @@
+"""
+Обработка текста: токенизация, стемминг и slug для русского языка
+Стеммер - упрощенная реализация алгоритма Snowball (Porter) для русского языка,
+без внешних зависимостей.
+"""
+import re
+from functools import lru_cache
+
+from django.utils.text import slugify
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# "г. Омск", "город Омск"
+_CITY_PREFIX = re.compile(r'^(?:г\.|г\s|город\s)\s*', re.IGNORECASE)
+_VOWELS = set('аеиоуыэюя')
+
+
+def _by_length(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+# Окончания группы 1 допустимы только после "а" или "я"
+PERFECTIVE_GERUND_1 = _by_length(['в', 'вши', 'вшись'])
+PERFECTIVE_GERUND_2 = _by_length(['ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'])
+REFLEXIVE = _by_length(['ся', 'сь'])
+ADJECTIVE = _by_length([
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+])
+PARTICIPLE_1 = _by_length(['ем', 'нн', 'вш', 'ющ', 'щ'])
+PARTICIPLE_2 = _by_length(['ивш', 'ывш', 'ующ'])
+VERB_1 = _by_length([
+    'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+])
+VERB_2 = _by_length([
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+    'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+])
+NOUN = _by_length([
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+    'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю',
+    'ия', 'ья', 'я',
+])
+SUPERLATIVE = _by_length(['ейш', 'ейше'])
+DERIVATIONAL = _by_length(['ост', 'ость'])
+
+
+def _strip(word, endings, after_a_ya=False):
+    """Удаляет самое длинное подходящее окончание; возвращает None, если ничего не удалено"""
+    for ending in endings:
+        if word.endswith(ending):
+            result = word[:-len(ending)]
+            if after_a_ya and not result.endswith(('а', 'я')):
+                continue
+            return result
+    return None
+
+
+def _strip_grouped(word, group_1, group_2):
+    """Удаляет окончание из группы 2 или группы 1 (после "а"/"я"), выбирая самое длинное"""
+    candidates = [s for s in (_strip(word, group_2), _strip(word, group_1, after_a_ya=True)) if s is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=len)
+
+
+def _region_start(word):
+    """Начало региона R1: после первой согласной, следующей за гласной"""
+    for i in range(1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Основа русского слова; слова на других языках возвращаются в нижнем регистре"""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    if not rv:
+        return word
+
+    # Шаг 1: деепричастие, либо возвратность + прилагательное/глагол/существительное
+    result = _strip_grouped(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if result is None:
+        reflexive = _strip(rv, REFLEXIVE)
+        if reflexive is not None:
+            rv = reflexive
+        result = _strip(rv, ADJECTIVE)
+        if result is not None:
+            result = _strip_grouped(result, PARTICIPLE_1, PARTICIPLE_2) or result
+        else:
+            result = _strip_grouped(rv, VERB_1, VERB_2)
+            if result is None:
+                result = _strip(rv, NOUN)
+    rv = result if result is not None else rv
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные окончания в R2
+    word = prefix + rv
+    r1 = _region_start(word)
+    r2 = r1 + _region_start(word[r1:])
+    for ending in DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        superlative = _strip(rv, SUPERLATIVE)
+        if superlative is not None:
+            rv = superlative
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text, min_length=2):
+    """Слова текста в нижнем регистре"""
+    return [
+        token for token in _WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+        if len(token) >= min_length and not token.isdigit()
+    ]
+
+
+def normalize_phrase(text):
+    """Слова текста (включая числа) в нижнем регистре через пробел - без пунктуации и лишних пробелов"""
+    return ' '.join(_WORD_RE.findall((text or '').lower().replace('ё', 'е')))
+
+
+def clean_city(value):
+    """Название города без региона и префикса: "Глазов, УР" -> "Глазов", "г. Омск" -> "Омск" """
+    city = (value or '').split(',', 1)[0]
+    city = _CITY_PREFIX.sub('', city.strip())
+    return ' '.join(city.split())
+
+
+def city_key(value):
+    """Ключ варианта написания города (CityAlias.key): без регистра, пунктуации и лишних пробелов"""
+    return normalize_phrase(value)[:100]
+
+
+def stem_tokens(text, min_length=2):
+    """Основы слов текста для индексации и поиска"""
+    return [stem(token) for token in tokenize(text, min_length)]
+
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def slugify_ru(value, max_length=50):
+    """
+    ASCII-slug с транслитерацией кириллицы
+
+    django.utils.text.slugify без allow_unicode превращает русский текст в пустую строку.
+    """
+    slug = slugify(str(value).lower().translate(_TRANSLIT))
+    return slug[:max_length].strip('-')
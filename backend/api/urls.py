@@ -4,8 +4,9 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     CategoryViewSet, NGOViewSet, EventViewSet, ModerationViewSet,
     TagViewSet, MaterialViewSet, UserLibraryViewSet, NewsViewSet,
-    register_user, get_current_user, recommendations, search,
-    statistics, map_ngos, contact
+    register_user, get_current_user, recommendations, recommendations_cache_stats, search,
+    search_suggest,
+    statistics, map_ngos, map_tile, contact, metrics
 )
 
 router = DefaultRouter()
@@ -27,19 +28,25 @@ urlpatterns = [
     
     # Рекомендации
     path('recommendations', recommendations, name='recommendations'),
+    path('recommendations/cache', recommendations_cache_stats, name='recommendations_cache_stats'),
     
     # Поиск
     path('search', search, name='search'),
+    path('search/suggest', search_suggest, name='search_suggest'),
     
     # Статистика
     path('statistics', statistics, name='statistics'),
     
     # Карта
     path('map/ngos', map_ngos, name='map_ngos'),
+    path('map/tiles/<int:z>/<int:x>/<int:y>', map_tile, name='map_tile'),
     
     # Контакты
     path('contact', contact, name='contact'),
     
+    # Метрики
+    path('_metrics', metrics, name='metrics'),
+    
     # Router endpoints
     path('', include(router.urls)),
 ]
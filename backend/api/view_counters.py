@@ -0,0 +1,150 @@
+"""
+Отложенная запись счетчиков просмотров
+Просмотр материала или новости увеличивает счетчик в памяти процесса, без записи в БД.
+Накопленные приращения записываются запросами UPDATE ... SET views_count = views_count + n
+(один запрос на модель и значение n) фоновым потоком: через FLUSH_INTERVAL секунд после
+первого незаписанного просмотра, сразу при MAX_PENDING незаписанных просмотрах и при
+завершении процесса (atexit). Счетчик в ответе - значение из БД плюс
+незаписанные просмотры этого процесса, то есть приблизительный.
+Настройки - VIEW_COUNTERS; FLUSH_INTERVAL = 0 - запись при каждом просмотре.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Ограничение числа id в одном UPDATE (лимит параметров SQLite)
+UPDATE_BATCH_SIZE = 500
+
+
+def _settings():
+    return getattr(settings, 'VIEW_COUNTERS', {})
+
+
+class ViewCounterBuffer:
+    """Буфер приращений счетчика field: (модель, id) -> число незаписанных просмотров"""
+
+    def __init__(self, field='views_count'):
+        self.field = field
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.pending = defaultdict(int)
+        self.total = 0
+        self.first_pending_at = None
+        self.thread = None
+        self.stopping = False
+        self.errors = 0
+        self._atexit_registered = False
+
+    def increment(self, model, pk, amount=1):
+        """Учитывает просмотр; возвращает незаписанные просмотры объекта вместе с этим"""
+        options = _settings()
+        with self.condition:
+            if not self.pending:
+                self.first_pending_at = time.monotonic()
+            self.pending[(model, pk)] += amount
+            pending = self.pending[(model, pk)]
+            self.total += amount
+            synchronous = options.get('FLUSH_INTERVAL', 10) <= 0
+            if not synchronous:
+                if self.thread is None or not self.thread.is_alive():
+                    self._start()
+                if self.total >= options.get('MAX_PENDING', 1000):
+                    self.condition.notify()
+        if synchronous:
+            self.flush()
+        return pending
+
+    def pending_for(self, model, pk):
+        with self.lock:
+            return self.pending.get((model, pk), 0)
+
+    def shutdown(self, timeout=10):
+        """Остановка потока с записью оставшихся просмотров"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
+
+    def _start(self):
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name='view-counter-flush', daemon=True)
+        self.thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def _due(self):
+        options = _settings()
+        return self.stopping or self.total >= options.get('MAX_PENDING', 1000) or (
+            self.pending and time.monotonic() - self.first_pending_at >= options.get('FLUSH_INTERVAL', 10)
+        )
+
+    def _run(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self._due():
+                        timeout = None
+                        if self.pending:
+                            timeout = max(
+                                _settings().get('FLUSH_INTERVAL', 10) - (time.monotonic() - self.first_pending_at), 0.01
+                            )
+                        self.condition.wait(timeout)
+                    stopping = self.stopping
+                close_old_connections()
+                errors = self.errors
+                self.flush()
+                if stopping:
+                    return
+                if self.errors > errors:
+                    # БД недоступна: следующая попытка не раньше чем через FLUSH_INTERVAL
+                    with self.condition:
+                        if not self.stopping:
+                            self.condition.wait(_settings().get('FLUSH_INTERVAL', 10))
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Запись накопленных приращений; возвращает число обновленных строк"""
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+            self.total = 0
+        if not pending:
+            return 0
+
+        groups = defaultdict(list)
+        for (model, pk), amount in pending.items():
+            groups[(model, amount)].append(pk)
+        updated = 0
+        try:
+            with transaction.atomic():
+                for (model, amount), pks in groups.items():
+                    for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+                        updated += model.objects.filter(pk__in=pks[start:start + UPDATE_BATCH_SIZE]).update(
+                            **{self.field: F(self.field) + amount}
+                        )
+        except Exception:
+            # Просмотры возвращаются в буфер и будут записаны при следующем сбросе
+            logger.exception('Не удалось записать счетчики просмотров')
+            with self.lock:
+                self.errors += 1
+                if not self.pending:
+                    self.first_pending_at = time.monotonic()
+                for key, amount in pending.items():
+                    self.pending[key] += amount
+                    self.total += amount
+            return 0
+        return updated
+
+
+view_counter = ViewCounterBuffer()
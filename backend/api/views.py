@@ -1,18 +1,21 @@
-from rest_framework import viewsets, status, filters
+import math
+
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny, IsAdminUser
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Sum, Avg
+from django.db.models.functions import Substr
 from django.db import models
 from django.utils import timezone
 
 from django.contrib.auth import get_user_model
 from .models import (
     Category, NGO, Favorite, Event, EventRegistration,
-    Review, ActivityHistory, ModerationRequest, ContactMessage,
+    Review, ModerationRequest, ContactMessage,
     Tag, Material, UserLibrary, News
 )
 from .serializers import (
@@ -24,47 +27,64 @@ from .serializers import (
     UserLibrarySerializer, NewsSerializer
 )
 from .recommendations import get_recommendations
+from .cities import canonical_city
+from .view_counters import view_counter
+from .activity import record_activity
+from .search import FullTextSearchFilter, RelevanceOrderingFilter, search_queryset
+from .suggest import suggest_index, SUGGEST_DOCUMENTS
+from .recommendation_cache import recommendation_cache
+from .metrics import metrics_registry
+from .response_cache import AnonymousResponseCacheMixin, cache_anonymous_response
+from .conditional import ConditionalGetMixin
+from .statistics import statistics_data
+from .spatial import nearest_ngo_ids, NEARBY_DEFAULT_RADIUS_KM, NEARBY_MAX_RADIUS_KM
+from .geo import (
+    QUADKEY_ZOOM, MAP_POINTS_ZOOM, MAP_TILE_MAX_POINTS, CLUSTER_DEPTH,
+    tile_quadkey, quadkey_range, is_valid_tile
+)
 
 User = get_user_model()
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(AnonymousResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     """API для категорий"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    cache_models = [Category]
 
 
-class NGOViewSet(viewsets.ModelViewSet):
+class NGOViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """API для НКО"""
     queryset = NGO.objects.filter(status='approved')
     serializer_class = NGOSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Список для анонимных пользователей кешируется (reviews_count зависит от Review)
+    cache_models = [NGO, Category, Review]
+    etag_aggregates = {'etag_reviews': Sum('rating_count')}
+    etag_models = [Category]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RelevanceOrderingFilter]
     # filterset_fields = ['city', 'category']
     search_fields = ['name', 'description', 'short_description']
+    search_doc_type = 'ngo'
+    # Keyset-пагинация (?cursor=): id - уникальный ключ для строгого порядка
+    cursor_ordering = ['-rating', '-created_at', '-id']
     ordering_fields = ['rating', 'created_at', 'participants_count']
     ordering = ['-rating', '-created_at']
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('category')
         
         # Фильтр по городу
-        print("NGOView base queryset ", queryset.all())
         city = self.request.query_params.get('city')
-        print("NGOView city", city)
         if city:
-            city = city.strip().split(",")[0].strip()
-            print("NGOView city filter", city)
-            queryset = queryset.filter(city__icontains=city)
-        print("NGOView after city filter", queryset.all())
+            # Вариант написания -> каноническое название: равенство по индексу (city, status)
+            city = canonical_city(city)
+            queryset = queryset.filter(city=city)
         # Фильтр по категории
         category = self.request.query_params.get('category')
-        print("NGOView category", category)
-        print(bool(category))
         if category:
             queryset = queryset.filter(category__slug=category)
-        print("NGOView after category filter", queryset.all())
         
         return queryset
     
@@ -73,6 +93,10 @@ class NGOViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
     
+    def get_user_etag_querysets(self):
+        # is_favorite в ответе зависит от избранного пользователя
+        return [Favorite.objects.filter(user=self.request.user)]
+    
     def create(self, request, *args, **kwargs):
         """Создание НКО (требует авторизации)"""
         serializer = self.get_serializer(data=request.data)
@@ -83,7 +107,7 @@ class NGOViewSet(viewsets.ModelViewSet):
         ModerationRequest.objects.create(ngo=serializer.instance)
         
         # Запись в историю активности
-        ActivityHistory.objects.create(
+        record_activity(
             user=request.user,
             activity_type='view',
             ngo=serializer.instance
@@ -102,7 +126,7 @@ class NGOViewSet(viewsets.ModelViewSet):
                 ngo=ngo
             )
             if created:
-                ActivityHistory.objects.create(
+                record_activity(
                     user=request.user,
                     activity_type='favorite',
                     ngo=ngo
@@ -117,10 +141,41 @@ class NGOViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def favorites(self, request):
         """Список избранных НКО пользователя"""
-        favorites = Favorite.objects.filter(user=request.user)
+        favorites = Favorite.objects.filter(user=request.user).select_related('ngo__category')
         serializer = FavoriteSerializer(favorites, many=True, context={'request': request})
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def nearby(self, request):
+        """Ближайшие НКО: ?lat=&lng=&radius=км&limit=, по возрастанию расстояния"""
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(request.query_params.get('limit', 20))
+        except (KeyError, ValueError):
+            return Response({'error': 'Нужны числовые параметры lat и lng'}, status=status.HTTP_400_BAD_REQUEST)
+        # float() принимает 'nan' и 'inf': NaN не отсекается сравнениями ниже
+        if not all(math.isfinite(value) for value in (lat, lng, radius)):
+            return Response({'error': 'lat, lng и radius должны быть конечными числами'}, status=status.HTTP_400_BAD_REQUEST)
+        if not -90 <= lat <= 90:
+            return Response({'error': 'lat должна быть от -90 до 90'}, status=status.HTTP_400_BAD_REQUEST)
+        if not -180 <= lng <= 180:
+            return Response({'error': 'lng должна быть от -180 до 180'}, status=status.HTTP_400_BAD_REQUEST)
+        if radius <= 0:
+            return Response({'error': 'radius должен быть больше 0'}, status=status.HTTP_400_BAD_REQUEST)
+        radius = min(radius, NEARBY_MAX_RADIUS_KM)
+        limit = max(1, min(limit, 100))
+        
+        nearest = nearest_ngo_ids(lat, lng, radius, limit)
+        ngos = NGO.objects.filter(id__in=[ngo_id for ngo_id, _ in nearest]).select_related('category').in_bulk()
+        ordered = [ngos[ngo_id] for ngo_id, _ in nearest if ngo_id in ngos]
+        data = NGOSerializer(ordered, many=True, context={'request': request}).data
+        distances = dict(nearest)
+        for item in data:
+            item['distance_km'] = round(distances[item['id']], 3)
+        return Response({'count': len(data), 'results': data})
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def review(self, request, pk=None):
         """Создание отзыва о НКО"""
@@ -129,7 +184,7 @@ class NGOViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         serializer.save(ngo=ngo)
         
-        ActivityHistory.objects.create(
+        record_activity(
             user=request.user,
             activity_type='review',
             ngo=ngo,
@@ -139,19 +194,31 @@ class NGOViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """API для событий"""
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # В событие вложена НКО (название, рейтинг, отзывы, is_favorite): ее изменения тоже меняют ETag
+    etag_aggregates = {
+        'etag_registrations': Sum('registrations_count'),
+        'etag_ngo_reviews': Sum('ngo__rating_count'),
+        'etag_ngo_rating': Sum('ngo__rating_sum'),
+    }
+    modified_fields = ['updated_at', 'ngo__updated_at']
+    etag_models = [Category]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RelevanceOrderingFilter]
     filterset_fields = ['ngo']
     search_fields = ['title', 'description']
+    search_doc_type = 'event'
+    cursor_ordering = ['event_date', 'id']
     ordering_fields = ['event_date']
     ordering = ['event_date']
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('ngo__category').annotate(
+            registrations_count=Count('registrations', distinct=True)
+        )
         
         # Фильтр по дате (будущие события)
         upcoming = self.request.query_params.get('upcoming')
@@ -170,6 +237,13 @@ class EventViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
     
+    def get_user_etag_querysets(self):
+        # is_registered и is_favorite вложенной НКО зависят от регистраций и избранного пользователя
+        return [
+            EventRegistration.objects.filter(user=self.request.user),
+            Favorite.objects.filter(user=self.request.user),
+        ]
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def register(self, request, pk=None):
         """Регистрация на событие"""
@@ -181,7 +255,7 @@ class EventViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         serializer.save(event=event)
         
-        ActivityHistory.objects.create(
+        record_activity(
             user=request.user,
             activity_type='event_registration',
             event=event
@@ -204,10 +278,8 @@ class EventViewSet(viewsets.ModelViewSet):
 @permission_classes([AllowAny])
 def register_user(request):
     """Регистрация нового пользователя"""
-    print("request.data", request.data)
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
-        print("serializer is valid")
         user = serializer.save()
         refresh = RefreshToken.for_user(user)
         return Response({
@@ -244,12 +316,12 @@ def recommendations(request):
     """AI-рекомендации для пользователя"""
     rec_type = request.query_params.get('type', 'ngos')
     
-    if rec_type == 'ngos':
-        recommendations_data = get_recommendations(request.user, 'ngos')
+    if rec_type in ('ngos', 'similar'):
+        recommendations_data = get_recommendations(request.user, rec_type)
         serializer = NGOSerializer(recommendations_data, many=True, context={'request': request})
         return Response({
             'ngos': serializer.data,
-            'type': 'ngos'
+            'type': rec_type
         })
     elif rec_type == 'events':
         recommendations_data = get_recommendations(request.user, 'events')
@@ -262,13 +334,32 @@ def recommendations(request):
     return Response({'error': 'Invalid type'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def recommendations_cache_stats(request):
+    """Счетчики кеша рекомендаций (только для администраторов)"""
+    return Response(recommendation_cache.stats())
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Метрики запросов к API по представлениям (только для администраторов); DELETE - сброс"""
+    if request.method == 'DELETE':
+        metrics_registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    data = metrics_registry.snapshot()
+    data['recommendation_cache'] = recommendation_cache.stats()
+    return Response(data)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def search(request):
     """Универсальный поиск"""
     query = request.query_params.get('q', '')
     search_type = request.query_params.get('type', 'all')
-    city = request.query_params.get('city', '').strip().split(",")[0].strip()
+    city = canonical_city(request.query_params.get('city', ''))
     
     if not query:
         return Response({'results': {}}, status=status.HTTP_200_OK)
@@ -276,58 +367,55 @@ def search(request):
     results = {}
     
     if search_type in ['all', 'ngos']:
-        ngos = NGO.objects.filter(status='approved')
+        ngos = NGO.objects.filter(status='approved').select_related('category')
         if city:
-            print("search city", city)
-            ngos = ngos.filter(city__icontains=city)
-        ngos = ngos.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(short_description__icontains=query)
-        )[:10]
+            ngos = ngos.filter(city=city)
+        # Полнотекстовый поиск, результаты по убыванию релевантности
+        ngos = search_queryset(ngos, 'ngo', query)[:10]
         results['ngos'] = NGOSerializer(ngos, many=True, context={'request': request}).data
     
     if search_type in ['all', 'events']:
-        events = Event.objects.filter(event_date__gte=timezone.now())
+        events = Event.objects.filter(event_date__gte=timezone.now()).select_related('ngo__category')
         if city:
             events = events.filter(ngo__city=city)
-        events = events.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query)
-        )[:10]
+        events = search_queryset(events, 'event', query)[:10]
         results['events'] = EventSerializer(events, many=True, context={'request': request}).data
     
     return Response({'results': results})
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_suggest(request):
+    """Подсказки при вводе: названия НКО, событий, материалов и теги по префиксу"""
+    query = request.query_params.get('q', '')
+    types = [t for t in request.query_params.get('types', '').split(',') if t in SUGGEST_DOCUMENTS]
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    return Response({'results': suggest_index.suggest(query, limit=limit, doc_types=types or None)})
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def statistics(request):
-    """Статистика платформы"""
-    stats = {
-        'total_ngos': NGO.objects.filter(status='approved').count(),
-        'total_events': Event.objects.filter(event_date__gte=timezone.now()).count(),
-        'total_users': User.objects.count(),
-        'total_registrations': EventRegistration.objects.count(),
-        'categories': Category.objects.annotate(
-            ngo_count=Count('ngos', filter=Q(ngos__status='approved'))
-        ).values('name', 'ngo_count'),
-    }
-    return Response(stats)
+    """Статистика платформы (материализованный снимок, см. statistics.py)"""
+    return Response(statistics_data())
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_anonymous_response([NGO, Category])
 def map_ngos(request):
     """НКО для карты"""
-    city = request.query_params.get('city', '').strip().split(",")[0].strip()
+    city = canonical_city(request.query_params.get('city', ''))
     bounds = request.query_params.get('bounds', '')
     
     ngos = NGO.objects.filter(status='approved')
     
     if city:
-        print("map_ngos city", city)
-        ngos = ngos.filter(city__icontains=city)
+        ngos = ngos.filter(city=city)
     
     if bounds:
         # Парсинг bounds (формат: "lat1,lng1,lat2,lng2")
@@ -347,15 +435,53 @@ def map_ngos(request):
     # Только НКО с координатами
     ngos = ngos.exclude(latitude__isnull=True).exclude(longitude__isnull=True)
     
+    return Response({'data': map_points(ngos)})
+
+
+def map_points(ngos):
+    """Точки НКО для карты одним запросом (название категории - через JOIN)"""
+    return [{
+        'id': row['id'],
+        'name': row['name'],
+        'latitude': float(row['latitude']),
+        'longitude': float(row['longitude']),
+        'category': row['category__name'],
+    } for row in ngos.values('id', 'name', 'latitude', 'longitude', 'category__name')]
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@cache_anonymous_response([NGO, Category])
+def map_tile(request, z, x, y):
+    """
+    Тайл карты (z/x/y в схеме Web Mercator)
+
+    На мелких масштабах - кластеры (количество и центр НКО в подтайле),
+    на крупных - точки. Выборка - диапазон по индексу (status, quadkey).
+    """
+    if not is_valid_tile(z, x, y):
+        return Response({'error': 'Неверный номер тайла'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    start, end = quadkey_range(tile_quadkey(z, x, y))
+    ngos = NGO.objects.filter(status='approved', quadkey__gte=start, quadkey__lt=end)
+    count = ngos.count()
+    
+    if z >= MAP_POINTS_ZOOM or count <= MAP_TILE_MAX_POINTS:
+        return Response({'type': 'points', 'count': count, 'data': map_points(ngos)})
+    
+    cell_length = min(z + CLUSTER_DEPTH, QUADKEY_ZOOM)
+    clusters = ngos.annotate(cell=Substr('quadkey', 1, cell_length)).values('cell').annotate(
+        cluster_count=Count('id'),
+        latitude=Avg('latitude'),
+        longitude=Avg('longitude'),
+    ).order_by('cell')
     data = [{
-        'id': ngo.id,
-        'name': ngo.name,
-        'latitude': float(ngo.latitude),
-        'longitude': float(ngo.longitude),
-        'category': ngo.category.name,
-    } for ngo in ngos]
-    
-    return Response({'data': data})
+        'quadkey': cluster['cell'],
+        'count': cluster['cluster_count'],
+        'latitude': cluster['latitude'],
+        'longitude': cluster['longitude'],
+    } for cluster in clusters]
+    return Response({'type': 'clusters', 'count': count, 'data': data})
 
 
 @api_view(['POST'])
@@ -418,21 +544,27 @@ class ModerationViewSet(viewsets.ReadOnlyModelViewSet):
         return Response({'message': 'Заявка отклонена'})
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(AnonymousResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     """API для тегов"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
+    cache_models = [Tag]
 
 
-class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
+class MaterialViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """API для материалов"""
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # views_count обновляется без updated_at, теги - через M2M
+    etag_aggregates = {'etag_views': Sum('views_count'), 'etag_tags': Count('tags')}
+    etag_models = [Tag]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RelevanceOrderingFilter]
     filterset_fields = ['tags', 'course', 'author']
     search_fields = ['title', 'description', 'course', 'author']
+    search_doc_type = 'material'
+    cursor_ordering = ['-created_at', '-id']
     ordering_fields = ['created_at', 'views_count']
     ordering = ['-created_at']
     
@@ -447,6 +579,10 @@ class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
         context['request'] = self.request
         return context
     
+    def get_user_etag_querysets(self):
+        # is_saved в ответе зависит от библиотеки пользователя
+        return [UserLibrary.objects.filter(user=self.request.user)]
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def save(self, request, pk=None):
         """Добавление материала в библиотеку"""
@@ -475,11 +611,10 @@ class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=True, methods=['post'], permission_classes=[AllowAny])
     def view(self, request, pk=None):
-        """Увеличение счетчика просмотров"""
+        """Увеличение счетчика просмотров (запись в БД отложенная, см. view_counters.py)"""
         material = self.get_object()
-        material.views_count += 1
-        material.save(update_fields=['views_count'])
-        return Response({'views_count': material.views_count})
+        pending = view_counter.increment(Material, material.pk)
+        return Response({'views_count': material.views_count + pending})
 
 
 class UserLibraryViewSet(viewsets.ModelViewSet):
@@ -488,21 +623,24 @@ class UserLibraryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        print("UserLibraryView", UserLibrary.objects.filter(user=self.request.user).all())
         return UserLibrary.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class NewsViewSet(viewsets.ModelViewSet):
+class NewsViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """API для новостей"""
     queryset = News.objects.all()
     serializer_class = NewsSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    cache_models = [News]
+    etag_aggregates = {'etag_views': Sum('views_count')}
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RelevanceOrderingFilter]
     filterset_fields = ['status', 'category']  # city обрабатывается вручную в get_queryset
     search_fields = ['title', 'content', 'snippet']
+    search_doc_type = 'news'
+    cursor_ordering = ['-created_at', '-id']
     ordering_fields = ['created_at', 'published_at', 'views_count']
     ordering = ['-created_at']
     
@@ -522,13 +660,20 @@ class NewsViewSet(viewsets.ModelViewSet):
         city = self.request.query_params.get('city')
         if city and city.strip():
             queryset = queryset.filter(
-                models.Q(city=city.strip()) | 
+                models.Q(city=canonical_city(city)) | 
                 models.Q(city='') | 
                 models.Q(city__isnull=True)
             )
         
         return queryset
     
+    @action(detail=True, methods=['post'], permission_classes=[AllowAny])
+    def view(self, request, pk=None):
+        """Увеличение счетчика просмотров (запись в БД отложенная, см. view_counters.py)"""
+        news = self.get_object()
+        pending = view_counter.increment(News, news.pk)
+        return Response({'views_count': news.views_count + pending})
+    
     def perform_create(self, serializer):
         """Создание новости (автоматически ставит статус pending)"""
         serializer.save(author=self.request.user, status='pending')
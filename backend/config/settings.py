@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -148,7 +149,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.HybridPagination',
     'PAGE_SIZE': 9,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -194,3 +195,107 @@ CORS_ALLOW_HEADERS = [
 HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', '')
 HUGGINGFACE_API_URL = 'https://api-inference.huggingface.co/pipeline/feature-extraction/sentence-transformers/all-MiniLM-L6-v2'
 
+# Индекс сходства НКО (команда build_ngo_index): каталог с матрицей векторов и
+# опционально локальная модель sentence-transformers (иначе TF-IDF/SVD)
+NGO_INDEX_DIR = os.environ.get('NGO_INDEX_DIR', str(BASE_DIR / 'ngo_index'))
+NGO_EMBEDDING_MODEL = os.environ.get('NGO_EMBEDDING_MODEL', '')
+
+# Полнотекстовый поиск: путь к классу бэкенда (по умолчанию выбирается по типу БД,
+# см. api/search.py)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', '')
+
+# Кеш Django; для нескольких процессов/серверов LocMemCache нужно заменить общим
+# бэкендом (например, django.core.cache.backends.redis.RedisCache), иначе
+# версии моделей из сигналов не увидят другие процессы
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION', 'rosatom-nko')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    # Только версии моделей для кеша ответов: ключей мало, ответы их не вытесняют
+    'response_versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': 'versions',
+    },
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    # LocMemCache при переполнении (MAX_ENTRIES) удаляет ключи независимо от timeout,
+    # поэтому версиям - отдельное хранилище, в которое не пишутся ответы
+    CACHES['response_versions'].update(
+        LOCATION=f'{CACHE_LOCATION}-versions',
+        OPTIONS={'MAX_ENTRIES': 100000},
+    )
+
+# Кеш ответов для анонимных GET-запросов (api/response_cache.py): алиасы из CACHES для ответов
+# и версий, время жизни ответа в секундах и число воркеров (WEB_CONCURRENCY, как у gunicorn):
+# при нескольких воркерах и LocMemCache кеш ответов и кеш рекомендаций отключаются
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE_ENABLED', 'True') == 'True',
+    'ALIAS': 'default',
+    'VERSION_ALIAS': 'response_versions',
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300)),
+    'WORKERS': int(os.environ.get('WEB_CONCURRENCY', 1)),
+}
+
+# Подсказки при вводе (api/suggest.py): интервал сверки версии индекса в кеше и максимальный
+# возраст индекса в памяти процесса, в секундах (0 - без ограничения)
+SUGGEST_INDEX = {
+    'CHECK_INTERVAL': 5,
+    'MAX_AGE': int(os.environ.get('SUGGEST_INDEX_MAX_AGE', 3600)),
+}
+
+# Отложенная запись счетчиков просмотров (api/view_counters.py): интервал сброса в секундах и
+# число незаписанных просмотров, при котором сброс выполняется сразу (0 - запись при каждом просмотре)
+VIEW_COUNTERS = {
+    'FLUSH_INTERVAL': int(os.environ.get('VIEW_COUNTERS_FLUSH_INTERVAL', 10)),
+    'MAX_PENDING': 1000,
+}
+
+# Запись истории активности (api/activity.py): фоновая запись пачками раз в FLUSH_INTERVAL секунд
+# или при MAX_BATCH событиях в очереди; ASYNC=False - синхронная запись в запросе (тесты);
+# при недоступности БД - повторы с удваивающейся паузой не дольше MAX_RETRY_DELAY секунд
+ACTIVITY_WRITER = {
+    'ASYNC': os.environ.get('ACTIVITY_WRITER_ASYNC', 'True') == 'True',
+    'FLUSH_INTERVAL': float(os.environ.get('ACTIVITY_WRITER_FLUSH_INTERVAL', 2)),
+    'MAX_BATCH': 500,
+    'MAX_RETRY_DELAY': 60,
+}
+
+# Хранение истории активности (команда archive_activity): сколько дней события остаются в
+# основной таблице и сколько месяцев хранится архив (0 - без ограничения)
+ACTIVITY_RETENTION = {
+    'DAYS': int(os.environ.get('ACTIVITY_RETENTION_DAYS', 90)),
+    'ARCHIVE_MONTHS': int(os.environ.get('ACTIVITY_ARCHIVE_MONTHS', 24)),
+}
+
+# Метрики запросов к API (api/metrics.py, /api/_metrics): окно скользящих гистограмм (последние
+# запросы каждого представления) и пороги медленного запроса, который пишется в лог вместе с SQL
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'True') == 'True',
+    'PATH_PREFIX': '/api/',
+    'WINDOW': 1000,
+    'SLOW_REQUEST_MS': int(os.environ.get('SLOW_REQUEST_MS', 500)),
+    'SLOW_QUERY_COUNT': int(os.environ.get('SLOW_QUERY_COUNT', 50)),
+    'SLOW_SQL_LIMIT': 20,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': os.environ.get('API_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Кеш рекомендаций (в памяти процесса): время жизни записи в секундах и максимум записей
+RECOMMENDATIONS_CACHE = {
+    'TTL': int(os.environ.get('RECOMMENDATIONS_CACHE_TTL', 300)),
+    'MAX_ENTRIES': 10000,
+}